@@ -0,0 +1,143 @@
+"""
+DELL EMC ECS Email Alerting Benchmark Utilities.
+"""
+import importlib.util
+import json
+import os
+import sys
+import time
+
+# Constants
+MODULE_NAME = "ecs_benchmark_utility"                                            # Module Name
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))                # Directory of the benchmarks
+REPOSITORY_DIRECTORY = os.path.dirname(BENCHMARK_DIRECTORY)                     # Directory of ecs-email-alert.py
+APPLICATION_FILE = os.path.join(REPOSITORY_DIRECTORY, 'ecs-email-alert.py')     # Application script
+SAMPLE_CONFIG_FILE = os.path.join(REPOSITORY_DIRECTORY, 'configuration', 'ecs_email_alert_configuration.sample')
+DATABASE_NAME = 'ecsalerts'                                                      # Benchmark database name
+
+# The application modules are imported relative to the repository
+if REPOSITORY_DIRECTORY not in sys.path:
+    sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+
+def load_application():
+    """
+    Imports ecs-email-alert.py as a module without running its main block
+    """
+    spec = importlib.util.spec_from_file_location('ecs_email_alert', APPLICATION_FILE)
+    application = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(application)
+    return application
+
+
+def write_configuration(directory, servers, base=None, sections=None):
+    """
+    Writes an application configuration for the given mock ECS servers based on the sample configuration.
+    base overrides BASE settings and sections replaces or updates whole sections.  Returns the paths of the
+    configuration and VDC lookup files.
+    """
+    with open(SAMPLE_CONFIG_FILE, 'r') as f:
+        config = json.load(f)
+
+    config['BASE'].update({'logging_level': 'warning', 'token_cache_file': os.path.join(directory, 'tokens.json')})
+    config['BASE'].update(base or {})
+    config['SQLLITE_DATABASE_CONNECTION']['databasename'] = os.path.join(directory, DATABASE_NAME)
+    config['ECS_CONNECTION'] = [{'protocol': 'http', 'host': server.host, 'port': str(server.port),
+                                 'user': server.username, 'password': server.password,
+                                 'connection_pool_size': '4', 'timeout_seconds': '30'} for server in servers]
+    for section, values in (sections or {}).items():
+        if isinstance(values, dict) and isinstance(config.get(section), dict):
+            config[section].update(values)
+        else:
+            config[section] = values
+
+    config_file = os.path.join(directory, 'ecs_email_alert_configuration.json')
+    with open(config_file, 'w') as f:
+        json.dump(config, f, indent=2)
+
+    vdc_file = os.path.join(directory, 'ecs_vdc_lookup.json')
+    with open(vdc_file, 'w') as f:
+        json.dump(dict((server.host, 'bench-vdc' + str(i + 1)) for i, server in enumerate(servers)), f, indent=2)
+
+    return config_file, vdc_file
+
+
+def start_application(application, directory, config_file, vdc_file):
+    """
+    Runs the start up sequence of the application main block up to the point it connects to ECS
+    """
+    # The application writes its log file to the working directory so work in the benchmark directory
+    application.benchmark_previous_directory = os.getcwd()
+    os.chdir(directory)
+
+    application.ecs_config(config_file, vdc_file, directory)
+    if not application.sqllite_init():
+        raise RuntimeError('Unable to initialize the benchmark database in ' + directory)
+
+    application.ecs_start()
+
+
+def stop_application(application):
+    os.chdir(application.benchmark_previous_directory)
+    for auth in application._ecsAuthentication:
+        auth.close()
+    application._sqlLiteStore.close()
+
+
+def database_size(directory):
+    """
+    Returns the size in bytes of the benchmark database including its write-ahead log
+    """
+    size = 0
+    for suffix in ('.db', '.db-wal'):
+        path = os.path.join(directory, DATABASE_NAME + suffix)
+        if os.path.exists(path):
+            size += os.path.getsize(path)
+    return size
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of the values
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class ECSBenchmarkTimer(object):
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def report(title, results, output=None, baseline=None):
+    """
+    Prints the results of each scenario, compares them with a baseline results file if one is given and
+    saves them for use as a future baseline
+    """
+    previous = {}
+    if baseline:
+        with open(baseline, 'r') as f:
+            previous = json.load(f).get('results', {})
+
+    print(title)
+    for scenario, metrics in results.items():
+        print('  ' + scenario)
+        for name, value in metrics.items():
+            line = '    {0:<32} {1:>14.3f}'.format(name, value)
+            before = previous.get(scenario, {}).get(name)
+            if before:
+                line += '   ({0:+.1f}% vs baseline)'.format((value - before) * 100.0 / before)
+            print(line)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'benchmark': title, 'python': sys.version.split()[0], 'recorded': time.time(),
+                       'results': results}, f, indent=2)
+        print('Results written to ' + output)
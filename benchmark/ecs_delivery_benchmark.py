@@ -0,0 +1,228 @@
+"""
+DELL EMC ECS Email Alerting Notification Throughput Benchmark.
+
+Preloads the ecsalerts table with unsent alerts and runs the delivery loop of ecs-email-alert against local
+SMTP, Slack webhook and SendGrid stand-ins reporting the time taken to drain the queue, per notification
+latency, and how injected failures were handled.
+"""
+import argparse
+import datetime
+import functools
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import ecs_benchmark_utility as utility
+from ecs_delivery_sinks import ECSSMTPSink
+from ecs_delivery_sinks import ECSSendGridSink
+from ecs_delivery_sinks import ECSWebhookSink
+
+# Constants
+MODULE_NAME = "ecs_delivery_benchmark"                       # Module Name
+SLACK_WEBHOOK_VARIABLE = 'ECS_BENCHMARK_SLACK_WEBHOOK_URL'   # Environment variable handed the webhook URL
+SEVERITIES = ['INFO', 'WARNING', 'ERROR', 'CRITICAL']        # ECS alert severities
+CHANNELS = ['smtp', 'slack', 'sendgrid']                     # Delivery channels
+
+
+def start_sink(channel, args):
+    if channel == 'smtp':
+        return ECSSMTPSink(latency=args.latency, failure_rate=args.failure_rate).start()
+    if channel == 'slack':
+        return ECSWebhookSink(latency=args.latency, throttle_rate=args.failure_rate,
+                              retry_after=args.retry_after).start()
+    return ECSSendGridSink(latency=args.latency, throttle_rate=args.failure_rate,
+                           retry_after=args.retry_after).start()
+
+
+def sink_sections(channel, sink, args):
+    """
+    Returns the configuration sections pointing the channel at its sink
+    """
+    sections = {
+        'SMTP': {'host': '127.0.0.1', 'port': '0', 'authenticationrequired': '0', 'starttls': '0',
+                 'fromemail': 'ecs@example.com', 'toemail': 'ops@example.com',
+                 'polling_interval_seconds': str(args.interval), 'max_concurrency': str(args.concurrency)},
+        'SEND_GRID': {'api_key': 'benchmark', 'api_host': 'http://127.0.0.1:0', 'fromemail': 'ecs@example.com',
+                      'toemail': 'ops@example.com', 'polling_interval_seconds': str(args.interval),
+                      'max_concurrency': str(args.concurrency)},
+        'SLACK': {'slack_environment_variable_for_webhook_url': SLACK_WEBHOOK_VARIABLE,
+                  'polling_interval_seconds': str(args.interval), 'max_concurrency': str(args.concurrency),
+                  'rate_limit_per_second': str(args.slack_rate), 'rate_limit_burst': str(args.slack_rate)}
+    }
+
+    if channel == 'smtp':
+        sections['SMTP']['port'] = str(sink.port)
+    elif channel == 'sendgrid':
+        sections['SEND_GRID']['api_host'] = sink.url
+    else:
+        os.environ[SLACK_WEBHOOK_VARIABLE] = sink.url + '/services/benchmark'
+
+    return sections
+
+
+def preload_alerts(application, count, correlated):
+    """
+    Queues count unsent alerts spread over a few VDCs and severities each with correlated alerts waiting on it
+    """
+    now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
+    alerts = []
+    for i in range(count):
+        alert = ('bench-vdc' + str(i % 4 + 1), '127.0.0.' + str(i % 4 + 1), uuid.uuid4().hex, 'false',
+                 'Benchmark alert ' + str(i), 'ns' + str(i % 20), SEVERITIES[i % len(SEVERITIES)], str(1000 + i % 50),
+                 str(int(time.time() * 1000)), '0', '0', now, '', '', None)
+        alerts.append(alert)
+        alerts.extend(alert[:2] + (uuid.uuid4().hex,) + alert[3:9] + (str(application.EMAIL_ALERTED_CORRELATED),) +
+                      alert[10:14] + (alert[2],) for j in range(correlated))
+
+    db_utility = application.SQLLiteUtility(application._configuration, application._logger)
+    application._sqlLiteStore.write(functools.partial(db_utility.insert_alerts, alerts=alerts))
+
+
+def unsent_alerts(application):
+    with application._sqlLiteStore.reader() as sql_database:
+        return sql_database.execute("SELECT COUNT(*) FROM ecsalerts WHERE emailAlerted IN (0, " +
+                                    str(application.EMAIL_ALERTED_CORRELATED) + ")").fetchone()[0]
+
+
+def waiting_alerts(application):
+    with application._sqlLiteStore.reader() as sql_database:
+        return sql_database.execute("SELECT COUNT(*) FROM ecsalerts WHERE emailAlerted = " +
+                                    str(application.EMAIL_ALERTED_CORRELATED)).fetchone()[0]
+
+
+def failed_alerts(application):
+    with application._sqlLiteStore.reader() as sql_database:
+        return sql_database.execute("SELECT COUNT(*) FROM ecsalerts WHERE emailAlerted = " +
+                                    str(application.EMAIL_ALERTED_FAILED)).fetchone()[0]
+
+
+def run_channel(channel, args):
+    directory = tempfile.mkdtemp(prefix='ecs-delivery-benchmark-')
+    sink = start_sink(channel, args)
+    application = utility.load_application()
+
+    try:
+        config_file, vdc_file = utility.write_configuration(directory, [], base={
+            'alert_delivery': channel,
+            'delivery_mode': args.mode,
+            'delivery_workers': str(args.workers),
+            'delivery_max_attempts': str(args.max_attempts),
+            'delivery_retry_backoff_seconds': str(args.retry_backoff),
+            'acknowledge_alerts_after_notification': 'no'
+        }, sections=dict(sink_sections(channel, sink, args),
+                         ECS_ALERT_CORRELATION={'enabled': 'yes' if args.correlated else 'no'}))
+        utility.start_application(application, directory, config_file, vdc_file)
+        configuration = application._configuration
+
+        smtp_utility = application.ECSSMTPUtility(configuration, application._logger)
+        send_grid_utility = application.ECSSendGridUtility(configuration, application._logger)
+        slack_utility = application.ECSSlackUtility(configuration, application._logger) \
+            if channel == 'slack' else None
+        if channel == 'sendgrid':
+            send_grid_utility.check_send_grid_access()
+
+        preload_alerts(application, args.alerts, args.correlated)
+
+        # Time every notification handed to the delivery channel
+        latencies = []
+        failed_notifications = []
+        send_notification = application.ecs_send_notification
+
+        def timed_send_notification(config, rows, *send_args, **send_kwargs):
+            start = time.perf_counter()
+            sent_rows = send_notification(config, rows, *send_args, **send_kwargs)
+            latencies.append(time.perf_counter() - start)
+            if len(sent_rows) < len(rows):
+                failed_notifications.append(len(rows) - len(sent_rows))
+            return sent_rows
+
+        application.ecs_send_notification = timed_send_notification
+
+        delivery = threading.Thread(target=application.ecs_send_email_alerts, daemon=True,
+                                    args=(application._logger, configuration, smtp_utility, send_grid_utility,
+                                          slack_utility))
+
+        start = time.perf_counter()
+        delivery.start()
+        total = args.alerts * (1 + args.correlated)
+        remaining = total
+        while remaining and time.perf_counter() - start < args.timeout:
+            time.sleep(0.05)
+            remaining = unsent_alerts(application)
+        drain_time = time.perf_counter() - start
+
+        application.controlledShutdown.stop_event.set()
+        application._newAlertsEvent.set()
+        delivery.join(args.timeout)
+        failed = failed_alerts(application)
+        waiting = waiting_alerts(application)
+        utility.stop_application(application)
+
+        # A digest carries many alerts in one message and correlated alerts are notified with the alert they are
+        # correlated to so deliveries can only be matched one to one per alert without either
+        delivered = total - remaining - failed
+        received = sink.stats.get('messages') if channel == 'smtp' else sink.stats.get('alerts')
+        duplicates = max(0, received - delivered) if args.mode == 'alert' and not args.correlated else 0
+        return {
+            'alerts_delivered': delivered,
+            'drain_seconds': drain_time,
+            'alerts_per_second': delivered / drain_time if drain_time else 0.0,
+            'notifications': len(latencies),
+            'latency_ms_p50': utility.percentile(latencies, 50) * 1000,
+            'latency_ms_p99': utility.percentile(latencies, 99) * 1000,
+            'failures_injected': sink.stats.get('failures_injected'),
+            'failed_notifications': len(failed_notifications),
+            'alerts_left_unsent': remaining,
+            'alerts_given_up': failed,
+            'correlated_left_waiting': waiting,
+            'messages_received_by_sink': sink.stats.get('messages'),
+            'duplicate_deliveries': duplicates
+        }
+
+    finally:
+        sink.stop()
+        if args.keep:
+            print('Benchmark directory kept at ' + directory)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures notification throughput against local delivery sinks.')
+    parser.add_argument('--channels', default=','.join(CHANNELS), help='Comma separated channels to benchmark.')
+    parser.add_argument('--alerts', type=int, default=2000, help='Unsent alerts preloaded for each channel.')
+    parser.add_argument('--mode', choices=['alert', 'digest'], default='alert', help='Delivery mode.')
+    parser.add_argument('--workers', type=int, default=4, help='Delivery workers.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Maximum concurrency of each channel.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each sink takes per request.')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Fraction of requests refused with a 451 (SMTP) or throttled with a 429 (HTTP).')
+    parser.add_argument('--retry-after', type=int, default=1, help='Seconds throttled clients are asked to wait.')
+    parser.add_argument('--max-attempts', type=int, default=10, help='Delivery attempts before an alert is given up.')
+    parser.add_argument('--retry-backoff', type=int, default=0, help='Seconds an alert waits after a failed delivery.')
+    parser.add_argument('--correlated', type=int, default=0,
+                        help='Correlated alerts waiting on each preloaded alert, enables alert correlation.')
+    parser.add_argument('--slack-rate', type=float, default=50, help='Slack messages per second allowed.')
+    parser.add_argument('--interval', type=float, default=1, help='Delivery polling interval in seconds.')
+    parser.add_argument('--timeout', type=float, default=300, help='Longest a channel is given to drain.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results with this JSON results file.')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark directories.')
+    args = parser.parse_args()
+
+    results = {}
+    for channel in args.channels.split(','):
+        if channel not in CHANNELS:
+            parser.error('Unknown channel ' + channel)
+        results[channel] = run_channel(channel, args)
+
+    utility.report('ECS notification delivery benchmark: ' + str(args.alerts) + ' alerts in ' + args.mode +
+                   ' mode, latency ' + str(args.latency) + 's, failure rate ' + str(args.failure_rate),
+                   results, args.output, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+DELL EMC ECS Email Alerting Delivery Stand-ins Used By The Benchmarks.
+"""
+import json
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+# Constants
+MODULE_NAME = "ecs_delivery_sinks"           # Module Name
+
+
+class ECSSinkStats(object):
+    """
+    Thread safe counters kept by every sink
+    """
+    def __init__(self):
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def get(self, name):
+        with self.lock:
+            return self.counters.get(name, 0)
+
+
+class ECSSMTPSink(object):
+    """
+    Minimal SMTP server that accepts and counts messages.  A fraction of messages can be refused with a
+    transient 451 after DATA and every message can be delayed.
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.stats = ECSSinkStats()
+
+        sink = self
+
+        class ECSSMTPSinkHandler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write((line + '\r\n').encode('ascii'))
+
+            def handle(self):
+                sink.stats.add('connections')
+                self.reply('220 ecs-smtp-sink ESMTP ready')
+
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+
+                    command = line.decode('ascii', 'replace').strip()
+                    verb = command[:4].upper()
+
+                    if verb == 'EHLO':
+                        self.reply('250-ecs-smtp-sink')
+                        self.reply('250 8BITMIME')
+                    elif verb == 'HELO':
+                        self.reply('250 ecs-smtp-sink')
+                    elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                        self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                            pass
+
+                        if sink.latency:
+                            time.sleep(sink.latency)
+
+                        if random.random() < sink.failure_rate:
+                            sink.stats.add('failures_injected')
+                            self.reply('451 Requested action aborted: local error in processing')
+                        else:
+                            sink.stats.add('messages')
+                            self.reply('250 OK: queued')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('502 Command not implemented')
+
+        self.server = socketserver.ThreadingTCPServer((host, port), ECSSMTPSinkHandler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address[:2]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='ecs-smtp-sink', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ECSHTTPSink(object):
+    """
+    HTTP endpoint that accepts POSTs.  A fraction of requests can be throttled with a 429 and every request can
+    be delayed.  Subclasses decide what an accepted request counts as.
+    """
+    accepted_status = 200
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, throttle_rate=0.0, retry_after=1):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.stats = ECSSinkStats()
+
+        sink = self
+
+        class ECSHTTPSinkHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                sink.stats.add('requests')
+
+                if sink.latency:
+                    time.sleep(sink.latency)
+
+                if random.random() < sink.throttle_rate:
+                    sink.stats.add('failures_injected')
+                    self.respond(429, sink.throttle_headers())
+                    return
+
+                try:
+                    sink.accept(self.path, json.loads(body.decode('utf-8')))
+                except ValueError:
+                    self.respond(400)
+                    return
+
+                self.respond(sink.accepted_status)
+
+            def respond(self, status, headers=None):
+                data = b'ok' if status == 200 else b''
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), ECSHTTPSinkHandler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address[:2]
+        self.url = 'http://' + self.host + ':' + str(self.port)
+
+    def throttle_headers(self):
+        return {'Retry-After': str(self.retry_after)}
+
+    def accept(self, path, payload):
+        self.stats.add('messages')
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='ecs-http-sink', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ECSWebhookSink(ECSHTTPSink):
+    """
+    Slack incoming webhook stand-in counting the alerts posted as message attachments
+    """
+    def accept(self, path, payload):
+        self.stats.add('messages')
+        self.stats.add('alerts', len(payload.get('attachments', [])))
+
+
+class ECSSendGridSink(ECSHTTPSink):
+    """
+    SendGrid v3 mail send stand-in counting the alerts sent as personalizations
+    """
+    accepted_status = 202
+
+    def throttle_headers(self):
+        return {'X-RateLimit-Reset': str(int(time.time() + self.retry_after))}
+
+    def accept(self, path, payload):
+        if not path.startswith('/v3/mail/send'):
+            raise ValueError('Unexpected SendGrid path ' + path)
+        self.stats.add('messages')
+        self.stats.add('alerts', len(payload.get('personalizations', [])))
@@ -0,0 +1,80 @@
+"""
+DELL EMC ECS Email Alerting Alert Filter Microbenchmark.
+
+Compares the cost per alert of the compiled alert filter with the list scanning filter it replaced.
+"""
+import argparse
+import random
+
+import ecs_benchmark_utility as utility
+from ecsfilter.ecsfilter import ECSAlertFilter
+
+# Constants
+MODULE_NAME = "ecs_filter_benchmark"                         # Module Name
+SEVERITIES = ['INFO', 'WARNING', 'ERROR', 'CRITICAL']        # ECS alert severities
+
+
+def list_filter(severity_filter, symptoms_filter):
+    """
+    The severity and symptom code filter as it was applied before the compiled filter
+    """
+    def matches(alert, vdc):
+        process_row = len(severity_filter) == 0 or alert.get('severity') in severity_filter
+        if process_row:
+            process_row = len(symptoms_filter) == 0 or alert.get('symptomCode') in symptoms_filter
+        return process_row
+    return matches
+
+
+def measure(matches, alerts, vdcs, repeat):
+    """
+    Returns the best nanoseconds per alert over repeat runs and the number of alerts kept
+    """
+    best = None
+    kept = 0
+    for i in range(repeat):
+        with utility.ECSBenchmarkTimer() as timer:
+            kept = sum(1 for alert, vdc in zip(alerts, vdcs) if matches(alert, vdc))
+        best = timer.elapsed if best is None else min(best, timer.elapsed)
+    return best * 1e9 / len(alerts), kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the cost per alert of the alert filters.')
+    parser.add_argument('--alerts', type=int, default=200000, help='Synthetic alerts filtered per run.')
+    parser.add_argument('--symptom-codes', type=int, default=200, help='Symptom codes in the symptom filter.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of each filter, the best is reported.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results with this JSON results file.')
+    args = parser.parse_args()
+
+    random.seed(1)
+    symptom_codes = [str(1000 + i) for i in range(args.symptom_codes * 2)]
+    alerts = [{'severity': random.choice(SEVERITIES), 'symptomCode': random.choice(symptom_codes),
+               'namespace': 'ns' + str(random.randint(1, 20)),
+               'description': 'Disk ' + str(random.randint(1, 500)) + ' on node ' + str(random.randint(1, 8)) +
+                              random.choice([' is offline', ' reported errors', ' recovered'])}
+              for i in range(args.alerts)]
+    vdcs = ['vdc' + str(random.randint(1, 4)) for i in range(args.alerts)]
+
+    severity_filter = ['WARNING', 'ERROR', 'CRITICAL']
+    symptoms_filter = symptom_codes[:args.symptom_codes]
+    rules = [{'severity': ['CRITICAL']},
+             {'severity': ['WARNING'], 'namespace': ['ns1', 'ns2', 'ns3']},
+             {'vdc': ['vdc1'], 'description': 'offline|errors'}]
+
+    results = {}
+    for scenario, matches in [
+            ('list_severity_and_symptoms', list_filter(severity_filter, symptoms_filter)),
+            ('compiled_severity_and_symptoms', ECSAlertFilter(severity_filter, symptoms_filter).matches),
+            ('compiled_with_rules', ECSAlertFilter(severity_filter, symptoms_filter, rules).matches),
+            ('compiled_no_filters', ECSAlertFilter().matches)]:
+        nanoseconds, kept = measure(matches, alerts, vdcs, args.repeat)
+        results[scenario] = {'ns_per_alert': nanoseconds, 'alerts_kept': kept}
+
+    utility.report('ECS alert filter microbenchmark: ' + str(args.alerts) + ' alerts, ' +
+                   str(args.symptom_codes) + ' symptom codes', results, args.output, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+DELL EMC ECS Email Alerting Collection Throughput Benchmark.
+
+Starts one mock ECS per VDC, loads the alerts into them and runs the collection cycle of ecs-email-alert
+against them reporting alerts ingested per second, database growth and wall time per poll cycle.
+"""
+import argparse
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import ecs_benchmark_utility as utility
+from ecs_mock_server import ECSMockServer
+
+# Constants
+MODULE_NAME = "ecs_ingest_benchmark"         # Module Name
+
+
+def run_cycle(application, workers):
+    """
+    Polls every ECS connection once in parallel like a collection cycle of the application.  Returns the
+    number of new alerts stored and the wall time of the cycle.
+    """
+    with utility.ECSBenchmarkTimer() as timer:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(application.ecs_collect_vdc_alert_data, application._logger, api)
+                       for api in application._ecsManagementAPI.values()]
+            stored = sum(future.result() or 0 for future in futures)
+    return stored, timer.elapsed
+
+
+def run_scenario(application, directory, servers, cycles, alerts_per_cycle, workers):
+    """
+    Runs cycles collection cycles adding alerts_per_cycle new alerts to every VDC before each one
+    """
+    size_before = utility.database_size(directory)
+    stored = 0
+    cycle_times = []
+
+    for cycle in range(cycles):
+        for server in servers:
+            if alerts_per_cycle:
+                server.add_alerts(alerts_per_cycle)
+
+        cycle_stored, elapsed = run_cycle(application, workers)
+        stored += cycle_stored
+        cycle_times.append(elapsed)
+
+    total_time = sum(cycle_times)
+    size_after = utility.database_size(directory)
+    return {
+        'alerts_stored': stored,
+        'alerts_per_second': stored / total_time if total_time else 0.0,
+        'cycle_seconds_mean': total_time / len(cycle_times),
+        'cycle_seconds_p50': utility.percentile(cycle_times, 50),
+        'cycle_seconds_max': max(cycle_times),
+        'db_growth_bytes': size_after - size_before,
+        'db_bytes_per_alert': (size_after - size_before) / stored if stored else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures alert collection throughput against mock ECS servers.')
+    parser.add_argument('--alerts', type=int, default=20000, help='Alerts loaded across all VDCs before the '
+                                                                  'cold ingest.')
+    parser.add_argument('--vdcs', type=int, default=4, help='Number of mock ECS servers.')
+    parser.add_argument('--page-size', type=int, default=500, help='Alerts returned per /vdc/alerts page.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each mock ECS call takes.')
+    parser.add_argument('--cycles', type=int, default=5, help='Poll cycles of the steady and storm scenarios.')
+    parser.add_argument('--storm-alerts', type=int, default=1000, help='New alerts per VDC per storm cycle.')
+    parser.add_argument('--workers', type=int, default=4, help='Collection workers.')
+    parser.add_argument('--incremental', choices=['yes', 'no'], default='no', help='Incremental collection.')
+    parser.add_argument('--correlation', choices=['yes', 'no'], default='no', help='Alert correlation.')
+    parser.add_argument('--token-max-requests', type=int, default=0,
+                        help='Expire tokens with a 497 after this many requests.  0 never expires them.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results with this JSON results file.')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark directory.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='ecs-ingest-benchmark-')
+    servers = [ECSMockServer('127.0.0.' + str(i + 1), page_size=args.page_size, latency=args.latency,
+                             token_max_requests=args.token_max_requests).start() for i in range(args.vdcs)]
+
+    try:
+        config_file, vdc_file = utility.write_configuration(directory, servers, base={
+            'collection_workers': str(args.workers),
+            'incremental_collection': args.incremental
+        }, sections={'ECS_ALERT_CORRELATION': {'enabled': args.correlation}})
+
+        application = utility.load_application()
+        utility.start_application(application, directory, config_file, vdc_file)
+        if not application.ecs_authenticate():
+            raise RuntimeError('Unable to authenticate to the mock ECS servers.')
+
+        for server in servers:
+            server.add_alerts(args.alerts // args.vdcs)
+
+        results = {
+            'cold_ingest': run_scenario(application, directory, servers, 1, 0, args.workers),
+            'steady_state': run_scenario(application, directory, servers, args.cycles, 0, args.workers),
+            'alert_storm': run_scenario(application, directory, servers, args.cycles, args.storm_alerts,
+                                        args.workers)
+        }
+        with application._sqlLiteStore.reader() as sql_database:
+            results['notifications'] = {
+                'alerts_to_notify': sql_database.execute(
+                    "SELECT COUNT(*) FROM ecsalerts WHERE emailAlerted = 0").fetchone()[0],
+                'alerts_correlated': sql_database.execute(
+                    "SELECT COUNT(*) FROM ecsalerts WHERE correlatedTo IS NOT NULL").fetchone()[0]
+            }
+        results['mock_ecs'] = {
+            'pages_served': sum(server.stats['pages'] for server in servers),
+            'logins': sum(server.stats['logins'] for server in servers),
+            'tokens_expired': sum(server.stats['expired'] for server in servers)
+        }
+
+        utility.stop_application(application)
+
+        utility.report('ECS alert ingest benchmark: ' + str(args.alerts) + ' alerts across ' + str(args.vdcs) +
+                       ' VDCs, page size ' + str(args.page_size) + ', latency ' + str(args.latency) + 's',
+                       results, args.output, args.baseline)
+
+    finally:
+        for server in servers:
+            server.stop()
+        if args.keep:
+            print('Benchmark directory kept at ' + directory)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
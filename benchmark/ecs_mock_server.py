@@ -0,0 +1,193 @@
+"""
+DELL EMC ECS Management API Stand-in Used By The Benchmarks.
+"""
+import base64
+import calendar
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+from xml.sax.saxutils import escape
+
+# Constants
+MODULE_NAME = "ecs_mock_server"                              # Module Name
+AUTH_TOKEN_HEADER = 'X-SDS-AUTH-TOKEN'                       # ECS authentication token header
+TOKEN_EXPIRED = 497                                          # ECS status code for an expired token
+START_TIME_FORMAT = '%Y-%m-%dT%H:%M'                         # Format of the start_time query parameter
+SEVERITIES = ['INFO', 'WARNING', 'ERROR', 'CRITICAL']        # ECS alert severities
+SYMPTOM_CODES = ['1002', '1004', '1008', '2006', '2014', '3001', '3007', '4002']
+
+
+class ECSMockServer(object):
+    """
+    Serves the subset of the ECS Management API used by ecs-email-alert for one VDC.  Alerts are generated
+    in memory, /vdc/alerts pages through the unacknowledged ones with NextMarker, acknowledgements are
+    applied, and tokens expire after a number of requests or seconds answering with a 497.
+    """
+    def __init__(self, host, port=0, username='root', password='password', page_size=100, latency=0.0,
+                 token_max_requests=0, token_lifetime=0):
+        self.username = username
+        self.password = password
+        self.page_size = page_size
+        self.latency = latency
+        self.token_max_requests = token_max_requests
+        self.token_lifetime = token_lifetime
+        self.alerts = []
+        self.acknowledged = set()
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.stats = {'logins': 0, 'pages': 0, 'acknowledgements': 0, 'expired': 0}
+
+        server = self
+
+        class ECSMockHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.handle(self, 'GET')
+
+            def do_PUT(self):
+                server.handle(self, 'PUT')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), ECSMockHandler)
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[:2]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='ecs-mock-' + self.host, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def add_alerts(self, count, start=None, spacing=1.0):
+        """
+        Generates count unacknowledged alerts with timestamps spaced from start (epoch seconds)
+        """
+        start = time.time() - count * spacing if start is None else start
+        alerts = []
+        for i in range(count):
+            alerts.append({
+                'id': uuid.uuid4().hex,
+                'acknowledged': 'false',
+                'description': 'Benchmark alert ' + str(i) + ' raised on disk ' + str(random.randint(1, 500)),
+                'namespace': 'ns' + str(random.randint(1, 20)),
+                'severity': random.choice(SEVERITIES),
+                'symptomCode': random.choice(SYMPTOM_CODES),
+                'timestamp': str(int((start + i * spacing) * 1000))
+            })
+
+        with self.lock:
+            self.alerts.extend(alerts)
+        return alerts
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.tokens[token] = [time.time(), 0]
+            self.stats['logins'] += 1
+        return token
+
+    def check_token(self, handler):
+        """
+        Returns True if the request carries a live token counting the request against it
+        """
+        # ecs-email-alert quotes the token on most calls
+        token = (handler.headers.get(AUTH_TOKEN_HEADER) or '').strip("'")
+        with self.lock:
+            issued = self.tokens.get(token)
+            if issued is None:
+                return False
+
+            issued[1] += 1
+            expired = (self.token_max_requests and issued[1] > self.token_max_requests) or \
+                      (self.token_lifetime and time.time() - issued[0] > self.token_lifetime)
+            if expired:
+                del self.tokens[token]
+                self.stats['expired'] += 1
+                return False
+        return True
+
+    def handle(self, handler, method):
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlparse(handler.path)
+        path = url.path.rstrip('/').replace('//', '/')
+        params = parse_qs(url.query)
+
+        if method == 'GET' and path == '/login':
+            expected = 'Basic ' + base64.b64encode((self.username + ':' + self.password).encode()).decode()
+            if handler.headers.get('Authorization') != expected:
+                self.respond(handler, 401)
+            else:
+                self.respond(handler, 200, headers={AUTH_TOKEN_HEADER: self.issue_token()})
+            return
+
+        if not self.check_token(handler):
+            self.respond(handler, TOKEN_EXPIRED)
+            return
+
+        if method == 'GET' and path == '/user/whoami':
+            self.respond(handler, 200, '{"common_name": "' + self.username + '"}', 'application/json')
+        elif method == 'GET' and path == '/vdc/alerts':
+            self.respond(handler, 200, self.alerts_page(params), 'application/xml')
+        elif method == 'PUT' and path.startswith('/vdc/alerts/') and path.endswith('/acknowledgment'):
+            with self.lock:
+                self.acknowledged.add(path.split('/')[3])
+                self.stats['acknowledgements'] += 1
+            self.respond(handler, 200, '')
+        else:
+            self.respond(handler, 404)
+
+    def alerts_page(self, params):
+        """
+        Renders the page of unacknowledged alerts starting after the marker
+        """
+        marker = params.get('marker', [None])[0]
+        start_time = params.get('start_time', [None])[0]
+        since = calendar.timegm(time.strptime(start_time, START_TIME_FORMAT)) * 1000 if start_time else None
+
+        with self.lock:
+            # The marker is the position in the alert list the previous page ended at
+            position = int(marker) if marker else 0
+            page = []
+            while position < len(self.alerts) and len(page) < self.page_size:
+                alert = self.alerts[position]
+                position += 1
+                if alert['id'] in self.acknowledged:
+                    continue
+                if since is not None and int(alert['timestamp']) < since:
+                    continue
+                page.append(alert)
+            more = position < len(self.alerts)
+            self.stats['pages'] += 1
+
+        body = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?><alerts>']
+        for alert in page:
+            body.append('<alert>' + ''.join('<' + key + '>' + escape(value) + '</' + key + '>'
+                                            for key, value in alert.items()) + '</alert>')
+        if more:
+            body.append('<NextMarker>' + str(position) + '</NextMarker>')
+        body.append('</alerts>')
+        return ''.join(body)
+
+    def respond(self, handler, status, body='', content_type='text/plain', headers=None):
+        data = body.encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
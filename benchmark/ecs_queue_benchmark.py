@@ -0,0 +1,118 @@
+"""
+DELL EMC ECS Email Alerting Unsent Queue Benchmark.
+
+Grows the ecsalerts table with delivered history around a fixed number of unsent alerts and measures how long
+the delivery loop takes to find its pending work, comparing the unindexed full table query it replaced with the
+keyset paged read of the unsent index.
+"""
+import argparse
+import datetime
+import functools
+import shutil
+import tempfile
+import uuid
+
+import ecs_benchmark_utility as utility
+
+# Constants
+MODULE_NAME = "ecs_queue_benchmark"                          # Module Name
+SEVERITIES = ['INFO', 'WARNING', 'ERROR', 'CRITICAL']        # ECS alert severities
+LOAD_BATCH_SIZE = 10000                                      # Alerts inserted per write batch
+
+
+def load_alerts(application, db_utility, count, email_alerted):
+    """
+    Inserts count alerts flagged with email_alerted in batches
+    """
+    now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
+    for start in range(0, count, LOAD_BATCH_SIZE):
+        alerts = [('bench-vdc' + str(i % 4 + 1), '127.0.0.' + str(i % 4 + 1), uuid.uuid4().hex, 'false',
+                   'Benchmark alert ' + str(i), 'ns' + str(i % 20), SEVERITIES[i % len(SEVERITIES)],
+                   str(1000 + i % 50), '0', email_alerted, '0', now, '', '', None)
+                  for i in range(start, min(count, start + LOAD_BATCH_SIZE))]
+        application._sqlLiteStore.write(functools.partial(db_utility.insert_alerts, alerts=alerts))
+
+
+def unindexed_scan(db_utility, sql_database, page_size):
+    # The query the delivery loop used before the unsent index existed.  The index would otherwise be used.
+    return len(sql_database.execute(""" SELECT * FROM ecsalerts NOT INDEXED WHERE emailAlerted = 0; """).fetchall())
+
+
+def first_page(db_utility, sql_database, page_size):
+    return len(db_utility.select_unsent_alerts(sql_database, None, page_size))
+
+
+def all_pages(db_utility, sql_database, page_size):
+    found = 0
+    after = None
+    while True:
+        rows = db_utility.select_unsent_alerts(sql_database, after, page_size)
+        if not rows:
+            return found
+        after = (rows[-1]['severityRank'], rows[-1]['id'])
+        found += len(rows)
+
+
+def measure(application, db_utility, query, page_size, repeat):
+    """
+    Returns the best milliseconds taken by the query over repeat runs and the number of rows it found
+    """
+    best = None
+    found = 0
+    for i in range(repeat):
+        with application._sqlLiteStore.reader() as sql_database:
+            with utility.ECSBenchmarkTimer() as timer:
+                found = query(db_utility, sql_database, page_size)
+        best = timer.elapsed if best is None else min(best, timer.elapsed)
+    return best * 1000, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the cost of finding unsent alerts as history grows.')
+    parser.add_argument('--sizes', default='1000,100000,1000000', help='Comma separated delivered history sizes.')
+    parser.add_argument('--unsent', type=int, default=500, help='Unsent alerts waiting for delivery.')
+    parser.add_argument('--page-size', type=int, default=100, help='Unsent alerts read per page.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of each query, the best is reported.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results with this JSON results file.')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark directory.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='ecs-queue-benchmark-')
+    application = utility.load_application()
+
+    try:
+        config_file, vdc_file = utility.write_configuration(directory, [])
+        utility.start_application(application, directory, config_file, vdc_file)
+        db_utility = application.SQLLiteUtility(application._configuration, application._logger)
+
+        load_alerts(application, db_utility, args.unsent, '0')
+
+        results = {}
+        history = 0
+        for size in sorted(int(size) for size in args.sizes.split(',')):
+            load_alerts(application, db_utility, size - history, '1')
+            history = size
+
+            result = {}
+            for scenario, query in [('unindexed_scan', unindexed_scan), ('first_page', first_page),
+                                    ('all_pages', all_pages)]:
+                milliseconds, found = measure(application, db_utility, query, args.page_size, args.repeat)
+                result[scenario + '_ms'] = milliseconds
+                result[scenario + '_rows'] = found
+            results['history_' + str(size)] = result
+
+        utility.stop_application(application)
+
+        utility.report('ECS unsent queue benchmark: ' + str(args.unsent) + ' unsent alerts, page size ' +
+                       str(args.page_size), results, args.output, args.baseline)
+
+    finally:
+        if args.keep:
+            print('Benchmark directory kept at ' + directory)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,11 @@ DELL EMC ECS API Data Collection Module.
 import logging
 import os
 import json
+from ecsfilter.ecsfilter import ECSAlertFilter
+from ecsfilter.ecsfilter import ECSFilterException
+from ecscorrelation.ecscorrelation import ECSAlertCorrelator
+from ecscorrelation.ecscorrelation import ECSCorrelationException
+from ecsretention.ecsretention import ARCHIVE_FORMATS
 
 # Constants
 MODULE_NAME = "ecs-email-alert_configuration"                 # Module Name
@@ -11,11 +16,16 @@ BASE_CONFIG = 'BASE'                                          # Base Configurati
 ECS_CONNECTION_CONFIG = 'ECS_CONNECTION'                      # ECS Connection Configuration Section
 DATABASE_CONNECTION_CONFIG = 'SQLLITE_DATABASE_CONNECTION'    # SQLLite Database Connection Configuration Section
 ECS_API_POLLING_INTERVALS = 'ECS_API_POLLING_INTERVALS'       # ECS API Call Interval Configuration Section
+ADAPTIVE_POLLING_CONFIG = 'ADAPTIVE_POLLING'                  # Adaptive Polling Configuration Section
+METRICS_CONFIG = 'METRICS'                                    # Metrics Endpoint Configuration Section
+RETENTION_CONFIG = 'RETENTION'                                # Alert Retention Configuration Section
 SMTP_CONNECTION_CONFIG = 'SMTP'                               # SMTP Configuration Section
 SEND_GRID_CONFIG = 'SEND_GRID'                                # SendGrid Configuration Section
 SLACK_CONFIG = 'SLACK'                                        # Slack Configuration Section
 ECS_ALERT_SYMPTOM_FILTER = 'ECS_ALERT_SYMPTOM_CODES'          # ECS Alert Symptom Codes to Monitor
 ECS_ALERT_SEVERITY_FILTER = 'ECS_ALERT_SEVERITY_FILTER'       # ECS Alert Severity Codes to Monitor
+ECS_ALERT_FILTER_RULES = 'ECS_ALERT_FILTER_RULES'             # ECS Alert Filter Rules
+ECS_ALERT_CORRELATION_CONFIG = 'ECS_ALERT_CORRELATION'        # ECS Alert Correlation Configuration Section
 ECS_VALID_SEVERITIES = ['INFO', 'WARNING', 'ERROR','CRITICAL']  # ECS Valid Severity Codes
 
 
@@ -62,6 +72,40 @@ class ECSSmtpAlertConfiguration(object):
         if str(self.acknowledge_alerts).upper() not in ['YES', 'NO']:
             raise InvalidConfigurationException("acknowledge_alerts_after_notification must be either yes or no.")
 
+        # Retrieve the number of workers per ECS host acknowledging alerts in the background
+        self.acknowledgement_workers_per_host = str(parser[BASE_CONFIG].get('acknowledgement_workers_per_host', '2'))
+        if not self.acknowledgement_workers_per_host.isnumeric() or int(self.acknowledgement_workers_per_host) < 1:
+            raise InvalidConfigurationException("acknowledgement_workers_per_host must be a numeric value "
+                                                "greater than 0.")
+
+        # Retrieve how long in-flight work is given to drain when shutting down
+        self.shutdown_drain_seconds = str(parser[BASE_CONFIG].get('shutdown_drain_seconds', '10'))
+        if not self.shutdown_drain_seconds.isnumeric():
+            raise InvalidConfigurationException("shutdown_drain_seconds must be a numeric value.")
+
+        # Retrieve if notifications are sent per alert or as a digest per VDC and severity
+        self.delivery_mode = parser[BASE_CONFIG].get('delivery_mode', 'alert')
+        if self.delivery_mode not in ['alert', 'digest']:
+            raise InvalidConfigurationException("delivery_mode must be set to either alert or digest.")
+
+        # Retrieve the number of workers used to deliver notifications in parallel
+        self.delivery_workers = str(parser[BASE_CONFIG].get('delivery_workers', '1'))
+        if not self.delivery_workers.isnumeric() or int(self.delivery_workers) < 1:
+            raise InvalidConfigurationException("delivery_workers must be a numeric value greater than 0.")
+
+        # Retrieve how often and how patiently an alert that fails delivery is retried
+        self.delivery_max_attempts = str(parser[BASE_CONFIG].get('delivery_max_attempts', '10'))
+        if not self.delivery_max_attempts.isnumeric() or int(self.delivery_max_attempts) < 1:
+            raise InvalidConfigurationException("delivery_max_attempts must be a numeric value greater than 0.")
+        self.delivery_retry_backoff_seconds = str(parser[BASE_CONFIG].get('delivery_retry_backoff_seconds', '60'))
+        if not self.delivery_retry_backoff_seconds.isnumeric():
+            raise InvalidConfigurationException("delivery_retry_backoff_seconds must be a numeric value.")
+
+        # Retrieve the number of unsent alerts read and delivered at a time
+        self.delivery_page_size = str(parser[BASE_CONFIG].get('delivery_page_size', '1000'))
+        if not self.delivery_page_size.isnumeric() or int(self.delivery_page_size) < 1:
+            raise InvalidConfigurationException("delivery_page_size must be a numeric value greater than 0.")
+
         # Validate email delivery system
         if self.alert_delivery not in ['smtp', 'sendgrid', 'slack']:
             raise InvalidConfigurationException(
@@ -70,9 +114,102 @@ class ECSSmtpAlertConfiguration(object):
         # Grab SQL Lite database settings:
         self.database_name = parser[DATABASE_CONNECTION_CONFIG]['databasename']
 
+        # Retrieve the maximum number of pooled read-only database connections
+        self.database_reader_connections = \
+            str(parser[DATABASE_CONNECTION_CONFIG].get('reader_connections', '4'))
+        if not self.database_reader_connections.isnumeric() or int(self.database_reader_connections) < 1:
+            raise InvalidConfigurationException("reader_connections must be a numeric value greater than 0.")
+
         # Grab ECS API Polling Intervals
         self.modules_intervals = parser[ECS_API_POLLING_INTERVALS]
 
+        # Retrieve the number of workers used to poll the configured ECS connections concurrently
+        self.collection_workers = str(parser[BASE_CONFIG].get('collection_workers', '1'))
+        if not self.collection_workers.isnumeric() or int(self.collection_workers) < 1:
+            raise InvalidConfigurationException("collection_workers must be a numeric value greater than 0.")
+
+        # Retrieve if only alerts newer than the last seen alert are requested and how often we do a full resync
+        self.incremental_collection = str(parser[BASE_CONFIG].get('incremental_collection', 'no')).lower()
+        if self.incremental_collection not in ['yes', 'no']:
+            raise InvalidConfigurationException("incremental_collection must be either yes or no.")
+        self.full_resync_interval = str(parser[BASE_CONFIG].get('full_resync_interval_seconds', '3600'))
+        if not self.full_resync_interval.isnumeric():
+            raise InvalidConfigurationException("full_resync_interval_seconds must be numeric.")
+
+        # Retrieve the number of known alert ids per VDC kept in memory to skip alerts we have already seen
+        self.seen_alert_cache_size = str(parser[BASE_CONFIG].get('seen_alert_cache_size', '100000'))
+        if not self.seen_alert_cache_size.isnumeric() or int(self.seen_alert_cache_size) < 1:
+            raise InvalidConfigurationException("seen_alert_cache_size must be a numeric value greater than 0.")
+
+        # Retrieve where ECS authentication tokens are cached between restarts and how long they live
+        self.token_cache_file = parser[BASE_CONFIG].get('token_cache_file') or \
+            os.path.join(tempdir, 'ecs_token_cache.json')
+        self.token_lifetime = str(parser[BASE_CONFIG].get('token_lifetime_seconds', '28800'))
+        if not self.token_lifetime.isnumeric() or int(self.token_lifetime) < 1:
+            raise InvalidConfigurationException("token_lifetime_seconds must be a numeric value greater than 0.")
+
+        # Grab adaptive polling settings.  When enabled each ECS connection is polled on its own interval
+        # that moves between the minimum and maximum depending on whether new alerts are found.
+        adaptive_polling = parser.get(ADAPTIVE_POLLING_CONFIG, {})
+        self.adaptive_polling = str(adaptive_polling.get('enabled', 'no')).lower()
+        if self.adaptive_polling not in ['yes', 'no']:
+            raise InvalidConfigurationException("The adaptive polling enabled setting must be either yes or no.")
+        self.adaptive_min_interval = str(adaptive_polling.get('min_interval_seconds', '10'))
+        self.adaptive_max_interval = str(adaptive_polling.get('max_interval_seconds', '300'))
+        self.adaptive_speedup_factor = str(adaptive_polling.get('speedup_factor', '0.5'))
+        self.adaptive_backoff_factor = str(adaptive_polling.get('backoff_factor', '1.5'))
+        self.adaptive_jitter_percent = str(adaptive_polling.get('jitter_percent', '10'))
+        try:
+            if not 0 < float(self.adaptive_min_interval) <= float(self.adaptive_max_interval):
+                raise InvalidConfigurationException("The adaptive polling min_interval_seconds must be greater "
+                                                    "than 0 and not greater than max_interval_seconds.")
+            if not 0 < float(self.adaptive_speedup_factor) <= 1 <= float(self.adaptive_backoff_factor):
+                raise InvalidConfigurationException("The adaptive polling speedup_factor must be between 0 and 1 "
+                                                    "and backoff_factor must be at least 1.")
+            if not 0 <= float(self.adaptive_jitter_percent) < 100:
+                raise InvalidConfigurationException("The adaptive polling jitter_percent must be between 0 and 100.")
+        except ValueError:
+            raise InvalidConfigurationException("The adaptive polling settings must be numeric.")
+
+        # Grab metrics endpoint settings
+        metrics = parser.get(METRICS_CONFIG, {})
+        self.metrics_enabled = str(metrics.get('enabled', 'no')).lower()
+        if self.metrics_enabled not in ['yes', 'no']:
+            raise InvalidConfigurationException("The metrics enabled setting must be either yes or no.")
+        self.metrics_listen_address = str(metrics.get('listen_address', '127.0.0.1'))
+        self.metrics_port = str(metrics.get('port', '9464'))
+        if not self.metrics_port.isnumeric() or not 0 < int(self.metrics_port) < 65536:
+            raise InvalidConfigurationException("The metrics port must be a numeric value between 1 and 65535.")
+
+        # Grab retention settings.  Delivered alerts older than retention_days are archived and removed.
+        retention = parser.get(RETENTION_CONFIG, {})
+        self.retention_enabled = str(retention.get('enabled', 'no')).lower()
+        if self.retention_enabled not in ['yes', 'no']:
+            raise InvalidConfigurationException("The retention enabled setting must be either yes or no.")
+        self.retention_days = str(retention.get('retention_days', '90'))
+        self.retention_archive_format = str(retention.get('archive_format', 'database')).lower()
+        self.retention_archive_database_name = str(retention.get('archive_database_name', 'ecsalerts-archive'))
+        self.retention_archive_directory = str(retention.get('archive_directory', 'archive'))
+        self.retention_batch_size = str(retention.get('batch_size', '1000'))
+        self.retention_interval_seconds = str(retention.get('interval_seconds', '3600'))
+        self.retention_vacuum_pages = str(retention.get('vacuum_pages', '0'))
+        if self.retention_archive_format not in ARCHIVE_FORMATS:
+            raise InvalidConfigurationException("The retention archive_format must be one of " +
+                                                ', '.join(ARCHIVE_FORMATS) + ".")
+        if not self.retention_days.isnumeric() or int(self.retention_days) < 1:
+            raise InvalidConfigurationException("The retention_days must be a numeric value greater than 0.")
+        if not self.retention_batch_size.isnumeric() or int(self.retention_batch_size) < 1:
+            raise InvalidConfigurationException("The retention batch_size must be a numeric value greater than 0.")
+        if not self.retention_interval_seconds.isnumeric() or int(self.retention_interval_seconds) < 1:
+            raise InvalidConfigurationException("The retention interval_seconds must be a numeric value "
+                                                "greater than 0.")
+        if not self.retention_vacuum_pages.isnumeric():
+            raise InvalidConfigurationException("The retention vacuum_pages must be a numeric value.")
+        # ECS keeps returning unacknowledged alerts so only alerts acknowledged by us can be archived
+        if self.retention_enabled == 'yes' and str(self.acknowledge_alerts).upper() != 'YES':
+            raise InvalidConfigurationException("Retention can only be enabled when "
+                                                "acknowledge_alerts_after_notification is yes.")
+
         # Validate logging level
         if logging_level_raw not in ['debug', 'info', 'warning', 'error']:
             raise InvalidConfigurationException(
@@ -102,12 +239,23 @@ class ECSSmtpAlertConfiguration(object):
             if not ecsconnection['password']:
                 raise InvalidConfigurationException("The ECS Management Users password is not configured "
                                                     "in the module configuration")
+            if not str(ecsconnection.get('connection_pool_size', '4')).isnumeric():
+                raise InvalidConfigurationException("The ECS Management connection pool size for host " +
+                                                    ecsconnection['host'] + " is not numeric.")
+            if not str(ecsconnection.get('timeout_seconds', '60')).isnumeric():
+                raise InvalidConfigurationException("The ECS Management timeout for host " +
+                                                    ecsconnection['host'] + " is not numeric.")
         # SMTP Settings
         self.smtp_host = parser[SMTP_CONNECTION_CONFIG]['host']
         self.smtp_port = parser[SMTP_CONNECTION_CONFIG]['port']
         self.smtp_user = parser[SMTP_CONNECTION_CONFIG]['user']
         self.smtp_password = parser[SMTP_CONNECTION_CONFIG]['password']
         self.smtp_authentication_required = parser[SMTP_CONNECTION_CONFIG]['authenticationrequired']
+        self.smtp_starttls = str(parser[SMTP_CONNECTION_CONFIG].get('starttls', '0'))
+        self.smtp_max_concurrency = str(parser[SMTP_CONNECTION_CONFIG].get('max_concurrency', '4'))
+        if not self.smtp_max_concurrency.isnumeric() or int(self.smtp_max_concurrency) < 1:
+            raise InvalidConfigurationException("The SMTP max_concurrency must be a numeric "
+                                                "value greater than 0.")
         self.smtp_fromemail = parser[SMTP_CONNECTION_CONFIG]['fromemail']
         self.smtp_toemail = parser[SMTP_CONNECTION_CONFIG]['toemail']
         self.smtp_alert_polling_interval = parser[SMTP_CONNECTION_CONFIG]['polling_interval_seconds']
@@ -125,6 +273,21 @@ class ECSSmtpAlertConfiguration(object):
         self.send_grid_fromemail = parser[SEND_GRID_CONFIG]['fromemail']
         self.send_grid_toemail = parser[SEND_GRID_CONFIG]['toemail']
         self.send_grid_alert_polling_interval = parser[SEND_GRID_CONFIG]['polling_interval_seconds']
+        self.send_grid_api_host = parser[SEND_GRID_CONFIG].get('api_host') or 'https://api.sendgrid.com'
+        self.send_grid_max_concurrency = str(parser[SEND_GRID_CONFIG].get('max_concurrency', '2'))
+        if not self.send_grid_max_concurrency.isnumeric() or int(self.send_grid_max_concurrency) < 1:
+            raise InvalidConfigurationException("The SendGrid max_concurrency must be a numeric "
+                                                "value greater than 0.")
+
+        # Number of alerts packed into a single SendGrid request, SendGrid accepts up to 1000 personalizations
+        self.send_grid_alerts_per_request = str(parser[SEND_GRID_CONFIG].get('alerts_per_request', '100'))
+        if not self.send_grid_alerts_per_request.isnumeric() or \
+                not 0 < int(self.send_grid_alerts_per_request) <= 1000:
+            raise InvalidConfigurationException("The SendGrid alerts_per_request must be a numeric value "
+                                                "between 1 and 1000.")
+        if len(self.send_grid_toemail.split(',')) > 1000:
+            raise InvalidConfigurationException("SendGrid accepts at most 1000 recipients per request so at most "
+                                                "1000 toemail addresses may be configured.")
 
         # Slack Settings
         self.slack_environment_variable_for_webhook_url = \
@@ -146,6 +309,25 @@ class ECSSmtpAlertConfiguration(object):
                                                     "Web Hook is not set in the configuration.")
 
         self.slack_alert_polling_interval = parser[SLACK_CONFIG]['polling_interval_seconds']
+        self.slack_max_concurrency = str(parser[SLACK_CONFIG].get('max_concurrency', '1'))
+        if not self.slack_max_concurrency.isnumeric() or int(self.slack_max_concurrency) < 1:
+            raise InvalidConfigurationException("The Slack max_concurrency must be a numeric "
+                                                "value greater than 0.")
+
+        # Slack batching and rate limiting settings
+        self.slack_alerts_per_message = str(parser[SLACK_CONFIG].get('alerts_per_message', '20'))
+        if not self.slack_alerts_per_message.isnumeric() or not 0 < int(self.slack_alerts_per_message) <= 100:
+            raise InvalidConfigurationException("The Slack alerts_per_message must be a numeric value "
+                                                "between 1 and 100.")
+        try:
+            self.slack_rate_limit_per_second = float(parser[SLACK_CONFIG].get('rate_limit_per_second', '1'))
+            self.slack_rate_limit_burst = float(parser[SLACK_CONFIG].get('rate_limit_burst', '3'))
+        except ValueError:
+            raise InvalidConfigurationException("The Slack rate_limit_per_second and rate_limit_burst "
+                                                "must be numeric.")
+        if self.slack_rate_limit_per_second <= 0 or self.slack_rate_limit_burst < 1:
+            raise InvalidConfigurationException("The Slack rate_limit_per_second must be greater than 0 and "
+                                                "rate_limit_burst must be at least 1.")
 
         # ECS Severity Codes to Process
         self.ecs_alert_severity_filter = parser[ECS_ALERT_SEVERITY_FILTER]
@@ -156,3 +338,41 @@ class ECSSmtpAlertConfiguration(object):
 
         # ECS Alert Symptom Codes to Monitor
         self.ecs_alert_symptoms_filter = parser[ECS_ALERT_SYMPTOM_FILTER]
+
+        # ECS Alert Filter Rules.  An alert must match at least one rule when rules are configured.
+        self.ecs_alert_filter_rules = parser.get(ECS_ALERT_FILTER_RULES, [])
+        if not isinstance(self.ecs_alert_filter_rules, list):
+            raise InvalidConfigurationException("ECS_ALERT_FILTER_RULES must be a list of rules.")
+
+        # Make sure the filters compile before we start collecting
+        try:
+            ECSAlertFilter(self.ecs_alert_severity_filter, self.ecs_alert_symptoms_filter,
+                           self.ecs_alert_filter_rules)
+        except ECSFilterException as e:
+            raise InvalidConfigurationException("The alert filter configuration is not valid: " + str(e))
+
+        # ECS Alert Correlation.  Repeated alerts sharing the key fields within the window are notified together.
+        correlation = parser.get(ECS_ALERT_CORRELATION_CONFIG, {})
+        self.correlation_enabled = str(correlation.get('enabled', 'no')).lower()
+        if self.correlation_enabled not in ['yes', 'no']:
+            raise InvalidConfigurationException("The alert correlation enabled setting must be either yes or no.")
+        self.correlation_key_fields = correlation.get('key_fields', ['vdc', 'symptomCode', 'description'])
+        self.correlation_window_seconds = str(correlation.get('window_seconds', '300'))
+        self.correlation_max_groups = str(correlation.get('max_groups', '10000'))
+        self.correlation_max_group_seconds = str(correlation.get('max_group_seconds', '3600'))
+        if not self.correlation_window_seconds.isnumeric() or int(self.correlation_window_seconds) < 1:
+            raise InvalidConfigurationException("The alert correlation window_seconds must be a numeric value "
+                                                "greater than 0.")
+        if not self.correlation_max_groups.isnumeric() or int(self.correlation_max_groups) < 1:
+            raise InvalidConfigurationException("The alert correlation max_groups must be a numeric value "
+                                                "greater than 0.")
+        if not self.correlation_max_group_seconds.isnumeric() or int(self.correlation_max_group_seconds) < 1:
+            raise InvalidConfigurationException("The alert correlation max_group_seconds must be a numeric value "
+                                                "greater than 0.")
+        if not isinstance(self.correlation_key_fields, list) or not self.correlation_key_fields:
+            raise InvalidConfigurationException("The alert correlation key_fields must be a non-empty list.")
+        try:
+            ECSAlertCorrelator(self.correlation_key_fields, int(self.correlation_window_seconds),
+                               int(self.correlation_max_groups), int(self.correlation_max_group_seconds))
+        except ECSCorrelationException as e:
+            raise InvalidConfigurationException("The alert correlation configuration is not valid: " + str(e))
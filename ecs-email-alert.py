@@ -6,22 +6,41 @@ from configuration.ecs_email_alert_configuration import ECSSmtpAlertConfiguratio
 from ecslogger import ecslogger
 from ecsdatacollection.ecsdatacolletion import ECSAuthentication
 from ecsdatacollection.ecsdatacolletion import ECSManagementAPI
+from ecsdatacollection.ecsdatacolletion import ECSTokenCache
+from ecsdatacollection.ecsdatacolletion import ECSAdaptivePollingSchedule
 from ecsdatacollection.ecsdatacolletion import ECSUtility
 from ecssqllite.ecssqllite import SQLLiteUtility
+from ecssqllite.ecssqllite import SQLLiteStore
+from ecssqllite.ecssqllite import SQLLiteAlertIndex
+from ecssqllite.ecssqllite import EMAIL_ALERTED_CORRELATED
+from ecssqllite.ecssqllite import EMAIL_ALERTED_FAILED
 from ecssmtp.ecssmtp import ECSSMTPUtility
 from ecssendgrid.ecssendgrid import ECSSendGridUtility
 from ecsslack.ecsslack import ECSSlackUtility
-import sqlite3
+from ecsdelivery.ecsdelivery import ECSDeliveryEngine
+from ecsdelivery.ecsdelivery import ECSAcknowledgementQueue
+from ecsmetrics.ecsmetrics import ECSMetricsRegistry
+from ecsmetrics.ecsmetrics import ECSAlertingMetrics
+from ecsfilter.ecsfilter import ECSAlertFilter
+from ecscorrelation.ecscorrelation import ECSAlertCorrelator
+from ecsretention.ecsretention import ECSAlertRetention
 import argparse
 import datetime
 import os
 import traceback
 import signal
+import sys
+import csv
 import time
 import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
 import json
-import xml.etree.ElementTree as ET
+import functools
+import collections
+import random
 
 
 # Constants
@@ -30,6 +49,7 @@ INTERVAL = 30                                               # In seconds
 CONFIG_FILE = 'ecs_email_alert_configuration.json'          # Default Configuration File
 VDC_LOOKUP_FILE = 'ecs_vdc_lookup.json'                     # VDC ID Lookup File
 TOOL_VERSION = "1.0.00"                                     # Tool Version
+HIGH_WATER_MARK_OVERLAP = 300                               # Seconds incremental polls reach back past the mark
 
 # Globals
 _configuration = None
@@ -39,6 +59,14 @@ _ecsManagementUserPassword = None
 _logger = None
 _ecsAuthentication = list()
 _sqlLiteClient = None
+_sqlLiteStore = None
+_seenAlertIndex = None
+_newAlertsEvent = threading.Event()
+_collectionState = {}
+_metrics = None
+_alertFilter = None
+_alertCorrelator = None
+_alertRetention = None
 _ecsVDCLookup = None
 _ecsManagementAPI = {}
 _smtpClient = None
@@ -53,25 +81,48 @@ Class to listen for signal termination for controlled shutdown
 
 class ECSDataCollectionShutdown:
 
-    kill_now = False
-
-    def __init__(self):
+    def __init__(self, drain_seconds):
+        self.drain_seconds = drain_seconds
+        self.deadline = None
+        self.stop_event = threading.Event()
         signal.signal(signal.SIGINT, self.controlled_shutdown)
         signal.signal(signal.SIGTERM, self.controlled_shutdown)
 
-    def controlled_shutdown(self):
-        self.kill_now = True
+    @property
+    def kill_now(self):
+        return self.stop_event.is_set()
+
+    def controlled_shutdown(self, signum, frame):
+        if not self.stop_event.is_set():
+            self.deadline = time.time() + self.drain_seconds
+            self.stop_event.set()
+
+            # Wake the delivery thread so it notices the shutdown straight away
+            _newAlertsEvent.set()
+
+    def wait(self, timeout=None):
+        """
+        Sleeps until the timeout passes or shutdown is requested.  Returns True if shutdown was requested.
+        """
+        return self.stop_event.wait(timeout)
+
+    def remaining(self):
+        """
+        Returns the number of seconds left to drain in-flight work before shutdown is forced
+        """
+        if self.deadline is None:
+            return self.drain_seconds
+        return max(0, self.deadline - time.time())
 
 
 class ECSDataCollection (threading.Thread):
-    def __init__(self, method, sqlclient, logger, ecsmanagmentapi, pollinginterval, tempdir):
-        threading.Thread.__init__(self)
+    def __init__(self, method, sqlclient, logger, ecsmanagmentapi, pollinginterval):
+        threading.Thread.__init__(self, daemon=True)
         self.method = method
         self.sqlclient = sqlclient
         self.logger = logger
         self.ecsmanagmentapi = ecsmanagmentapi
         self.pollinginterval = pollinginterval
-        self.tempdir = tempdir
 
         logger.info(MODULE_NAME + '::ECSDataCollection()::init method of class called')
 
@@ -80,7 +131,7 @@ class ECSDataCollection (threading.Thread):
             self.logger.info(MODULE_NAME + '::ECSDataCollection()::Starting thread with method: ' + self.method)
 
             if self.method == 'ecs_collect_alert_data()':
-                ecs_collect_alert_data(self.logger, self.ecsmanagmentapi, self.pollinginterval, self.tempdir)
+                ecs_collect_alert_data(self.logger, self.ecsmanagmentapi, self.pollinginterval)
             else:
                 self.logger.info(MODULE_NAME + '::ECSDataCollection()::Requested method '
                                  + self.method + ' is not supported.')
@@ -91,7 +142,7 @@ class ECSDataCollection (threading.Thread):
 
 class ECSEmailAlerting (threading.Thread):
     def __init__(self, method, logger, configuration, smtputility, sendgridutility, slackutility):
-        threading.Thread.__init__(self)
+        threading.Thread.__init__(self, daemon=True)
         self.method = method
         self.logger = logger
         self.configuration = configuration
@@ -115,6 +166,30 @@ class ECSEmailAlerting (threading.Thread):
                                         'exception occurred: ' + str(e) + "\n" + traceback.format_exc())
 
 
+class ECSAlertMaintenance (threading.Thread):
+    def __init__(self, method, logger, retention, interval):
+        threading.Thread.__init__(self, daemon=True)
+        self.method = method
+        self.logger = logger
+        self.retention = retention
+        self.interval = interval
+
+        logger.info(MODULE_NAME + '::ECSAlertMaintenance()::init method of class called')
+
+    def run(self):
+        try:
+            self.logger.info(MODULE_NAME + '::ECSAlertMaintenance()::Starting thread with method: ' + self.method)
+
+            if self.method == 'ecs_alert_retention()':
+                ecs_alert_retention(self.logger, self.retention, self.interval)
+            else:
+                self.logger.info(MODULE_NAME + '::ECSAlertMaintenance()::Requested method '
+                                 + self.method + ' is not supported.')
+        except Exception as e:
+            _logger.error(MODULE_NAME + 'ECSAlertMaintenance::run()::The following unexpected '
+                                        'exception occurred: ' + str(e) + "\n" + traceback.format_exc())
+
+
 def ecs_config(config, vdc_config, temp_dir):
     global _configuration
     global _logger
@@ -150,12 +225,18 @@ def ecs_authenticate():
         while not _configuration:
             time.sleep(1)
 
+        # Tokens are shared with previous runs through the token cache
+        token_cache = ECSTokenCache(_configuration.token_cache_file, _logger)
+
         # Iterate over all ECS Connections configured and attempt tp Authenticate to ECS
         for ecsconnection in _configuration.ecsconnections:
 
             # Attempt to authenticate
             auth = ECSAuthentication(ecsconnection['protocol'], ecsconnection['host'], ecsconnection['user'],
-                                     ecsconnection['password'], ecsconnection['port'], _logger)
+                                     ecsconnection['password'], ecsconnection['port'], _logger,
+                                     int(ecsconnection.get('connection_pool_size', '4')),
+                                     float(ecsconnection.get('timeout_seconds', '60')), token_cache,
+                                     int(_configuration.token_lifetime))
             auth.connect()
 
             # Check to see if we have a token returned
@@ -208,6 +289,11 @@ def sqllite_init():
             _logger.info(MODULE_NAME + '::sqllite_init()::Successfully connected to SQLLite as configured.')
             _sqlLiteClient = sql_database
 
+            # Retention hands freed pages back with incremental vacuum which has to be enabled before the
+            # tables are created or the database is rebuilt
+            if _configuration.retention_enabled == 'yes':
+                db_utility.enable_incremental_vacuum(sql_database)
+
             # Lets check if table exits
             ecsalertstable = """ CREATE TABLE IF NOT EXISTS ecsalerts (
                                         id integer PRIMARY KEY,
@@ -224,12 +310,40 @@ def sqllite_init():
                                         alertCleared int,
                                         dateCreated date,
                                         dateEmailed date,
-                                        dateCleared date
+                                        dateCleared date,
+                                        occurrences int NOT NULL DEFAULT 1,
+                                        correlatedTo text,
+                                        notifiedOccurrences int NOT NULL DEFAULT 0,
+                                        severityRank int,
+                                        deliveryAttempts int NOT NULL DEFAULT 0,
+                                        nextAttempt real
+                                    ); """
+            # Per ECS connection collection high-water mark used for incremental collection
+            ecscollectionstatetable = """ CREATE TABLE IF NOT EXISTS ecscollectionstate (
+                                        managementIp text PRIMARY KEY,
+                                        highWaterMark real,
+                                        lastFullSync real
                                     ); """
             dbcur = sql_database.cursor()
             dbcur.execute(ecsalertstable)
+            dbcur.execute(ecscollectionstatetable)
             dbcur.close()
 
+            # Make sure alerts are unique on alertId so duplicates can be skipped on insert
+            db_utility.create_alert_id_index(sql_database)
+
+            # Bring tables created before alert correlation up to date
+            db_utility.create_correlation_columns(sql_database)
+
+            # Bring tables created before delivery attempts were tracked up to date
+            db_utility.create_delivery_attempt_columns(sql_database)
+
+            # Index the unsent alerts on their own so delivery only ever reads the pending queue
+            db_utility.create_unsent_index(sql_database)
+
+            # Index the date alerts were stored and the failed alerts so listings do not read the whole table
+            db_utility.create_listing_indexes(sql_database)
+
         return connected
 
     except Exception as e:
@@ -239,168 +353,304 @@ def sqllite_init():
         return connected
 
 
-def ecs_collect_alert_data(logger, ecsmanagmentapi, pollinginterval, tempdir):
-
+def ecs_collect_vdc_alert_data(logger, ecsconnection):
+    """
+    Collect, filter, and store the unacknowledged alerts of a single ECS connection
+    and return the number of new alerts stored
+    """
     try:
-        # Start polling loop
-        while True:
-            # Perform API call against each configured ECS
-            for key in ecsmanagmentapi:
+        # Grab VDC Name
+        vdc = _ecsVDCLookup.vdc_json[ecsconnection.authentication.host]
+        managementIp = ecsconnection.authentication.host
+
+        # Reset marker
+        next_marker = None
+
+        # Reset new alerts and page counters
+        new_alerts = 0
+        known_alerts = 0
+        pages = 0
+        start_time = time.time()
+
+        # With incremental collection only ask for alerts newer than the high-water mark of this
+        # connection unless it is time for a periodic full resync
+        state = _collectionState.setdefault(managementIp, {'highWaterMark': None, 'lastFullSync': 0})
+        high_water_mark = state['highWaterMark']
+        alerts_since = None
+        if _configuration.incremental_collection == 'yes' and high_water_mark is not None and \
+                start_time - state['lastFullSync'] < int(_configuration.full_resync_interval):
+            alerts_since = high_water_mark - HIGH_WATER_MARK_OVERLAP
+        poll_complete = True
 
-                # Grab object
-                ecsconnection = ecsmanagmentapi[key]
-                # Reset marker
+        while True:
+            # Retrieve current alert data via API for current VDC.  This may be
+            # called multiple times to iterate thru all alerts depending on # of alerts
+            page_start = time.time()
+            alerts = ecsconnection.ecs_collect_alert_data(next_marker, alerts_since)
+
+            if alerts is None:
+                logger.info(MODULE_NAME + '::ecs_collect_vdc_alert_data()::'
+                                          'Unable to retrieve ECS Dashboard Alert Information for VDC ' + vdc)
+                _metrics.collection_errors.labels(vdc).inc()
+                return new_alerts
+            else:
+                pages += 1
                 next_marker = None
 
-                # Reset new alerts counter
-                new_alerts = 0
+                """
+                We have a response stream lets parse the alerts as they arrive
+                """
+                try:
+                    db_utility = SQLLiteUtility(_configuration, _logger)
+
+                    # Filter the alerts on the page and gather the ones we want to store
+                    page_alerts = []
+                    page_alert_ids = []
+                    parse_start = time.time()
+                    for alert in alerts:
+                        alertid = alert['id']
+
+                        # Track the newest alert seen so far
+                        alert_epoch = ecsconnection.ecs_alert_epoch(alert.get('timestamp'))
+                        if alert_epoch is not None and (high_water_mark is None or alert_epoch > high_water_mark):
+                            high_water_mark = alert_epoch
+
+                        # Skip alerts we already know about without touching the database
+                        if _seenAlertIndex.contains(vdc, alertid):
+                            known_alerts += 1
+                            continue
+
+                        page_alert_ids.append(alertid)
+
+                        # Queue the row if it passes the compiled severity, symptom code, and rule filters
+                        if _alertFilter.matches(alert, vdc):
+                            acknowledged = alert.get('acknowledged')
+                            description = alert.get('description')
+                            namespace = alert.get('namespace')
+                            severity = alert.get('severity')
+                            symptom_code = alert.get('symptomCode')
+                            timestamp = alert.get('timestamp')
+
+                            # Alerts correlated to an alert of the same group in the correlation window are
+                            # stored without their own notification and counted against that alert
+                            correlated_to = None
+                            if _alertCorrelator is not None:
+                                correlated_to = _alertCorrelator.correlate(alert, vdc, alert_epoch or time.time())
+                            email_alerted = str(EMAIL_ALERTED_CORRELATED) if correlated_to else '0'
+
+                            current_time = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
+                            page_alerts.append((vdc, managementIp, alertid, acknowledged, description, namespace,
+                                                severity, symptom_code, timestamp, email_alerted, '0', current_time,
+                                                '', '', correlated_to))
+
+                    # Grab next marker information now that the page has been fully parsed
+                    next_marker = ecsconnection.next_marker
+
+                    parse_end = time.time()
+                    _metrics.parse_duration.labels(vdc).observe(parse_end - parse_start)
+                    _metrics.page_duration.labels(vdc).observe(parse_end - page_start)
+
+                    # Hand the page to the database writer as a single batch letting
+                    # the unique alertId index skip known alerts
+                    if page_alerts:
+                        write_start = time.time()
+                        inserted = _sqlLiteStore.write(functools.partial(db_utility.insert_alerts,
+                                                                         alerts=page_alerts))
+                        _metrics.db_write_duration.labels('insert_alerts').observe(time.time() - write_start)
+                        new_alerts += inserted
+
+                        # Wake the delivery thread as soon as new alerts are committed
+                        if inserted:
+                            _newAlertsEvent.set()
+
+                    # Remember every alert on the page, stored or filtered out, so the next poll skips it
+                    _seenAlertIndex.add(vdc, page_alert_ids)
+
+                except Exception as ex:
+                    poll_complete = False
+                    _metrics.collection_errors.labels(vdc).inc()
+                    logger.error(MODULE_NAME + '::ecs_collect_vdc_alert_data()::The following unexpected '
+                                               'exception occurred: ' + str(ex) + "\n" + traceback.format_exc())
+
+            # Check to see if the marker is empty
+            if next_marker is None:
+                break
 
-                while True:
-                    # Retrieve current alert data via API for current VDC.  This may be
-                    # called multiple times to iterate thru all alerts depending on # of alerts
-                    alert_data_file = ecsconnection.ecs_collect_alert_data(tempdir, next_marker)
+            # Stop between pages on shutdown.  The high-water mark is left alone so the next run resumes here.
+            if controlledShutdown.kill_now:
+                poll_complete = False
+                break
 
-                    if alert_data_file is None:
-                        logger.info(MODULE_NAME + '::ecs_collect_alert_data()::'
-                                                  'Unable to retrieve ECS Dashboard Alert Information')
-                        return
-                    else:
-                        """
-                        We have an XML File lets parse it
-                        """
-                        try:
-                            tree = ET.parse(alert_data_file)
-                            root = tree.getroot()
+        # Only move the high-water mark forward once every page of the poll was processed
+        if _configuration.incremental_collection == 'yes' and poll_complete:
+            state['highWaterMark'] = high_water_mark
+            if alerts_since is None:
+                state['lastFullSync'] = start_time
 
-                            # Create a connection to the database
-                            db_utility = SQLLiteUtility(_configuration, _logger)
-                            sql_database = db_utility.open_sqllite_db(_configuration.database_name)
+            _sqlLiteStore.write(functools.partial(SQLLiteUtility(_configuration, _logger).save_collection_state,
+                                                  management_ip=managementIp,
+                                                  high_water_mark=state['highWaterMark'],
+                                                  last_full_sync=state['lastFullSync']))
 
-                            # Grab VDC Name
-                            vdc = _ecsVDCLookup.vdc_json[ecsconnection.authentication.host]
-                            managementIp = ecsconnection.authentication.host
+        _metrics.poll_duration.labels(vdc).observe(time.time() - start_time)
+        _metrics.pages.labels(vdc).inc(pages)
+        _metrics.alerts_stored.labels(vdc).inc(new_alerts)
 
-                            # Grab next marker information
-                            nm = root.find('NextMarker')
-                            if nm is None:
-                                next_marker = None
-                            else:
-                                next_marker = nm.text
-
-                            # For each alert check if we already have it and if not add it
-                            for alert in root.findall('alert'):
-                                alertid = alert.find('id').text
-                                acknowledged = alert.find('acknowledged').text
-                                description = alert.find('description').text
-                                namespace = alert.find('namespace').text
-                                severity = alert.find('severity').text
-                                symptom_code = alert.find('symptomCode').text
-                                timestamp = alert.find('timestamp').text
-
-                                # Check if alert already exists
-                                cur = sql_database.cursor()
-                                cur.execute("SELECT count(*) FROM ecsalerts WHERE alertId =?", (alertid,))
-                                row = cur.fetchone()[0]
-
-                                # If no row found for this alert id then go ahead and add the alert
-                                if row == 0:
-                                    process_row = False
-
-                                    # Apply filtering based on severity first
-                                    if len(_configuration.ecs_alert_severity_filter) == 0:
-                                        # The list of configured severity codes to process
-                                        # is empty we are doing all of them
-                                        process_row = True
-                                    else:
-                                        # We have severity codes to filter.  Check if the severity code
-                                        # of the alert is in the list severity codes to processs.
-                                        if severity in _configuration.ecs_alert_severity_filter:
-                                            process_row = True
-                                        else:
-                                            process_row = False
-
-                                    # If the alert passed severity filtering now apply filtering based on symptom codes.
-                                    if process_row:
-                                        if len(_configuration.ecs_alert_symptoms_filter) == 0:
-                                            # The list of configured symtom codes to process
-                                            # is empty so we are doing all of them
-                                            process_row = True
-                                        else:
-                                            # If the symptom code of the alert is on the list of
-                                            # alerts to email add it to the database otherwise ignore it.
-                                            if symptom_code in _configuration.ecs_alert_symptoms_filter:
-                                                process_row = True
-                                            else:
-                                                process_row = False
-
-                                    # Process the row if it passes all filtering logic
-                                    if process_row:
-                                        current_time = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
-                                        alertdata = (vdc, managementIp, alertid, acknowledged, description, namespace, severity,
-                                                     symptom_code, timestamp, '0', '0', current_time, '', '')
-                                        sql = ''' INSERT INTO ecsalerts(vdc, managementIp, alertId, acknowledged, description, namespace, severity, symptomCode, alertTimestamp, emailAlerted, alertCleared, dateCreated, dateEmailed, dateCleared) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?) '''
-                                        cur.execute(sql, alertdata)
-                                        sql_database.commit()
-                                        new_alerts += 1
-
-                            # No need to close the file as the ET parse()
-                            # method will close it when parsing is completed.
-
-                            # Close the database connection when we have processed all eligible records
-                            sql_database.close()
-
-                            _logger.debug(MODULE_NAME + '::ecs_collect_alert_data::Deleting temporary '
-                                                        'json file: ' + alert_data_file )
-
-                        except Exception as ex:
-                            logger.error(MODULE_NAME + '::ecs_collect_alert_data()::The following unexpected '
-                                                       'exception occurred: ' + str(ex) + "\n" + traceback.format_exc())
-
-                    # Check to see if the marker is empty
-                    if next_marker is None:
-                        break
-
-                # Log stats line
-                _logger.info(MODULE_NAME + '::ecs_collect_alert_data::Discovered ' + str(new_alerts) +
-                             ' new alerts on VDC ' + vdc + ' that passed severity and symptom code '
-                                                           'filtering.')
+        # Log stats line
+        _logger.info(MODULE_NAME + '::ecs_collect_vdc_alert_data::Discovered ' + str(new_alerts) +
+                     ' new alerts on VDC ' + vdc + ' that passed severity and symptom code filtering.  '
+                     'Processed ' + str(pages) + ' pages in ' + '{0:.3f}'.format(time.time() - start_time) +
+                     ' seconds and skipped ' + str(known_alerts) + ' known alerts.')
 
-            if controlledShutdown.kill_now:
-                logger.info(MODULE_NAME + '::ecs_collect_alert_data()::Shutdown detected.  Terminating polling.')
-                break
+        return new_alerts
 
-            # Wait for specific polling interval
-            time.sleep(float(pollinginterval))
+    except Exception as e:
+        _logger.error(MODULE_NAME + '::ecs_collect_vdc_alert_data()::The following unexpected '
+                                    'exception occurred: ' + str(e) + "\n" + traceback.format_exc())
+        return 0
+
+
+def ecs_collect_alert_data(logger, ecsmanagmentapi, pollinginterval):
+
+    try:
+        # Size the worker pool so that each configured ECS connection can be polled in parallel
+        # up to the configured number of collection workers
+        workers = max(1, min(int(_configuration.collection_workers), len(ecsmanagmentapi)))
+
+        logger.info(MODULE_NAME + '::ecs_collect_alert_data()::Polling ' + str(len(ecsmanagmentapi)) +
+                    ' ECS connections using ' + str(workers) + ' collection workers.')
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ecs-collect') as executor:
+            if _configuration.adaptive_polling == 'yes':
+                ecs_collect_alert_data_adaptive(logger, ecsmanagmentapi, pollinginterval, executor)
+                return
+
+            # Start polling loop
+            while True:
+                cycle_start = time.time()
+
+                # Perform API call against each configured ECS and wait for all of them to complete
+                futures = [executor.submit(ecs_collect_vdc_alert_data, logger, ecsmanagmentapi[key])
+                           for key in ecsmanagmentapi]
+                wait(futures)
+
+                logger.debug(MODULE_NAME + '::ecs_collect_alert_data()::Collection cycle completed in ' +
+                             '{0:.3f}'.format(time.time() - cycle_start) + ' seconds.')
+
+                # Wait for specific polling interval or until shutdown is requested
+                if controlledShutdown.wait(float(pollinginterval)):
+                    logger.info(MODULE_NAME + '::ecs_collect_alert_data()::Shutdown detected.  Terminating polling.')
+                    break
     except Exception as e:
         _logger.error(MODULE_NAME + '::ecs_collect_alert_data()::The following unexpected '
                                     'exception occurred: ' + str(e) + "\n" + traceback.format_exc())
 
 
-def list_alert_table(sqllite_db):
-    global _logger
+def ecs_collect_alert_data_adaptive(logger, ecsmanagmentapi, pollinginterval, executor):
+    """
+    Poll each ECS connection on its own adaptive schedule
     """
-    Query the current contents of the extracted alerts database and provide it in JSON
+    schedule = ECSAdaptivePollingSchedule(float(_configuration.adaptive_min_interval),
+                                          float(_configuration.adaptive_max_interval),
+                                          float(_configuration.adaptive_speedup_factor),
+                                          float(_configuration.adaptive_backoff_factor),
+                                          float(_configuration.adaptive_jitter_percent) / 100)
+
+    # Current interval and next due time of each ECS connection.  First polls are spread out by the jitter.
+    intervals = dict((key, schedule.initial_interval(float(pollinginterval))) for key in ecsmanagmentapi)
+    next_poll = dict((key, time.time() + random.uniform(0, schedule.jitter * intervals[key]))
+                     for key in ecsmanagmentapi)
+    in_flight = {}
+
+    logger.info(MODULE_NAME + '::ecs_collect_alert_data_adaptive()::Adaptive polling between ' +
+                _configuration.adaptive_min_interval + ' and ' + _configuration.adaptive_max_interval + ' seconds.')
+
+    # Start polling loop
+    while not controlledShutdown.kill_now:
+        # Start a poll for every connection that is due and not already being polled
+        now = time.time()
+        for key in ecsmanagmentapi:
+            if key not in in_flight.values() and next_poll[key] <= now:
+                in_flight[executor.submit(ecs_collect_vdc_alert_data, logger, ecsmanagmentapi[key])] = key
+
+        # Wait for a poll to complete or for the next connection to become due.  Polls in flight are
+        # waited on in short steps so a shutdown request is noticed promptly.
+        waiting = [next_poll[key] for key in ecsmanagmentapi if key not in in_flight.values()]
+        timeout = max(0, min(waiting) - time.time()) if waiting else None
+        if not in_flight:
+            controlledShutdown.wait(timeout)
+            continue
+        done, not_done = wait(list(in_flight), timeout=min(timeout, 1) if timeout is not None else 1,
+                              return_when=FIRST_COMPLETED)
+
+        # Speed up connections that found new alerts and back off the ones that did not
+        for future in done:
+            key = in_flight.pop(future)
+            new_alerts = future.result()
+            intervals[key] = schedule.next_interval(intervals[key], new_alerts)
+            next_poll[key] = time.time() + schedule.next_delay(intervals[key])
+
+            logger.debug(MODULE_NAME + '::ecs_collect_alert_data_adaptive()::Next poll of ' + key + ' in ' +
+                         '{0:.1f}'.format(next_poll[key] - time.time()) + ' seconds.')
+
+    logger.info(MODULE_NAME + '::ecs_collect_alert_data_adaptive()::Shutdown detected.  Terminating polling.')
+
+
+def write_alerts(cursor, output_format):
     """
+    Writes the rows of a cursor to standard output one at a time as JSON Lines or CSV and returns the number
+    of rows written
+    """
+    columns = [column[0] for column in cursor.description]
+    rowcount = 0
+
     try:
-        rowcount = 0
+        if output_format == 'csv':
+            writer = csv.writer(sys.stdout)
+            writer.writerow(columns)
+            for row in cursor:
+                writer.writerow(row)
+                rowcount += 1
+        else:
+            for row in cursor:
+                sys.stdout.write(json.dumps(dict(zip(columns, row)), sort_keys=True) + '\n')
+                rowcount += 1
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader went away, for example a pipe into head.  Stop quietly and keep Python from complaining
+        # when it flushes standard output on exit.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+    return rowcount
+
+
+def listing_since(value):
+    """
+    Converts the --since argument to the format dates are stored in
+    """
+    try:
+        return datetime.datetime.fromisoformat(value).strftime("%Y-%m-%dT%H:%M:%S")
+    except ValueError:
+        raise argparse.ArgumentTypeError("'" + value + "' is not a date such as 2019-06-01 or 2019-06-01T12:00:00")
 
+
+def list_alert_table(sqllite_db, filters, output_format):
+    global _logger
+    """
+    Stream the current contents of the extracted alerts database matching the filters to standard output
+    """
+    try:
         _logger.info(MODULE_NAME + '::list_alert_table::About to list all extracted alerts in the database.')
-        """
-        Select all records in the extracted alerts table 
-        """
-        ecsalertsselect = """ SELECT * FROM ecsalerts; """
 
-        cur = sqllite_db.cursor()
-        cur.execute(ecsalertsselect)
-        r = [dict((cur.description[i][0], value) \
-                  for i, value in enumerate(row)) for row in cur.fetchall()]
-        cur.connection.close()
-        return r if r else None
+        db_utility = SQLLiteUtility(_configuration, _logger)
+        rowcount = write_alerts(db_utility.select_alerts(sqllite_db, **filters), output_format)
+        sqllite_db.close()
+        return rowcount
 
     except Exception as e:
         _logger.error(MODULE_NAME + '::list_alert_table()::The following '
-                                    'unhandled exception occurred: ' + e.message)
-        return None
+                                    'unhandled exception occurred: ' + str(e))
+        return 0
 
 
 def clear_alert_table(sqllite_db):
@@ -425,52 +675,96 @@ def clear_alert_table(sqllite_db):
         return False
 
 
-def list_sent_alerts_table(sqllite_db):
+def list_sent_alerts_table(sqllite_db, filters, output_format):
     """
-    Query the extracted alerts database for alerts that have been sent via SMTP and provide it in JSON
+    Stream the alerts in the extracted alerts database that have been sent and match the filters to
+    standard output
     """
     try:
         _logger.info(MODULE_NAME + '::list_sent_alerts_table::About to list all '
                                    'extracted alerts in the database that have had email alerts sent.')
 
-        # Select sent records in the extracted alerts table
-        ecsalertsselect = """ SELECT * FROM ecsalerts WHERE emailAlerted = 1; """
-
-        cur = sqllite_db.cursor()
-        cur.execute(ecsalertsselect)
-        r = [dict((cur.description[i][0], value) \
-                  for i, value in enumerate(row)) for row in cur.fetchall()]
-        cur.connection.close()
-        return r if r else None
+        db_utility = SQLLiteUtility(_configuration, _logger)
+        rowcount = write_alerts(db_utility.select_alerts(sqllite_db, email_alerted=1, **filters), output_format)
+        sqllite_db.close()
+        return rowcount
 
     except Exception as e:
         _logger.error(MODULE_NAME + '::list_sent_alerts_table()::The following '
-                                    'unhandled exception occurred: ' + e.message)
-        return None
+                                    'unhandled exception occurred: ' + str(e))
+        return 0
 
 
-def list_unsent_alerts_table(sqllite_db):
+def list_unsent_alerts_table(sqllite_db, filters, output_format):
     """
-    Query the extracted alerts database for alerts that have NOT been sent via SMTP and provide it in JSON
+    Stream the alerts in the extracted alerts database that have NOT been sent and match the filters to
+    standard output in delivery order
     """
     try:
         _logger.info(MODULE_NAME + '::list_unsent_alerts_table::About to list all '
                                    'extracted alerts in the database that have NOT had email alerts sent.')
 
-        # Select sent records in the extracted alerts table
-        ecsalertsselect = """ SELECT * FROM ecsalerts WHERE emailAlerted = 0; """
-
-        cur = sqllite_db.cursor()
-        cur.execute(ecsalertsselect)
-        r = [dict((cur.description[i][0], value) \
-                  for i, value in enumerate(row)) for row in cur.fetchall()]
-        cur.connection.close()
-        return r if r else None
+        db_utility = SQLLiteUtility(_configuration, _logger)
+        rowcount = write_alerts(db_utility.select_alerts(sqllite_db, email_alerted=0, **filters), output_format)
+        sqllite_db.close()
+        return rowcount
 
     except Exception as e:
         _logger.error(MODULE_NAME + '::list_unsent_alerts_table()::The following '
-                                    'unhandled exception occurred: ' + e.message)
-        return None
+                                    'unhandled exception occurred: ' + str(e))
+        return 0
+
+
+def list_failed_alerts_table(sqllite_db, filters, output_format):
+    """
+    Stream the alerts in the extracted alerts database whose delivery was given up and match the filters to
+    standard output
+    """
+    try:
+        _logger.info(MODULE_NAME + '::list_failed_alerts_table::About to list all '
+                                   'extracted alerts in the database whose email alerts could not be sent.')
+
+        db_utility = SQLLiteUtility(_configuration, _logger)
+        rowcount = write_alerts(db_utility.select_alerts(sqllite_db, email_alerted=EMAIL_ALERTED_FAILED, **filters),
+                                output_format)
+        sqllite_db.close()
+        return rowcount
+
+    except Exception as e:
+        _logger.error(MODULE_NAME + '::list_failed_alerts_table()::The following '
+                                    'unhandled exception occurred: ' + str(e))
+        return 0
+
+
+def ecs_send_notification(configuation, rows, smtputility, sendgridutility, slackutility, smtp_session=None):
+    """
+    Send a notification for alert rows, or a digest of rows, through the configured
+    alert delivery system and return the rows that were delivered
+    """
+    if configuation.delivery_mode == 'digest':
+        vdc = rows[0]['vdc']
+        severity = rows[0]['severity']
+
+        if configuation.alert_delivery == 'smtp':
+            sent = smtputility.smtp_send_digest(vdc, severity, rows, smtp_session)
+        else:
+            if configuation.alert_delivery == 'sendgrid':
+                sent = sendgridutility.send_grid_send_digest(vdc, severity, rows)
+            else:
+                sent = slackutility.slack_send_digest(vdc, severity, rows)
+
+        return rows if sent else []
+    else:
+        if configuation.alert_delivery == 'smtp':
+            # SMTP email delivery is configured
+            return [row for row in rows if smtputility.smtp_send_email(row, smtp_session)]
+        else:
+            if configuation.alert_delivery == 'sendgrid':
+                # SendGrid packs many alert emails into each request
+                return sendgridutility.send_grid_send_emails(rows)
+            else:
+                # Slack packs several alerts into each message
+                return slackutility.slack_send_messages(rows)
 
 
 def ecs_send_email_alerts(logger, configuation, smtputility, sendgridutility, slackutility):
@@ -493,8 +787,32 @@ def ecs_send_email_alerts(logger, configuation, smtputility, sendgridutility, sl
                 # Slack message deliver
                 interval = configuation.slack_alert_polling_interval
 
+        # Notifications are sent on a pool of delivery workers with a concurrency limit per channel
+        delivery_engine = ECSDeliveryEngine(logger, int(configuation.delivery_workers),
+                                            {'smtp': int(configuation.smtp_max_concurrency),
+                                             'sendgrid': int(configuation.send_grid_max_concurrency),
+                                             'slack': int(configuation.slack_max_concurrency)},
+                                            stop_event=controlledShutdown.stop_event)
+
+        # Acknowledge alerts on ECS in the background so notification is not held up by the ECS API
+        acknowledgement_queue = None
+        if str(configuation.acknowledge_alerts).upper() == 'YES':
+            acknowledgement_queue = ECSAcknowledgementQueue(logger, _ecsManagementAPI, _sqlLiteStore,
+                                                            SQLLiteUtility(configuation, logger),
+                                                            int(configuation.acknowledgement_workers_per_host))
+            acknowledgement_queue.start()
+
+            # Acknowledge again the alerts whose acknowledgement was given up or interrupted by a shutdown
+            with _sqlLiteStore.reader() as sql_database:
+                unacknowledged_rows = SQLLiteUtility(configuation, logger).select_unacknowledged_alerts(sql_database)
+            if unacknowledged_rows:
+                logger.info(MODULE_NAME + '::ecs_send_email_alerts()::Acknowledging ' + str(len(unacknowledged_rows)) +
+                            ' notified alerts that were not acknowledged on ECS.')
+                acknowledgement_queue.put(unacknowledged_rows)
+            _metrics.acknowledgement_queue_depth.labels().set_function(acknowledgement_queue.depth)
+
         # Start polling loop
-        while True:
+        while not controlledShutdown.kill_now:
             try:
                 _logger.info(MODULE_NAME + '::ecs_send_email_alerts::About to poll for extracted alerts in '
                                            'the database that have not been emailed.')
@@ -502,82 +820,195 @@ def ecs_send_email_alerts(logger, configuation, smtputility, sendgridutility, sl
                 # reset sent email counter
                 sent_emails = 0
 
-                # Create a connection to the database
-                db_utility = SQLLiteUtility(configuation, logger)
-                sql_database = db_utility.open_sqllite_db(configuation.database_name)
+                # Clear the new alerts signal before reading so alerts committed from here on wake us again
+                _newAlertsEvent.clear()
 
-                # Select records in the extracted alerts table with the
-                ecsalertsselect = """ SELECT * FROM ecsalerts WHERE emailAlerted = 0; """
-
-                sql_database.row_factory = sqlite3.Row
-                cur = sql_database.cursor()
-                cur.execute(ecsalertsselect)
-                rows = cur.fetchall()
+                db_utility = SQLLiteUtility(configuation, logger)
 
-                # Process any returned row but sending the email and updating the sent flag.
-                for row in rows:
-                    if row is None:
-                        break
+                def send(notification_rows):
+                    channel = configuation.alert_delivery
+                    send_start = time.time()
+                    sent_rows = []
+
+                    # Send notification based on configured alert delivery system.  SMTP
+                    # workers each hold a pooled session that stays open for the cycle.
+                    try:
+                        if channel == 'smtp':
+                            smtp_session = smtputility.acquire_session()
+                            try:
+                                sent_rows = ecs_send_notification(configuation, notification_rows, smtputility,
+                                                                  sendgridutility, slackutility, smtp_session)
+                            finally:
+                                smtputility.release_session(smtp_session)
+                        else:
+                            sent_rows = ecs_send_notification(configuation, notification_rows, smtputility,
+                                                              sendgridutility, slackutility)
+                    except Exception as e:
+                        _logger.error(MODULE_NAME + '::ecs_send_email_alerts()::The following unhandled exception '
+                                                    'occurred delivering via ' + channel + ': ' + str(e))
+
+                    _metrics.send_duration.labels(channel).observe(time.time() - send_start)
+                    _metrics.alerts_delivered.labels(channel).inc(len(sent_rows))
+                    if len(sent_rows) < len(notification_rows):
+                        _metrics.send_errors.labels(channel).inc()
+
+                        # Back off the rows that were not delivered and give up on them after too many attempts
+                        # so an alert that can never be delivered is not sent again on every cycle.  The rows
+                        # that were delivered are always handed back so they are committed.
+                        sent_ids = set(row['id'] for row in sent_rows)
+                        failed_rows = [row for row in notification_rows if row['id'] not in sent_ids]
+                        try:
+                            given_up = _sqlLiteStore.write(functools.partial(
+                                db_utility.record_failed_deliveries, row_ids=[row['id'] for row in failed_rows],
+                                max_attempts=int(configuation.delivery_max_attempts),
+                                backoff=float(configuation.delivery_retry_backoff_seconds)))
+                            if given_up:
+                                _metrics.alerts_failed.labels(channel).inc(given_up)
+                                _logger.error(MODULE_NAME + '::ecs_send_email_alerts()::Gave up on ' +
+                                              str(given_up) + ' alerts after ' + configuation.delivery_max_attempts +
+                                              ' failed delivery attempts.')
+                        except Exception as e:
+                            _logger.error(MODULE_NAME + '::ecs_send_email_alerts()::Unable to record the failed '
+                                                        'delivery of ' + str(len(failed_rows)) + ' alerts: ' + str(e))
+
+                    return sent_rows
+
+                def commit(sent_rows):
+                    # Update notification alert sent state on a batch of delivered rows in one transaction
+                    # recording how many occurrences of each correlation group have been notified.
+                    # Rows that could not be delivered stay unsent so they are retried on the next cycle.
+                    settle(sent_rows, [(row['occurrences'], row['correlatedTo'] or row['alertId'])
+                                       for row in sent_rows])
+
+                def settle(rows, notified_groups=()):
+                    row_ids = [row['id'] for row in rows]
+                    write_start = time.time()
+                    _sqlLiteStore.write(functools.partial(db_utility.mark_alerts_emailed, row_ids=row_ids,
+                                                          notified_groups=notified_groups))
+                    _metrics.db_write_duration.labels('mark_alerts_emailed').observe(time.time() - write_start)
+
+                    # If we are acknowledging alerts after notification hand them to the acknowledgement queue
+                    if acknowledgement_queue is not None:
+                        acknowledgement_queue.put(rows)
+
+                # Page through the unsent alerts most severe first.  Each page is read on a pooled read-only
+                # connection so collection is never blocked and is delivered before the next page is read.
+                unsent_rows = 0
+                after = None
+                try:
+                    while not controlledShutdown.kill_now:
+                        with _sqlLiteStore.reader() as sql_database:
+                            rows = db_utility.select_unsent_alerts(sql_database, after,
+                                                                   int(configuation.delivery_page_size))
+                        if not rows:
+                            break
+
+                        after = (rows[-1]['severityRank'], rows[-1]['id'])
+                        unsent_rows += len(rows)
+
+                        # Work out the notifications to send.  In digest mode all rows of a VDC with the same
+                        # severity go out as one notification otherwise each row is its own notification.
+                        if configuation.delivery_mode == 'digest':
+                            groups = collections.OrderedDict()
+                            for row in rows:
+                                groups.setdefault((row['vdc'], row['severity']), []).append(row)
+                            notifications = list(groups.values())
+                        else:
+                            if configuation.alert_delivery == 'slack':
+                                batch_size = int(configuation.slack_alerts_per_message)
+                            else:
+                                if configuation.alert_delivery == 'sendgrid':
+                                    batch_size = int(configuation.send_grid_alerts_per_request)
+                                else:
+                                    batch_size = 1
+                            notifications = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
 
-                    # Format and send an email
-                    rowcount += 1
+                        rowcount += len(rows)
 
-                    # Send email based on configured email delivery system
+                        sent_emails += delivery_engine.deliver(configuation.alert_delivery, notifications, send,
+                                                               commit)
+                finally:
                     if configuation.alert_delivery == 'smtp':
-                        # SMTP email delivery is configured
-                        smtputility.smtp_send_email(row)
-                    else:
-                        if configuation.alert_delivery == 'sendgrid':
-                            # SendGrid email delivery is configured
-                            sendgridutility.send_grid_send_email(row)
-                        else:
-                            slackutility.slack_send_message(row)
-
-                    # Update notification alert sent state on row
-                    current_time = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
-                    row_id = row[0]
-                    alert_id = row[3]
-                    managementIp = row[2]
-                    ecsalertupdate = """ UPDATE ecsalerts SET emailAlerted = 1, dateEmailed = ? WHERE id = ?; """
-                    cur.execute(ecsalertupdate, (current_time, row_id,))
-                    sql_database.commit()
-
-                    # Increment sent email count
-                    sent_emails += 1
-
-                    # If we are acknowledging alerts after notification make the API call
-                    if str(configuation.acknowledge_alerts).upper() == 'YES':
-                        _ecsManagementAPI[managementIp].ecs_acknowledge_alert(alert_id)
-
-                        # Update alert acknowledge date
-                        current_time2 = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
-                        row_id = row[0]
-                        ecsalertupdate2 = """ UPDATE ecsalerts SET alertCleared = 1, dateCleared = ? WHERE id = ?; """
-                        cur.execute(ecsalertupdate2, (current_time2, row_id,))
-                        sql_database.commit()
-
-                # Close the database connection when we have processed all eligible records
-                sql_database.close()
+                        smtputility.close_sessions()
+
+                _metrics.unsent_alerts.labels().set(unsent_rows)
 
                 _logger.info(MODULE_NAME + '::ecs_send_email_alerts::Processed ' + str(sent_emails) +
                              ' new alerts and sent notifications.')
 
+                # Alerts correlated to a notified alert are covered by its notification.  Groups that grew
+                # after they were notified get a follow-up notification with their total count once they close.
+                if _alertCorrelator is not None:
+                    with _sqlLiteStore.reader() as sql_database:
+                        covered_rows = db_utility.select_notified_correlated_alerts(sql_database)
+                        grown_groups = db_utility.select_grown_correlation_groups(sql_database)
+                        failed_groups = db_utility.select_failed_correlation_groups(sql_database)
+
+                    if covered_rows:
+                        settle(covered_rows)
+                        _logger.info(MODULE_NAME + '::ecs_send_email_alerts::Marked ' + str(len(covered_rows)) +
+                                     ' correlated alerts as notified.')
+
+                    now = time.time()
+                    closed_groups = [row['alertId'] for row in grown_groups
+                                     if not _alertCorrelator.is_open(row['alertId'], now)]
+                    if closed_groups:
+                        follow_ups = _sqlLiteStore.write(functools.partial(db_utility.queue_follow_up_alerts,
+                                                                           alert_ids=closed_groups))
+                        _logger.info(MODULE_NAME + '::ecs_send_email_alerts::Queued ' + str(follow_ups) +
+                                     ' follow-up notifications of correlated alerts.')
+
+                        # Deliver the follow-ups straight away rather than after the polling interval
+                        _newAlertsEvent.set()
+
+                    # A group whose notification was given up is closed and its latest waiting alert opens a
+                    # new group so the alerts correlated to it are still notified
+                    if failed_groups:
+                        for row in failed_groups:
+                            _alertCorrelator.release(row['alertId'])
+                        promoted = _sqlLiteStore.write(functools.partial(
+                            db_utility.promote_correlated_alerts, alert_ids=[row['alertId'] for row in failed_groups]))
+                        _logger.info(MODULE_NAME + '::ecs_send_email_alerts::Promoted ' + str(promoted) +
+                                     ' correlated alerts of groups whose notification was given up.')
+                        _newAlertsEvent.set()
+
             except Exception as e:
                 _logger.error(MODULE_NAME + '::ecs_send_email_alerts()::The following '
                                             'unhandled exception occurred: ' + e.message)
 
-            if controlledShutdown.kill_now:
-                logger.info(MODULE_NAME + '::ecs_send_email_alerts()::Shutdown detected.  Terminating polling.')
-                break
+            # Wait until the collector signals new alerts or shutdown is requested.  The polling interval
+            # remains as a safety net for rows left unsent by a failed delivery or a crash.
+            if _newAlertsEvent.wait(float(interval)) and not controlledShutdown.kill_now:
+                logger.debug(MODULE_NAME + '::ecs_send_email_alerts()::Woken up by newly collected alerts.')
+
+        logger.info(MODULE_NAME + '::ecs_send_email_alerts()::Shutdown detected.  Terminating polling.')
 
-            # Wait for specific polling interval
-            time.sleep(float(interval))
+        # Let in-flight notifications finish and acknowledge what was delivered within the drain deadline.
+        # Rows that were not delivered stay unsent and are picked up on the next start.
+        delivery_engine.shutdown()
+        if acknowledgement_queue is not None:
+            acknowledgement_queue.close(controlledShutdown.remaining())
 
     except Exception as e:
         _logger.error(MODULE_NAME + '::ecs_send_email_alerts()::The following unexpected '
                                     'exception occurred: ' + str(e) + "\n" + traceback.format_exc())
 
 
+def ecs_alert_retention(logger, retention, interval):
+    """
+    Applies the retention policy to the extracted alerts table every interval seconds until shutdown
+    """
+    while not controlledShutdown.kill_now:
+        try:
+            retention.run(controlledShutdown.stop_event)
+        except Exception as e:
+            logger.error(MODULE_NAME + '::ecs_alert_retention()::The following unexpected '
+                                       'exception occurred: ' + str(e) + "\n" + traceback.format_exc())
+
+        if controlledShutdown.wait(interval):
+            break
+
+
 def ecs_data_collection():
     global _ecsAuthentication
     global _logger
@@ -590,22 +1021,117 @@ def ecs_data_collection():
         while not _configuration:
             time.sleep(1)
 
+        threads = []
+
         # Now lets spin up a thread for each API call with it's own custom polling interval by iterating
         # through our module configuration
         for i, j in _configuration.modules_intervals.items():
             method = str(i)
             interval = str(j)
-            t = ECSDataCollection(method, _sqlLiteClient, _logger, _ecsManagementAPI, interval,
-                                  _configuration.tempfilepath)
+            t = ECSDataCollection(method, _sqlLiteClient, _logger, _ecsManagementAPI, interval)
             t.start()
+            threads.append(t)
 
         # Finally, spin up a thread to monitor the alerts table for alerts that have not been sent via SMTP
         t2 = ECSEmailAlerting('ecs_send_email_alerts()', _logger, _configuration, _smtpUtility, _sendGridUtility, _slackUtility)
         t2.start()
+        threads.append(t2)
+
+        # And one to archive delivered alerts once they pass the retention period
+        if _alertRetention is not None:
+            t3 = ECSAlertMaintenance('ecs_alert_retention()', _logger, _alertRetention,
+                                     float(_configuration.retention_interval_seconds))
+            t3.start()
+            threads.append(t3)
+
+        return threads
 
     except Exception as e:
         _logger.error(MODULE_NAME + '::ecs_data_collection()::A failure occurred during data collection. Cause: '
                       + str(e) + "\n" + traceback.format_exc())
+        return []
+
+
+def ecs_start():
+    """
+    Hands the database over to the store and creates the state shared by the collection and delivery threads
+    """
+    global _sqlLiteClient
+    global _sqlLiteStore
+    global _metrics
+    global _alertFilter
+    global _alertCorrelator
+    global _alertRetention
+    global _seenAlertIndex
+    global _collectionState
+    global controlledShutdown
+
+    # Close SqlLite connection object and hand the database over to the
+    # store that owns the single writer connection and the pooled readers
+    _sqlLiteClient.close()
+    _sqlLiteStore = SQLLiteStore(_configuration, _logger, _configuration.database_name,
+                                 int(_configuration.database_reader_connections))
+    _sqlLiteStore.start()
+
+    # Metrics are always recorded and optionally served over HTTP for scraping
+    _metrics = ECSAlertingMetrics(ECSMetricsRegistry(_logger))
+    _metrics.db_write_queue_depth.labels().set_function(_sqlLiteStore.write_queue.qsize)
+    if _configuration.metrics_enabled == 'yes':
+        _metrics.registry.start_server(_configuration.metrics_listen_address, int(_configuration.metrics_port))
+
+    # Compile the alert filters once for all collection workers
+    _alertFilter = ECSAlertFilter(_configuration.ecs_alert_severity_filter,
+                                  _configuration.ecs_alert_symptoms_filter,
+                                  _configuration.ecs_alert_filter_rules)
+
+    # Correlate repeated alerts into a single notification when configured
+    if _configuration.correlation_enabled == 'yes':
+        _alertCorrelator = ECSAlertCorrelator(_configuration.correlation_key_fields,
+                                              float(_configuration.correlation_window_seconds),
+                                              int(_configuration.correlation_max_groups),
+                                              float(_configuration.correlation_max_group_seconds))
+
+    # Archive delivered alerts past the retention period when configured
+    if _configuration.retention_enabled == 'yes':
+        _alertRetention = ECSAlertRetention(_configuration, _logger, _sqlLiteStore, _metrics)
+
+    # Warm the index of known alert ids so steady state polls skip the database
+    # and load the collection high-water marks of each ECS connection
+    _seenAlertIndex = SQLLiteAlertIndex(_logger, int(_configuration.seen_alert_cache_size))
+    db_utility = SQLLiteUtility(_configuration, _logger)
+    with _sqlLiteStore.reader() as sql_database:
+        _seenAlertIndex.warm(sql_database)
+        _collectionState = db_utility.load_collection_state(sql_database)
+
+    # Create object to support controlled shutdown
+    controlledShutdown = ECSDataCollectionShutdown(float(_configuration.shutdown_drain_seconds))
+
+
+def ecs_shutdown(threads):
+    """
+    Waits for the worker threads to drain within the shutdown deadline and closes all connections
+    """
+    try:
+        for t in threads:
+            t.join(controlledShutdown.remaining())
+            if t.is_alive():
+                _logger.warning(MODULE_NAME + '::ecs_shutdown()::Thread ' + t.name + ' did not finish within '
+                                'the shutdown deadline of ' + _configuration.shutdown_drain_seconds + ' seconds.')
+
+        if _smtpUtility is not None:
+            _smtpUtility.close_sessions()
+
+        for auth in _ecsAuthentication:
+            auth.close()
+
+        if _sqlLiteStore is not None:
+            _sqlLiteStore.close()
+
+        _metrics.registry.stop_server()
+
+    except Exception as e:
+        _logger.error(MODULE_NAME + '::ecs_shutdown()::The following unexpected '
+                                    'exception occurred: ' + str(e) + "\n" + traceback.format_exc())
 
 
 """
@@ -619,14 +1145,31 @@ if __name__ == "__main__":
                      'generated by one or more DELL EMC Elastic Cloud Storage (ECS) clusters.'
         parser = argparse.ArgumentParser(description=helpdetail)
         parser.add_argument("-c", "--clear", help="Clear the extracted alerts database table.", action="store_true")
-        parser.add_argument("-e", "--extracted", help="List all records in the extracted alerts database table.", action="store_true")
+        parser.add_argument("-e", "--extracted", help="List all records in the extracted alerts database table.  "
+                                                      "The status column tells unsent, sent, correlated alerts "
+                                                      "waiting on the alert they are correlated to, and failed "
+                                                      "alerts apart.", action="store_true")
         parser.add_argument("-s", "--sent", help="List records in the extracted "
                                                  "alerts database table that have been emailed.", action="store_true")
         parser.add_argument("-u", "--unsent", help="List records in the extracted "
                                                    "alerts database table that have NOT "
                                                    "been emailed.", action="store_true")
+        parser.add_argument("--failed", help="List records in the extracted alerts database table whose email "
+                                             "alerts were given up after too many failed attempts.",
+                            action="store_true")
+        parser.add_argument("-f", "--format", help="Output format of the listings.  The default is jsonl.",
+                            choices=['jsonl', 'csv'], default='jsonl')
+        parser.add_argument("-l", "--limit", help="List at most this many records.", type=int)
+        parser.add_argument("--since", help="Only list alerts stored on or after this UTC date or date and time, "
+                                            "for example 2019-06-01 or 2019-06-01T12:00:00.", type=listing_since)
+        parser.add_argument("--vdc", help="Only list alerts of this VDC.  May be repeated.", action="append")
+        parser.add_argument("--severity", help="Only list alerts of this severity.  May be repeated.",
+                            action="append", type=str.upper, choices=['INFO', 'WARNING', 'ERROR', 'CRITICAL'])
         args = parser.parse_args()
 
+        # Filters applied in the database to the listings
+        listingFilters = {'since': args.since, 'vdcs': args.vdc, 'severities': args.severity, 'limit': args.limit}
+
         # Dump out application path and setup application directories
         currentApplicationDirectory = os.getcwd()
         configFilePath = os.path.abspath(os.path.join(currentApplicationDirectory, "configuration", CONFIG_FILE))
@@ -659,11 +1202,8 @@ if __name__ == "__main__":
 
             # Process command line arguments
             if args.extracted:
-                alertsJson = list_alert_table(_sqlLiteClient)
-                if alertsJson:
-                    print(json.dumps(alertsJson, indent=4, separators=(',', ': '), sort_keys=True))
-                else:
-                    _logger.error(MODULE_NAME + '::ecs_email_alert::Returned 0 extracted alerts from the .')
+                if not list_alert_table(_sqlLiteClient, listingFilters, args.format):
+                    _logger.error(MODULE_NAME + '::ecs_email_alert::Returned 0 extracted alerts from the database.')
             else:
                 if args.clear:
                     print('ECS Email Alerting')
@@ -675,14 +1215,12 @@ if __name__ == "__main__":
                         clear_alert_table(_sqlLiteClient)
                 else:
                     if args.sent:
-                        sentAlertsJson = list_sent_alerts_table(_sqlLiteClient)
-                        if sentAlertsJson:
-                            print(json.dumps(sentAlertsJson, indent=4, separators=(',', ': '), sort_keys=True))
+                        list_sent_alerts_table(_sqlLiteClient, listingFilters, args.format)
                     else:
                         if args.unsent:
-                            unsentAlertsJson = list_unsent_alerts_table(_sqlLiteClient)
-                            if unsentAlertsJson:
-                                print(json.dumps(unsentAlertsJson, indent=4, separators=(',', ': '), sort_keys=True))
+                            list_unsent_alerts_table(_sqlLiteClient, listingFilters, args.format)
+                        elif args.failed:
+                            list_failed_alerts_table(_sqlLiteClient, listingFilters, args.format)
                         else:
                             continue_processing = False
 
@@ -702,22 +1240,19 @@ if __name__ == "__main__":
                             if continue_processing:
                                 # Perform normal alert monitoring processing
 
-                                # Close SqlLite connection object so the data
-                                # collection threads can each create their own
-                                _sqlLiteClient.close()
-
-                                # Create object to support controlled shutdown
-                                controlledShutdown = ECSDataCollectionShutdown()
+                                # Start the database store and the shared collection and delivery state
+                                ecs_start()
 
                                 # Initialize connection to ECS(s)
                                 if ecs_authenticate():
 
                                     # Launch ECS Data Collection polling threads
-                                    ecs_data_collection()
+                                    threads = ecs_data_collection()
 
-                                    # Check for shutdown
-                                    if controlledShutdown.kill_now:
-                                        print(MODULE_NAME + "__main__::Controlled shutdown completed.")
+                                    # Wait for shutdown to be requested then drain and close everything down
+                                    controlledShutdown.wait()
+                                    ecs_shutdown(threads)
+                                    print(MODULE_NAME + "__main__::Controlled shutdown completed.")
 
     except Exception as e:
         print(MODULE_NAME + '__main__::The following unexpected error occurred: '
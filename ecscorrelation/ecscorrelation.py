@@ -0,0 +1,111 @@
+"""
+DELL EMC ECS Alert Correlation Module.
+"""
+import collections
+import re
+import threading
+
+# Constants
+MODULE_NAME = "ecscorrelation"                                              # Module Name
+CORRELATION_KEY_FIELDS = ['vdc', 'severity', 'symptomCode', 'namespace', 'description']  # Supported key fields
+
+# Parts of a description that vary between occurrences of the same problem.  They are replaced so that,
+# for example, the same disk failure reported by different nodes produces the same key.
+DESCRIPTION_VARIABLE_PARTS = re.compile(r'\b(?:\d{1,3}(?:\.\d{1,3}){3}|[0-9a-f]{8,}(?:-[0-9a-f]{4,})*|\d+)\b',
+                                        re.IGNORECASE)
+DESCRIPTION_WHITESPACE = re.compile(r'\s+')
+
+
+class ECSCorrelationException(Exception):
+    pass
+
+
+def normalize_description(description):
+    """
+    Lower cases a description and replaces numbers, addresses, and identifiers with a placeholder
+    """
+    description = DESCRIPTION_VARIABLE_PARTS.sub('#', (description or '').lower())
+    return DESCRIPTION_WHITESPACE.sub(' ', description).strip()
+
+
+class ECSAlertCorrelator(object):
+    """
+    Groups alerts sharing a correlation key over a sliding time window.  The first alert of a group is the one
+    notified, later alerts of the group are correlated to it until no alert of the group was seen for the length
+    of the window or the group has been open for max_group_seconds, after which the next alert opens a new group
+    and is notified again.  At most max_groups groups are remembered, the least recently seen are forgotten first.
+    """
+    def __init__(self, key_fields, window_seconds, max_groups, max_group_seconds):
+        for field in key_fields:
+            if field not in CORRELATION_KEY_FIELDS:
+                raise ECSCorrelationException("Unsupported correlation key field " + field + ".  Supported fields "
+                                              "are " + ', '.join(CORRELATION_KEY_FIELDS) + ".")
+
+        self.key_fields = list(key_fields)
+        self.window_seconds = window_seconds
+        self.max_groups = max_groups
+        self.max_group_seconds = max_group_seconds
+        self.groups = collections.OrderedDict()
+        self.primaries = {}
+        self.lock = threading.Lock()
+
+    def key(self, alert, vdc):
+        values = []
+        for field in self.key_fields:
+            if field == 'vdc':
+                values.append(vdc)
+            elif field == 'description':
+                values.append(normalize_description(alert.get('description')))
+            else:
+                values.append(alert.get(field))
+        return tuple(values)
+
+    def joins(self, group, alert_time):
+        # group is [alertId of the first alert, time of the first alert, time of the last alert]
+        return alert_time - group[2] <= self.window_seconds and alert_time - group[1] <= self.max_group_seconds
+
+    def correlate(self, alert, vdc, alert_time):
+        """
+        Returns the alertId of the alert that opened the group of this alert, or None if the alert opens a
+        new group.  alert_time is the epoch time the alert was raised.
+        """
+        key = self.key(alert, vdc)
+
+        with self.lock:
+            group = self.groups.get(key)
+
+            if group is not None and self.joins(group, alert_time):
+                # Slide the window forward and keep the group as the most recently seen
+                group[2] = max(group[2], alert_time)
+                self.groups.move_to_end(key)
+                return group[0]
+
+            if group is not None:
+                del self.primaries[group[0]]
+
+            self.groups[key] = [alert.get('id'), alert_time, alert_time]
+            self.primaries[alert.get('id')] = key
+            self.groups.move_to_end(key)
+            while len(self.groups) > self.max_groups:
+                forgotten = self.groups.popitem(last=False)[1]
+                del self.primaries[forgotten[0]]
+
+        return None
+
+    def release(self, alert_id):
+        """
+        Forgets the group opened by alert_id so the next alert sharing its key opens a new group
+        """
+        with self.lock:
+            key = self.primaries.pop(alert_id, None)
+            if key is not None:
+                del self.groups[key]
+
+    def is_open(self, alert_id, now):
+        """
+        Returns True while later alerts can still join the group opened by alert_id.  Groups that are no longer
+        remembered are closed.
+        """
+        with self.lock:
+            key = self.primaries.get(alert_id)
+            return key is not None and self.joins(self.groups[key], now)
@@ -1,71 +1,234 @@
 """
 DELL EMC ECS API Data Collection Module.
 """
+import calendar
 import io
 import os
 import json
+import random
 import requests
+import threading
+import time
 import urllib3
-import uuid
+import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
 # Constants
 MODULE_NAME = "ecs"                  # Module Name
+DEFAULT_POOL_SIZE = 4                # Default number of kept-alive connections per ECS host
+DEFAULT_TIMEOUT = 60                 # Default connect and read timeout in seconds for ECS API calls
+DEFAULT_TOKEN_LIFETIME = 28800       # Default lifetime in seconds of an ECS authentication token
+TOKEN_REFRESH_MARGIN = 300           # Refresh tokens this many seconds before they expire
+ECS_START_TIME_FORMAT = '%Y-%m-%dT%H:%M'  # Format of the start_time filter of the /vdc/alerts call
 
 class ECSException(Exception):
     pass
 
 
+class ECSHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter that applies a default timeout to every request sent through an ECS session
+    """
+    def __init__(self, timeout, *args, **kwargs):
+        self.timeout = timeout
+        super(ECSHTTPAdapter, self).__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super(ECSHTTPAdapter, self).send(request, **kwargs)
+
+
+class ECSTokenCache(object):
+    """
+    Persists ECS authentication tokens per host in a file only readable by the owner
+    """
+    def __init__(self, cache_file, logger):
+        self.cache_file = cache_file
+        self.logger = logger
+        self.lock = threading.Lock()
+
+    def read_cache(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def write_cache(self, tokens):
+        # Write to a temporary file created with owner only permissions and swap it in place
+        temp_file = self.cache_file + '.tmp'
+        fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(tokens, f)
+        os.replace(temp_file, self.cache_file)
+        os.chmod(self.cache_file, 0o600)
+
+    def load(self, host):
+        """
+        Returns the cached token and the time it was obtained for a host or None
+        """
+        with self.lock:
+            entry = self.read_cache().get(host)
+
+        if entry is None:
+            return None
+        return entry['token'], float(entry['obtained'])
+
+    def store(self, host, token, obtained):
+        """
+        Saves the token for a host or removes it when token is None
+        """
+        try:
+            with self.lock:
+                tokens = self.read_cache()
+                if token is None:
+                    tokens.pop(host, None)
+                else:
+                    tokens[host] = {'token': token, 'obtained': obtained}
+                self.write_cache(tokens)
+        except Exception as e:
+            self.logger.error('ECSTokenCache::store()::Unable to update token cache file ' +
+                              self.cache_file + ': ' + str(e))
+
+
 class ECSAuthentication(object):
     """
     Stores ECS Authentication Information
     """
-    def __init__(self, protocol, host, username, password, port, logger):
+    def __init__(self, protocol, host, username, password, port, logger,
+                 pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, token_cache=None,
+                 token_lifetime=DEFAULT_TOKEN_LIFETIME):
         self.protocol = protocol
         self.host = host
         self.port = port
         self.username = username
         self.password = password
         self.logger = logger
-        self.logger.info('ECSAuthentication::Object instance initialization complete.')
         self.url = "{0}://{1}:{2}".format(self.protocol, self.host, self.port)
         self.token = ''
+        self.token_obtained = 0
+        self.token_cache = token_cache
+        self.token_lifetime = token_lifetime
+        self.token_lock = threading.Lock()
+
+        # Keep a pool of warm connections to this ECS so paginated polls and
+        # acknowledgements do not pay for a new TCP and TLS handshake on every call
+        self.session = requests.Session()
+        self.session.verify = False
+        adapter = ECSHTTPAdapter(timeout, pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
 
         # Disable warnings
         urllib3.disable_warnings()
 
+        self.logger.info('ECSAuthentication::Object instance initialization complete.')
+
+    def close(self):
+        """
+        Closes the pooled connections to ECS
+        """
+        self.session.close()
+
     def get_url(self):
         """
         Returns an ECS Management url made from protocol, host and port.
         """
         return self.url
 
+    def auth_headers(self, token, headers):
+        """
+        Returns a copy of headers carrying the token the way every ECS Management API call sends it
+        """
+        headers = dict(headers)
+        headers['X-SDS-AUTH-TOKEN'] = "'{0}'".format(token)
+        return headers
+
     def get_token(self):
         """
-        Returns an ECS Management token
+        Returns an ECS Management token refreshing it first if it is about to expire
         """
-        return self.tokens
+        token = self.token
+        if token and time.time() - self.token_obtained >= self.token_lifetime - TOKEN_REFRESH_MARGIN:
+            self.logger.info('ECSAuthentication::get_token()::Token for ' + self.host + ' is about to expire.  '
+                             'Refreshing.')
+            self.refresh(token)
+            token = self.token
+        return token
 
     def connect(self):
         """
-        Connect to ECS and if successful update token
+        Connect to ECS reusing a cached token if it is still valid otherwise login and update token
+        """
+        with self.token_lock:
+            if not self.load_cached_token():
+                self.login()
+
+    def refresh(self, stale_token):
+        """
+        Replace a token that expired or was rejected.  Only the first caller holding the stale token logs in,
+        everyone else waits on the lock and picks up the new token.
+        """
+        with self.token_lock:
+            if self.token and self.token != stale_token:
+                return
+            self.login()
+
+    def load_cached_token(self):
+        """
+        Adopt the cached token for this host if it is not about to expire and ECS still accepts it
         """
-        self.logger.info('ECSAuthentication::connect()::We are about to attempt to connect to ECS with the following URL : '
+        if self.token_cache is None:
+            return False
+
+        cached = self.token_cache.load(self.host)
+        if cached is None:
+            return False
+
+        token, obtained = cached
+        if time.time() - obtained >= self.token_lifetime - TOKEN_REFRESH_MARGIN:
+            return False
+
+        r = self.session.get("{0}/user/whoami".format(self.url),
+                             headers=self.auth_headers(token, {'Accept': 'application/json'}))
+        r.close()
+
+        if r.status_code != requests.codes.ok:
+            self.logger.info('ECSAuthentication::load_cached_token()::Cached token for ' + self.host +
+                             ' was rejected with a status code of ' + str(r.status_code))
+            return False
+
+        self.logger.info('ECSAuthentication::load_cached_token()::Reusing cached token for ' + self.host)
+        self.token = token
+        self.token_obtained = obtained
+        return True
+
+    def login(self):
+        """
+        Login to ECS and if successful update token
+        """
+        self.logger.info('ECSAuthentication::login()::We are about to attempt to connect to ECS with the following URL : '
                          + "{0}://{1}:{2}".format(self.protocol, self.host, self.port) + '/login')
 
-        r = requests.get("{0}://{1}:{2}".format(self.protocol, self.host, self.port) + '/login',
-                         verify=False, auth=HTTPBasicAuth(self.username, self.password))
+        r = self.session.get("{0}://{1}:{2}".format(self.protocol, self.host, self.port) + '/login',
+                             auth=HTTPBasicAuth(self.username, self.password))
 
-        self.logger.info('ECSAuthentication::connect()::login call to ECS returned with status code: ' + str(r.status_code))
+        self.logger.info('ECSAuthentication::login()::login call to ECS returned with status code: ' + str(r.status_code))
         if r.status_code == requests.codes.ok:
-            self.logger.debug('ECSAuthentication::connect()::login call returned with a 200 status code.  '
+            self.logger.debug('ECSAuthentication::login()::login call returned with a 200 status code.  '
                               'X-SDS-AUTH-TOKEN Header contains: ' + r.headers['X-SDS-AUTH-TOKEN'])
             self.token = r.headers['X-SDS-AUTH-TOKEN']
+            self.token_obtained = time.time()
         else:
-            self.logger.error('ECSManagementAPI::connect()::login call '
+            self.logger.error('ECSManagementAPI::login()::login call '
                              'failed with a status code of ' + str(r.status_code))
             self.token = None
 
+        if self.token_cache is not None:
+            self.token_cache.store(self.host, self.token, self.token_obtained)
+
 
 class ECSManagementAPI(object):
     """
@@ -78,14 +241,19 @@ class ECSManagementAPI(object):
         self.response_json = response_json
         self.response_xml = response_xml
         self.logger = logger
-        self.response_xml_file = None
-
-    def ecs_collect_alert_data(self, tempdir, marker):
+        self.next_marker = None
 
+    def ecs_collect_alert_data(self, marker, start_time=None):
+        """
+        Retrieve a page of unacknowledged alerts and return a generator that streams the alerts of the page
+        as they are parsed from the response.  The NextMarker of the page is available in next_marker once
+        the generator has been exhausted.  When start_time (epoch seconds) is provided only alerts raised
+        from that time on are requested.
+        """
         while True:
             # Perform ECS Dashboard Alert API Call
-            headers = {'X-SDS-AUTH-TOKEN': "'{0}'".format(self.authentication.token),
-                       'content-type': 'application/json'}
+            token = self.authentication.get_token()
+            headers = self.authentication.auth_headers(token, {'content-type': 'application/json'})
 
             # Setup parameters - WE ONLY TAKE ALERTS THAT HAVE NOT BEEN ACKNOWLEDGED
             if marker:
@@ -94,54 +262,86 @@ class ECSManagementAPI(object):
             else:
                 params_dict = {'acknowledged': False}
 
-            # Call API
-            r = requests.get("{0}//vdc/alerts".format(self.authentication.url),
-                             headers=headers, verify=False, params=params_dict)
+            if start_time is not None:
+                params_dict['start_time'] = time.strftime(ECS_START_TIME_FORMAT, time.gmtime(start_time))
+
+            # Call API and leave the response body on the wire so it can be parsed as it arrives
+            r = self.authentication.session.get("{0}//vdc/alerts".format(self.authentication.url),
+                                                headers=headers, params=params_dict, stream=True)
 
             if r.status_code == requests.codes.ok:
                 self.logger.debug('ECSManagementAPI::ecs_collect_alert_data()::/vdc/alerts call returned '
-                                  'with a 200 status code.  Text is: ' + r.text)
-
-                # Create a unique temp file and store the XML to it for processing
-                tempfile = os.path.abspath(os.path.join(tempdir, str(uuid.uuid4()) + ".xml"))
-                fo = open(tempfile, "w+")
-                fo.write(r.text)
+                                  'with a 200 status code.  Streaming response for parsing.')
 
-                # Close file
-                fo.close()
-
-                self.logger.debug('ECSManagementAPI::ecs_collect_alert_data()::r.text() contains: \n' + r.text)
-
-                self.response_xml_file = tempfile
-                break
+                self.next_marker = None
+                return self.ecs_parse_alert_data(r)
             else:
+                r.close()
+
                 if r.status_code == self.ecs_authentication_failure:
-                    # Attempt to re-authenticate
-                    self.authentication.token = None
-                    self.authentication.connect()
+                    # Attempt to re-authenticate unless another caller already replaced the token
+                    self.authentication.refresh(token)
 
                     if self.authentication.token is None:
                         self.logger.error('ECSManagementAPI::ecs_collect_alert_data()::Token Expired.  Unable '
                                           'to re-authenticate to ECS as configured.  Please validate and try again.')
                         raise ECSException("The ECS Data Collection Module was unable to re-authenticate.")
-                        break
                 else:
                     self.logger.error('ECSManagementAPI::ecs_collect_alert_data()::/vdc/alerts call failed '
                                       'with a status code of ' + str(r.status_code))
-                    self.response_xml_file = None
-                    break
+                    return None
+
+    def ecs_parse_alert_data(self, response):
+        """
+        Incrementally parse a /vdc/alerts response stream yielding a dictionary for each alert
+        """
+        try:
+            # Let urllib3 undo any content encoding while we read from the raw stream
+            response.raw.decode_content = True
+
+            context = ET.iterparse(response.raw, events=('start', 'end'))
+            event, root = next(context)
 
-        return self.response_xml_file
+            for event, element in context:
+                if event != 'end':
+                    continue
+
+                if element.tag == 'alert':
+                    yield dict((child.tag, child.text) for child in element)
+
+                    # Drop the alerts we have already handed out so memory stays flat on large pages
+                    root.clear()
+                elif element.tag == 'NextMarker':
+                    self.next_marker = element.text
+        finally:
+            response.close()
+
+    def ecs_alert_epoch(self, timestamp):
+        """
+        Converts an alert timestamp, either epoch milliseconds or an ISO 8601 UTC string, to epoch seconds.
+        Returns None if the timestamp can not be parsed.
+        """
+        if not timestamp:
+            return None
+
+        try:
+            if timestamp.isdigit():
+                return int(timestamp) / 1000.0
+
+            return calendar.timegm(time.strptime(timestamp[:19], '%Y-%m-%dT%H:%M:%S'))
+        except ValueError:
+            self.logger.debug('ECSManagementAPI::ecs_alert_epoch()::Unable to parse alert timestamp: ' + timestamp)
+            return None
 
     def ecs_acknowledge_alert(self, alert_id):
 
         while True:
             # Perform ECS Dashboard Alert Acknowledge API Call
-            headers = {'X-SDS-AUTH-TOKEN': "'{0}'".format(self.authentication.token),
-                       'content-type': 'application/json'}
+            token = self.authentication.get_token()
+            headers = self.authentication.auth_headers(token, {'content-type': 'application/json'})
 
-            r = requests.put("{0}//vdc/alerts/{1}/acknowledgment".format(self.authentication.url, alert_id),
-                             headers=headers, verify=False)
+            r = self.authentication.session.put("{0}//vdc/alerts/{1}/acknowledgment".format(
+                self.authentication.url, alert_id), headers=headers)
 
             if r.status_code == requests.codes.ok:
                 self.logger.debug('ECSManagementAPI::ecs_acknowledge_alert()::/vdc/alerts/acknowledgment call returned '
@@ -151,9 +351,8 @@ class ECSManagementAPI(object):
                 break
             else:
                 if r.status_code == self.ecs_authentication_failure:
-                    # Attempt to re-authenticate
-                    self.authentication.token = None
-                    self.authentication.connect()
+                    # Attempt to re-authenticate unless another caller already replaced the token
+                    self.authentication.refresh(token)
 
                     if self.authentication.token is None:
                         self.logger.error('ECSManagementAPI::ecs_collect_alert_data()::Token Expired.  Unable '
@@ -223,6 +422,37 @@ class ECSManagementAPI(object):
                         float(summary_dict[keys])
 
 
+class ECSAdaptivePollingSchedule(object):
+    """
+    Works out the polling interval of an ECS connection.  The interval shrinks toward the minimum while new alerts
+    keep arriving and grows toward the maximum while polls come back empty.
+    """
+
+    def __init__(self, min_interval, max_interval, speedup_factor, backoff_factor, jitter):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.speedup_factor = speedup_factor
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+
+    def initial_interval(self, interval):
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def next_interval(self, interval, new_alerts):
+        """
+        Returns the interval to use after a poll that found the given number of new alerts
+        """
+        if new_alerts:
+            return max(self.min_interval, interval * self.speedup_factor)
+        return min(self.max_interval, interval * self.backoff_factor)
+
+    def next_delay(self, interval):
+        """
+        Returns the interval with jitter applied so connections do not poll in lockstep
+        """
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+
 class ECSUtility(object):
     """
     ECS Utility Class
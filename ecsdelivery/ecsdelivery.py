@@ -0,0 +1,224 @@
+"""
+DELL EMC ECS Alert Delivery Module.
+"""
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+
+# Constants
+MODULE_NAME = "ecsdelivery"                  # Module Name
+COMMIT_BATCH_SIZE = 100                      # Number of delivered rows committed together
+ACK_MAX_ATTEMPTS = 5                         # Maximum number of attempts to acknowledge an alert
+ACK_RETRY_BACKOFF = 2                        # Initial backoff in seconds between acknowledgement attempts
+ACK_FLUSH_INTERVAL = 1                       # Longest acknowledged rows wait before being committed
+
+
+class ECSDeliveryException(Exception):
+    pass
+
+
+class ECSDeliveryEngine(object):
+    """
+    Sends notifications on a pool of workers limiting how many are in flight at once on each delivery channel.
+    Once the optional stop event is set notifications that have not started are dropped.
+    """
+    def __init__(self, logger, workers, channel_limits, commit_batch_size=COMMIT_BATCH_SIZE, stop_event=None):
+        self.logger = logger
+        self.stop_event = stop_event
+        self.workers = workers
+        self.commit_batch_size = commit_batch_size
+        self.channel_limits = channel_limits
+        self.channel_semaphores = dict((channel, threading.BoundedSemaphore(limit))
+                                       for channel, limit in channel_limits.items())
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ecs-deliver')
+
+    def deliver(self, channel, notifications, send, commit):
+        """
+        Sends each notification on the worker pool.  send is called on a worker with the rows of a notification
+        and returns the rows that were delivered.  commit is called on the calling thread with batches of
+        delivered rows.  Returns the number of delivered rows.
+        """
+        if channel not in self.channel_semaphores:
+            raise ECSDeliveryException("No concurrency limit is configured for delivery channel " + channel)
+
+        futures = [self.executor.submit(self.send_notification, channel, send, rows) for rows in notifications]
+
+        delivered = 0
+        pending = []
+        stopping = False
+        for future in as_completed(futures):
+            # On shutdown cancel the notifications that have not started and checkpoint what was delivered
+            if not stopping and self.stop_event is not None and self.stop_event.is_set():
+                stopping = True
+                cancelled = sum(1 for f in futures if f.cancel())
+                if cancelled:
+                    self.logger.info(MODULE_NAME + '::deliver()::Shutdown requested.  ' + str(cancelled) +
+                                     ' notifications left unsent for the next run.')
+
+            if future.cancelled():
+                continue
+
+            pending.extend(future.result())
+
+            # Commit the state of delivered rows in batches rather than one by one
+            if len(pending) >= self.commit_batch_size:
+                commit(pending)
+                delivered += len(pending)
+                pending = []
+
+        if pending:
+            commit(pending)
+            delivered += len(pending)
+
+        return delivered
+
+    def send_notification(self, channel, send, rows):
+        with self.channel_semaphores[channel]:
+            try:
+                return send(rows)
+            except Exception as e:
+                self.logger.error(MODULE_NAME + '::send_notification()::The following unhandled exception '
+                                                'occurred delivering via ' + channel + ': ' + str(e))
+                return []
+
+    def shutdown(self):
+        """
+        Waits for in-flight notifications and stops the workers
+        """
+        self.executor.shutdown(wait=True)
+
+
+class ECSAcknowledgementQueue(object):
+    """
+    Acknowledges delivered alerts on ECS in the background.  Each ECS host has its own queue drained by its own
+    workers and the alertCleared state of acknowledged rows is committed in batches.
+    """
+    def __init__(self, logger, ecsmanagementapi, store, db_utility, workers_per_host,
+                 commit_batch_size=COMMIT_BATCH_SIZE):
+        self.logger = logger
+        self.ecsmanagementapi = ecsmanagementapi
+        self.store = store
+        self.db_utility = db_utility
+        self.workers_per_host = workers_per_host
+        self.commit_batch_size = commit_batch_size
+        self.host_queues = dict((host, queue.Queue()) for host in ecsmanagementapi)
+        self.acknowledged = queue.Queue()
+        self.retries = []
+        self.retries_lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        for host, host_queue in self.host_queues.items():
+            for i in range(self.workers_per_host):
+                t = threading.Thread(target=self.drain, args=(host, host_queue), daemon=True,
+                                     name='ecs-ack-' + host + '-' + str(i))
+                t.start()
+                self.threads.append(t)
+
+        self.committer = threading.Thread(target=self.commit_acknowledged, daemon=True, name='ecs-ack-commit')
+        self.committer.start()
+
+    def put(self, rows):
+        """
+        Queues delivered alert rows for acknowledgement on the ECS they came from
+        """
+        for row in rows:
+            host_queue = self.host_queues.get(row['managementIp'])
+            if host_queue is None:
+                # The ECS connection the alert came from is no longer configured so it cannot be acknowledged
+                self.logger.warning(MODULE_NAME + '::put()::Skipping acknowledgement of alert ' + str(row['alertId']) +
+                                    ' from ' + str(row['managementIp']) + ' which is not a configured ECS connection.')
+                continue
+            host_queue.put((row['id'], row['alertId'], 0))
+
+    def depth(self):
+        """
+        Returns the number of alerts waiting to be acknowledged
+        """
+        return sum(host_queue.qsize() for host_queue in self.host_queues.values())
+
+    def drain(self, host, host_queue):
+        while True:
+            item = host_queue.get()
+
+            # A None item is our signal to stop
+            if item is None:
+                break
+
+            row_id, alert_id, attempts = item
+
+            try:
+                acknowledged = self.ecsmanagementapi[host].ecs_acknowledge_alert(alert_id)
+            except Exception as e:
+                self.logger.error(MODULE_NAME + '::drain()::The following unhandled exception occurred '
+                                                'acknowledging alert ' + alert_id + ' on ' + host + ': ' + str(e))
+                acknowledged = False
+
+            if acknowledged:
+                self.acknowledged.put(row_id)
+            else:
+                if attempts + 1 < ACK_MAX_ATTEMPTS:
+                    # Put the alert back on the queue once the backoff has passed without holding up this worker
+                    retry = threading.Timer(ACK_RETRY_BACKOFF * 2 ** attempts, host_queue.put,
+                                            args=((row_id, alert_id, attempts + 1),))
+                    retry.daemon = True
+                    with self.retries_lock:
+                        self.retries = [timer for timer in self.retries if timer.is_alive()]
+                        self.retries.append(retry)
+                    retry.start()
+                else:
+                    self.logger.error(MODULE_NAME + '::drain()::Giving up acknowledging alert ' + alert_id +
+                                      ' on ' + host + ' after ' + str(ACK_MAX_ATTEMPTS) + ' attempts.')
+
+    def commit_acknowledged(self):
+        row_ids = []
+        stopping = False
+
+        while not stopping:
+            try:
+                row_id = self.acknowledged.get(timeout=ACK_FLUSH_INTERVAL)
+                if row_id is None:
+                    stopping = True
+                else:
+                    row_ids.append(row_id)
+            except queue.Empty:
+                pass
+
+            # Commit once we have a full batch, when the queue went quiet, or when we are stopping
+            if row_ids and (stopping or len(row_ids) >= self.commit_batch_size or self.acknowledged.empty()):
+                try:
+                    self.store.write(functools.partial(self.db_utility.mark_alerts_cleared, row_ids=row_ids))
+                except Exception as e:
+                    self.logger.error(MODULE_NAME + '::commit_acknowledged()::Unable to record ' +
+                                      str(len(row_ids)) + ' acknowledged alerts: ' + str(e))
+                row_ids = []
+
+    def close(self, timeout=None):
+        """
+        Stops the workers once the queued acknowledgements are processed and commits the remaining rows.
+        Acknowledgements still queued when the timeout passes are abandoned.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+
+        # Alerts waiting on a retry backoff are not retried during shutdown
+        with self.retries_lock:
+            for timer in self.retries:
+                timer.cancel()
+
+        for host, host_queue in self.host_queues.items():
+            for i in range(self.workers_per_host):
+                host_queue.put(None)
+
+        for t in self.threads:
+            t.join(None if deadline is None else max(0, deadline - time.time()))
+
+        if any(t.is_alive() for t in self.threads):
+            self.logger.warning(MODULE_NAME + '::close()::Abandoning the queued acknowledgements '
+                                            'at the shutdown deadline.')
+
+        # Always commit the alerts that were acknowledged
+        self.acknowledged.put(None)
+        self.committer.join()
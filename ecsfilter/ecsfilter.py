@@ -0,0 +1,113 @@
+"""
+DELL EMC ECS Alert Filter Module.
+"""
+import re
+
+# Constants
+MODULE_NAME = "ecsfilter"                                                # Module Name
+RULE_SET_FIELDS = ['severity', 'symptomCode', 'namespace', 'vdc']        # Rule fields matched against a list
+RULE_PATTERN_FIELDS = ['description']                                    # Rule fields matched with a regex
+
+
+class ECSFilterException(Exception):
+    pass
+
+
+def all_of(predicates):
+    """
+    Folds predicates into one that is true when all of them are.  Chained closures avoid the generator
+    overhead of all() on the per alert path.
+    """
+    if not predicates:
+        return lambda alert, vdc: True
+
+    combined = predicates[-1]
+    for predicate in reversed(predicates[:-1]):
+        combined = (lambda first, rest: lambda alert, vdc: first(alert, vdc) and rest(alert, vdc))(predicate,
+                                                                                                   combined)
+    return combined
+
+
+def any_of(predicates):
+    """
+    Folds predicates into one that is true when any of them is
+    """
+    combined = predicates[-1]
+    for predicate in reversed(predicates[:-1]):
+        combined = (lambda first, rest: lambda alert, vdc: first(alert, vdc) or rest(alert, vdc))(predicate,
+                                                                                                  combined)
+    return combined
+
+
+def compile_set_condition(field, values):
+    """
+    Returns a predicate checking the field of an alert is one of the values
+    """
+    if field == 'severity':
+        allowed = frozenset(str(value).upper() for value in values)
+        return lambda alert, vdc: (alert.get('severity') or '').upper() in allowed
+    if field == 'vdc':
+        allowed = frozenset(str(value) for value in values)
+        return lambda alert, vdc: vdc in allowed
+
+    allowed = frozenset(str(value) for value in values)
+    return lambda alert, vdc: alert.get(field) in allowed
+
+
+def compile_pattern_condition(field, pattern):
+    """
+    Returns a predicate checking the field of an alert matches the regular expression
+    """
+    try:
+        search = re.compile(pattern).search
+    except re.error as e:
+        raise ECSFilterException("The " + field + " pattern " + pattern + " is not a valid regular expression: " +
+                                 str(e))
+    return lambda alert, vdc: search(alert.get(field) or '') is not None
+
+
+def compile_rule(rule):
+    """
+    Compiles a rule into a predicate that is true when every condition of the rule matches
+    """
+    if not isinstance(rule, dict) or not rule:
+        raise ECSFilterException("An alert filter rule must be a non-empty object.")
+
+    conditions = []
+    for field, value in rule.items():
+        if field in RULE_SET_FIELDS:
+            if not isinstance(value, list) or not value:
+                raise ECSFilterException("The " + field + " of an alert filter rule must be a non-empty list.")
+            conditions.append(compile_set_condition(field, value))
+        elif field in RULE_PATTERN_FIELDS:
+            conditions.append(compile_pattern_condition(field, str(value)))
+        else:
+            raise ECSFilterException("Unsupported alert filter rule field " + field + ".  Supported fields are " +
+                                     ', '.join(RULE_SET_FIELDS + RULE_PATTERN_FIELDS) + ".")
+
+    return all_of(conditions)
+
+
+class ECSAlertFilter(object):
+    """
+    Compiles the configured severity and symptom code filters and filter rules once into a single predicate.
+    An alert is kept when its severity and symptom code pass the lists and, if any rules are configured,
+    at least one rule matches.  An empty list or rule set lets every alert through.
+    """
+    def __init__(self, severity_filter=None, symptoms_filter=None, rules=None):
+        predicates = []
+
+        if severity_filter:
+            predicates.append(compile_set_condition('severity', severity_filter))
+        if symptoms_filter:
+            predicates.append(compile_set_condition('symptomCode', symptoms_filter))
+        if rules:
+            predicates.append(any_of([compile_rule(rule) for rule in rules]))
+
+        self.predicate = all_of(predicates)
+
+    def matches(self, alert, vdc):
+        """
+        Returns True if an alert, a dictionary of the alert fields returned by ECS, from the VDC should be kept
+        """
+        return self.predicate(alert, vdc)
@@ -0,0 +1,288 @@
+"""
+DELL EMC ECS Metrics Module.
+"""
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+# Constants
+MODULE_NAME = "ecsmetrics"                                               # Module Name
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'                # Prometheus text exposition format
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Default latency buckets
+
+
+class ECSMetricsException(Exception):
+    pass
+
+
+def format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in pairs]
+    return '{' + ','.join(name + '="' + value + '"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class ECSMetric(object):
+    """
+    Base of all metrics.  Each set of label values is its own series kept in a dictionary guarded by one lock.
+    """
+    metric_type = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *label_values):
+        """
+        Returns the series of this metric with the given label values
+        """
+        if len(label_values) != len(self.label_names):
+            raise ECSMetricsException('Metric ' + self.name + ' expects labels ' + ', '.join(self.label_names))
+        return ECSMetricSeries(self, tuple(str(value) for value in label_values))
+
+    def render(self):
+        lines = ['# HELP ' + self.name + ' ' + self.documentation, '# TYPE ' + self.name + ' ' + self.metric_type]
+        with self.lock:
+            series = sorted(self.series.items())
+        for label_values, value in series:
+            lines.extend(self.render_series(label_values, value))
+        return lines
+
+    def render_series(self, label_values, value):
+        return [self.name + format_labels(self.label_names, label_values) + ' ' + format_value(value)]
+
+
+class ECSMetricSeries(object):
+    """
+    One labelled series of a metric
+    """
+    def __init__(self, metric, label_values):
+        self.metric = metric
+        self.label_values = label_values
+
+    def inc(self, amount=1):
+        self.metric.inc(self.label_values, amount)
+
+    def set(self, value):
+        self.metric.set(self.label_values, value)
+
+    def set_function(self, function):
+        self.metric.set_function(self.label_values, function)
+
+    def observe(self, value):
+        self.metric.observe(self.label_values, value)
+
+
+class ECSCounter(ECSMetric):
+    """
+    Value that only goes up
+    """
+    metric_type = 'counter'
+
+    def inc(self, label_values=(), amount=1):
+        with self.lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+
+class ECSGauge(ECSMetric):
+    """
+    Value that goes up and down.  A gauge may instead be given a function that is called on each scrape.
+    """
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, label_names=()):
+        super(ECSGauge, self).__init__(name, documentation, label_names)
+        self.functions = {}
+
+    def set(self, label_values=(), value=0):
+        with self.lock:
+            self.series[label_values] = value
+
+    def set_function(self, label_values=(), function=None):
+        with self.lock:
+            self.functions[label_values] = function
+
+    def render(self):
+        with self.lock:
+            functions = list(self.functions.items())
+        for label_values, function in functions:
+            try:
+                value = function()
+            except Exception:
+                continue
+            with self.lock:
+                self.series[label_values] = value
+        return super(ECSGauge, self).render()
+
+
+class ECSHistogram(ECSMetric):
+    """
+    Distribution of observed values counted in cumulative buckets
+    """
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super(ECSHistogram, self).__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, label_values=(), value=0):
+        # Only the bucket the value falls in is counted here.  Buckets are made cumulative when rendered.
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = ['# HELP ' + self.name + ' ' + self.documentation, '# TYPE ' + self.name + ' ' + self.metric_type]
+        with self.lock:
+            series = sorted((label_values, (list(counts), total, count))
+                            for label_values, (counts, total, count) in self.series.items())
+
+        for label_values, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(self.name + '_bucket' +
+                             format_labels(self.label_names, label_values, ('le', format_value(bound))) +
+                             ' ' + str(cumulative))
+            lines.append(self.name + '_sum' + format_labels(self.label_names, label_values) + ' ' +
+                         format_value(total))
+            lines.append(self.name + '_count' + format_labels(self.label_names, label_values) + ' ' + str(count))
+
+        return lines
+
+
+class ECSMetricsRegistry(object):
+    """
+    Holds the metrics of the application and serves them in the Prometheus text format
+    """
+    def __init__(self, logger):
+        self.logger = logger
+        self.metrics = []
+        self.lock = threading.Lock()
+        self.server = None
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(ECSCounter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self.register(ECSGauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.register(ECSHistogram(name, documentation, label_names, buckets))
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text format
+        """
+        with self.lock:
+            metrics = list(self.metrics)
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def start_server(self, address, port):
+        """
+        Serves the metrics on /metrics from a background thread
+        """
+        registry = self
+
+        class ECSMetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                registry.logger.debug(MODULE_NAME + '::ECSMetricsHandler()::' + (format % args))
+
+        self.server = ThreadingHTTPServer((address, port), ECSMetricsHandler)
+        self.server.daemon_threads = True
+        t = threading.Thread(target=self.server.serve_forever, name='ecs-metrics', daemon=True)
+        t.start()
+
+        self.logger.info(MODULE_NAME + '::start_server()::Serving metrics on http://' + address + ':' +
+                         str(port) + '/metrics')
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class ECSAlertingMetrics(object):
+    """
+    The metrics recorded by ECS alerting
+    """
+    def __init__(self, registry):
+        self.registry = registry
+
+        # Collection
+        self.poll_duration = registry.histogram('ecs_alert_poll_duration_seconds',
+                                                'Time taken to walk all alert pages of a VDC.', ('vdc',))
+        self.page_duration = registry.histogram('ecs_alert_page_duration_seconds',
+                                                'Time taken to request and parse one alert page.', ('vdc',))
+        self.parse_duration = registry.histogram('ecs_alert_page_parse_seconds',
+                                                 'Time taken to stream and parse the alerts of one page.', ('vdc',))
+        self.pages = registry.counter('ecs_alert_pages_total', 'Alert pages retrieved from ECS.', ('vdc',))
+        self.alerts_stored = registry.counter('ecs_alerts_stored_total', 'New alerts stored in the database.',
+                                              ('vdc',))
+        self.collection_errors = registry.counter('ecs_alert_collection_errors_total',
+                                                  'Alert polls that failed or were cut short.', ('vdc',))
+
+        # Database
+        self.db_write_duration = registry.histogram('ecs_db_write_seconds',
+                                                    'Time taken for a write batch to be committed.', ('operation',))
+        self.db_write_queue_depth = registry.gauge('ecs_db_write_queue_depth',
+                                                   'Write batches waiting for the database writer.')
+        self.alerts_archived = registry.counter('ecs_alerts_archived_total', 'Delivered alerts moved out of the '
+                                                                             'database by the retention policy.',
+                                                ('format',))
+
+        # Delivery
+        self.unsent_alerts = registry.gauge('ecs_unsent_alerts', 'Alerts found waiting for delivery on the '
+                                                                 'last delivery cycle.')
+        self.acknowledgement_queue_depth = registry.gauge('ecs_acknowledgement_queue_depth',
+                                                          'Delivered alerts waiting to be acknowledged on ECS.')
+        self.send_duration = registry.histogram('ecs_notification_send_seconds',
+                                                'Time taken to send one notification.', ('channel',))
+        self.alerts_delivered = registry.counter('ecs_alerts_delivered_total', 'Alerts delivered.', ('channel',))
+        self.alerts_failed = registry.counter('ecs_alerts_failed_total', 'Alerts given up on after repeatedly '
+                                                                         'failing delivery.', ('channel',))
+        self.send_errors = registry.counter('ecs_notification_errors_total',
+                                            'Notifications that failed to deliver all of their alerts.',
+                                            ('channel',))
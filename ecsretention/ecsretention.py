@@ -0,0 +1,114 @@
+"""
+DELL EMC ECS Alert Retention Module.
+"""
+import datetime
+import functools
+import gzip
+import json
+import os
+import time
+
+from ecssqllite.ecssqllite import SQLLiteUtility
+
+# Constants
+MODULE_NAME = "ecsretention"                       # Module Name
+ARCHIVE_FORMATS = ['database', 'jsonl']            # Supported archive formats
+SEGMENT_PREFIX = 'ecsalerts-'                      # File name prefix of compressed JSONL archive segments
+SEGMENT_SUFFIX = '.jsonl.gz'                       # File name suffix of compressed JSONL archive segments
+
+
+class ECSRetentionException(Exception):
+    pass
+
+
+class ECSAlertRetention(object):
+    """
+    Moves delivered and acknowledged alerts older than the retention period out of the extracted alerts table,
+    either into an archive database or into compressed JSONL segments, and then returns the freed pages to the
+    file system.  Each batch is archived and then deleted in separate transactions on the writer so collection and
+    delivery writes are never held up for long.  A batch interrupted between the two is archived again on the next
+    run.
+    """
+    def __init__(self, config, logger, store, metrics=None):
+        if config.retention_archive_format not in ARCHIVE_FORMATS:
+            raise ECSRetentionException("Unsupported archive format " + config.retention_archive_format +
+                                        ".  Supported formats are " + ', '.join(ARCHIVE_FORMATS) + ".")
+
+        self.config = config
+        self.logger = logger
+        self.store = store
+        self.metrics = metrics
+        self.db_utility = SQLLiteUtility(config, logger)
+        self.retention_days = int(config.retention_days)
+        self.batch_size = int(config.retention_batch_size)
+        self.vacuum_pages = int(config.retention_vacuum_pages)
+        self.archive_format = config.retention_archive_format
+        self.archive_file = os.path.abspath(config.retention_archive_database_name + '.db')
+        self.archive_directory = os.path.abspath(config.retention_archive_directory)
+
+    def segment_file(self):
+        """
+        Returns the compressed JSONL segment archived rows are appended to today
+        """
+        return os.path.join(self.archive_directory, SEGMENT_PREFIX +
+                            datetime.datetime.utcnow().strftime("%Y%m%d") + SEGMENT_SUFFIX)
+
+    def write_segment(self, rows):
+        """
+        Appends a batch of rows to the current segment as a new gzip member and makes sure it reached the disk
+        """
+        if not os.path.isdir(self.archive_directory):
+            os.makedirs(self.archive_directory)
+
+        data = ''.join(json.dumps(dict(row), sort_keys=True) + '\n' for row in rows).encode('utf-8')
+        with open(self.segment_file(), 'ab') as segment:
+            segment.write(gzip.compress(data))
+            segment.flush()
+            os.fsync(segment.fileno())
+
+    def write(self, operation, name, **kwargs):
+        start = time.time()
+        value = self.store.write(functools.partial(operation, **kwargs))
+        if self.metrics is not None:
+            self.metrics.db_write_duration.labels(name).observe(time.time() - start)
+        return value
+
+    def run(self, stop_event=None):
+        """
+        Archives every delivered and acknowledged alert older than the retention period in batches stopping early
+        once the stop event is set.  Returns the number of alerts archived.
+        """
+        cutoff = (datetime.datetime.utcnow() -
+                  datetime.timedelta(days=self.retention_days)).strftime("%Y-%m-%dT%H:%M:%S")
+        archived = 0
+        after_id = 0
+
+        while stop_event is None or not stop_event.is_set():
+            with self.store.reader() as sql_database:
+                rows = self.db_utility.select_expired_alerts(sql_database, cutoff, after_id, self.batch_size)
+
+            if not rows:
+                break
+
+            row_ids = [row['id'] for row in rows]
+            if self.archive_format == 'database':
+                self.write(self.db_utility.archive_alerts, 'archive_alerts', archive_file=self.archive_file,
+                           row_ids=row_ids)
+            else:
+                self.write_segment(rows)
+            self.write(self.db_utility.delete_alerts, 'delete_alerts', row_ids=row_ids)
+
+            archived += len(row_ids)
+            after_id = row_ids[-1]
+            if self.metrics is not None:
+                self.metrics.alerts_archived.labels(self.archive_format).inc(len(row_ids))
+
+        if archived:
+            freed = self.write(self.db_utility.incremental_vacuum, 'incremental_vacuum', pages=self.vacuum_pages)
+            self.write(self.db_utility.checkpoint, 'checkpoint')
+            self.logger.info(MODULE_NAME + '::run()::Archived ' + str(archived) + ' alerts created before ' +
+                             cutoff + ' and freed ' + str(freed) + ' database pages.')
+        else:
+            self.logger.debug(MODULE_NAME + '::run()::No alerts created before ' + cutoff + ' to archive.')
+
+        return archived
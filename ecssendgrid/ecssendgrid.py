@@ -5,10 +5,15 @@ import http.client
 import ecssendgrid
 import sendgrid
 from sendgrid.helpers.mail import *
+from python_http_client.exceptions import HTTPError
 import time
 
 # Constants
 MODULE_NAME = "ecssendgrid"                  # Module Name
+MAX_ATTEMPTS = 5                             # Maximum number of attempts to send a request
+RETRY_BACKOFF = 1                            # Initial backoff in seconds between attempts
+MAX_BACKOFF = 60                             # Longest we wait between attempts
+MAX_RECIPIENTS_PER_REQUEST = 1000            # Most recipients SendGrid accepts across a request's personalizations
 
 
 class ECSSendGridException(Exception):
@@ -35,7 +40,8 @@ class ECSSendGridUtility(object):
                 time.sleep(1)
 
             # Get SendGrid API Client
-            self.send_grid_client = sendgrid.SendGridAPIClient(apikey=self.config.send_grid_api_key)
+            self.send_grid_client = sendgrid.SendGridAPIClient(apikey=self.config.send_grid_api_key,
+                                                               host=self.config.send_grid_api_host)
 
             return connected
 
@@ -45,57 +51,155 @@ class ECSSendGridUtility(object):
             connected = False
             return connected
 
+    def send_grid_severity_text(self, severity):
+        if severity == 'WARNING':
+            severity_text = """<font color="orange">""" + severity + "</font>"
+        else:
+            if severity == 'ERROR':
+                severity_text = """<font color="red">""" + severity + "</font>"
+            else:
+                if severity == 'CRITICAL':
+                    severity_text = """<font color="red">""" + severity + "</font>"
+                else:
+                    severity_text = """<font color="black">""" + severity + "</font>"
+
+        return severity_text
+
+    def send_grid_post(self, mail):
+        """
+        Sends a mail request to SendGrid retrying with backoff when SendGrid is throttling us or failing.
+        Returns True once SendGrid accepted the request.
+        """
+        backoff = RETRY_BACKOFF
+
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                self.send_grid_client.client.mail.send.post(request_body=mail.get())
+                return True
+            except HTTPError as e:
+                status_code = getattr(e, 'status_code', 0)
+                if status_code != 429 and status_code < 500:
+                    self.logger.error(MODULE_NAME + '::send_grid_post()::SendGrid rejected the request with a '
+                                                    'status code of ' + str(status_code))
+                    return False
+
+                # Wait until the rate limit resets if SendGrid told us when otherwise back off exponentially
+                wait = backoff
+                headers = getattr(e, 'headers', None) or {}
+                reset = headers.get('X-RateLimit-Reset')
+                if reset and str(reset).isdigit():
+                    wait = min(max(float(reset) - time.time(), 0), MAX_BACKOFF)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+                self.logger.info(MODULE_NAME + '::send_grid_post()::SendGrid returned a status code of ' +
+                                 str(status_code) + '.  Retrying in ' + str(wait) + ' seconds.')
+                time.sleep(wait)
+
+        self.logger.error(MODULE_NAME + '::send_grid_post()::SendGrid request failed after ' +
+                          str(MAX_ATTEMPTS) + ' attempts.')
+        return False
+
+    def send_grid_send_emails(self, rows):
+        """
+        Sends one email per alert row packing many alerts into each SendGrid request.  Each alert is its own
+        personalization whose substitutions fill in the shared email body.  Returns the rows that were accepted.
+        """
+        sent_rows = []
+
+        try:
+            while not self.config:
+                time.sleep(1)
+
+            # Every personalization carries all recipients so the recipients per request bound the batch too
+            to_emails = [address.strip() for address in self.config.send_grid_toemail.split(',')]
+            batch_size = max(1, min(int(self.config.send_grid_alerts_per_request),
+                                    MAX_RECIPIENTS_PER_REQUEST // len(to_emails)))
+
+            for i in range(0, len(rows), batch_size):
+                batch = rows[i:i + batch_size]
+
+                mail = Mail()
+                mail.from_email = Email(self.config.send_grid_fromemail)
+                mail.subject = "Elastic Cloud Storage (ECS) Alert Received"
+                mail.add_content(Content("text/html", "<html><body><h1>" +
+                                         "Elastic Cloud Storage (ECS) Received Alert from "
+                                         "Virtual Data Center: -vdc-</h1><br>" +
+                                         "Management IP: -managementIp-</h1><br>" +
+                                         "Severity: -severity-<br>" +
+                                         "Symptom Code : -symptomCode-<br>" +
+                                         "Description : -description-<br>" +
+                                         "Timestamp : -timestamp-<br>" +
+                                         "Occurrences : -occurrences-<br>" +
+                                         "</body></html>"))
+
+                for row in batch:
+                    personalization = Personalization()
+                    for to_email in to_emails:
+                        personalization.add_to(Email(to_email))
+                    personalization.add_substitution(Substitution('-vdc-', str(row['vdc'])))
+                    personalization.add_substitution(Substitution('-managementIp-', str(row['managementIp'])))
+                    personalization.add_substitution(Substitution('-severity-',
+                                                                  self.send_grid_severity_text(str(row['severity']))))
+                    personalization.add_substitution(Substitution('-symptomCode-', str(row['symptomCode'])))
+                    personalization.add_substitution(Substitution('-description-', str(row['description'])))
+                    personalization.add_substitution(Substitution('-timestamp-', str(row['alertTimestamp'])))
+                    personalization.add_substitution(Substitution('-occurrences-', str(row['occurrences'])))
+                    mail.add_personalization(personalization)
+
+                if self.send_grid_post(mail):
+                    sent_rows.extend(batch)
+
+            return sent_rows
+
+        except Exception as e:
+            self.logger.error(MODULE_NAME + '::send_grid_send_emails()::The following '
+                                            'unhandled exception occurred: ' + str(e))
+            return sent_rows
+
     def send_grid_send_email(self, row):
         """
         Sends an email via SendGrid
         """
-        try:
-            sent = True
+        return len(self.send_grid_send_emails([row])) == 1
 
+    def send_grid_send_digest(self, vdc, severity, rows):
+        """
+        Sends one email via SendGrid for all alert rows of a VDC with the same severity
+        """
+        try:
             while not self.config:
                 time.sleep(1)
 
-            # Grab values from row parameter
-            vdc = row[1]
-            management_ip = row[2]
-            description = row[5]
-            severity = row[7]
-            symtomcode = row[8]
-            timestamp = row[9]
+            # Alerts raised without a severity are grouped together under UNKNOWN
+            severity = str(severity or 'UNKNOWN')
 
             from_email = Email(self.config.send_grid_fromemail)
             to_email = Email(self.config.send_grid_toemail)
-            subject = "Elastic Cloud Storage (ECS) Alert Received"
+            subject = "Elastic Cloud Storage (ECS) Alert Digest: " + str(len(rows)) + " " + severity + \
+                      " alerts from Virtual Data Center " + vdc
 
-            if severity == 'WARNING':
-                severity_text = """<font color="orange">""" + severity + "</font>"
-            else:
-                if severity == 'ERROR':
-                    severity_text = """<font color="red">""" + severity + "</font>"
-                else:
-                    if severity == 'CRITICAL':
-                        severity_text = """<font color="red">""" + severity + "</font>"
-                    else:
-                        severity_text = """<font color="black">""" + severity + "</font>"
+            # Build one table row per alert
+            alert_rows = ""
+            for row in rows:
+                alert_rows += "<tr><td>" + str(row['alertTimestamp']) + "</td><td>" + str(row['managementIp']) + \
+                              "</td><td>" + str(row['symptomCode']) + "</td><td>" + str(row['namespace'] or '') + \
+                              "</td><td>" + str(row['description']) + "</td><td>" + str(row['occurrences']) + \
+                              "</td></tr>"
 
             email_content = Content("text/html", "<html><body><h1>" +
-                                    "Elastic Cloud Storage (ECS) Received Alert from "
-                                    "Virtual Data Center: " + vdc + "</h1><br>" +
-                                    "Management IP: " + management_ip + "</h1><br>" +
-                                    "Severity: " + severity_text + "<br>" +
-                                    "Symptom Code : " + symtomcode + "<br>" +
-                                    "Description : " + description + "<br>" +
-                                    "Timestamp : " + timestamp + "<br>" +
-                                    "</body></html>")
+                                    "Elastic Cloud Storage (ECS) Received " + str(len(rows)) + " " + severity +
+                                    " Alerts from Virtual Data Center: " + vdc + "</h1><br>" +
+                                    "<table border=\"1\" cellpadding=\"4\" cellspacing=\"0\">" +
+                                    "<tr><th>Timestamp</th><th>Management IP</th><th>Symptom Code</th>" +
+                                    "<th>Namespace</th><th>Description</th><th>Occurrences</th></tr>" +
+                                    alert_rows +
+                                    "</table></body></html>")
 
             mail = Mail(from_email, subject, to_email, email_content)
-            self.send_grid_client.client.mail.send.post(request_body=mail.get())
 
-            return sent
+            return self.send_grid_post(mail)
 
         except Exception as e:
-            self.logger.error(MODULE_NAME + '::send_grid_send_email()::The following '
-                                            'unhandled exception occurred: ' + e.message)
-            sent = False
-            return sent
-
+            self.logger.error(MODULE_NAME + '::send_grid_send_digest()::The following '
+                                            'unhandled exception occurred: ' + str(e))
+            return False
@@ -4,16 +4,64 @@ DELL EMC ECS Slack Delivery Module
 
 import json
 import requests
+import threading
 import time
+from requests.adapters import HTTPAdapter
 
 # Constants
 MODULE_NAME = "ecsslack"  # Module Name
+DIGEST_MAX_LINES = 50     # Maximum number of alerts listed in a digest message
+MAX_ATTEMPTS = 5          # Maximum number of attempts to post a message
+RETRY_BACKOFF = 1         # Initial backoff in seconds when Slack fails without a Retry-After header
 
 
 class ECSSlackException(Exception):
     pass
 
 
+class ECSSlackRateLimiter(object):
+    """
+    Token bucket limiting how fast messages are posted to the webhook
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a message may be posted
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.updated:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    # Slack asked us to back off
+                    wait = self.updated - now
+
+            time.sleep(wait)
+
+    def block(self, seconds):
+        """
+        Empties the bucket and stops refilling it for the number of seconds Slack asked us to wait
+        """
+        with self.lock:
+            self.tokens = 0
+            self.updated = max(self.updated, time.monotonic() + seconds)
+
+
 class ECSSlackUtility(object):
     """
     Stores ECS Slack Delivery Functions
@@ -23,95 +71,189 @@ class ECSSlackUtility(object):
         self.config = config
         self.logger = logger
 
-    def slack_send_message(self, row):
+        # Reuse warm connections to the webhook
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.headers.update({'content-type': 'application/json'})
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
 
-        try:
-            while not self.config:
-                time.sleep(1)
+        self.rate_limiter = ECSSlackRateLimiter(float(config.slack_rate_limit_per_second),
+                                                float(config.slack_rate_limit_burst))
 
-            # Grab values from row parameter
-            vdc = row[1]
-            management_ip = row[2]
-            management_ip_link = 'https://' + row[2]
-            description = row[5]
-            severity = row[7]
-            symtomcode = row[8]
-            timestamp = row[9]
-
-            if severity == 'WARNING':
-                severity_color = "#FFA500"
+    def slack_severity_color(self, severity):
+        if severity == 'WARNING':
+            severity_color = "#FFA500"
+        else:
+            if severity == 'ERROR':
+                severity_color = "#FF0000"
             else:
-                if severity == 'ERROR':
-                    severity_color = "#FF0000"
+                if severity == 'INFO':
+                    severity_color = "#008000"
                 else:
-                    if severity == 'INFO':
-                        severity_color = "#008000"
+                    if severity == 'CRITICAL':
+                        severity_color = "#FF0000"
                     else:
-                        if severity == 'CRITICAL':
-                            severity_color = "#FF0000"
-                        else:
-                            severity_color = "#000000"
+                        severity_color = "#000000"
 
-            # Set email HTML content
-            message_json = '''{{
-                'attachments': [
-                    {{
-                        "fallback": "ECS Alert Received From VDC: *{0}*",
-                        "color": "{1}",
-                        "pretext": "ECS Alert Received From VDC: *{2}*",
-                        "title": "ECS Cluster: {3}",
-                        "title_link": "{4}",
-                        "text": "Alert Details:",
-                        "fields": [
-                            {{
-                                "title": "Severity ",
-                                "value": "{5}",
-                                "short": True
-                            }},
-                            {{
-                                "title": "Symptom Code ",
-                                "value": "{6}",
-                                "short": True
-                            }},
-                            {{
-                                "title": "Description ",
-                                "value": "{7}",
-                                "short": True
-                            }},
-                            {{
-                                "title": "Timestamp ",
-                                "value": "{8}",
-                                "short": True
-                            }}
-                        ],
-                        "footer": "Slack API",
-                        "footer_icon": "https://platform.slack-edge.com/img/default_application_icon.png"
-                     }}
-                ]
-            }}'''
+        return severity_color
 
-            # Perform Perform call t Slack API
-            headers = {'content-type': 'application/json'}
+    def slack_build_attachment(self, row):
+        """
+        Formats the message attachment for an alert row
+        """
+        # Grab values from row parameter
+        vdc = row['vdc']
+        management_ip = row['managementIp']
+        management_ip_link = 'https://' + row['managementIp']
+        description = row['description']
+        severity = row['severity']
+        symtomcode = row['symptomCode']
+        timestamp = row['alertTimestamp']
 
-            test = message_json.format(vdc, severity_color, vdc, management_ip, management_ip_link, severity,
-                                       symtomcode, description, timestamp)
+        return {
+            "fallback": "ECS Alert Received From VDC: *" + vdc + "*",
+            "color": self.slack_severity_color(severity),
+            "pretext": "ECS Alert Received From VDC: *" + vdc + "*",
+            "title": "ECS Cluster: " + management_ip,
+            "title_link": management_ip_link,
+            "text": "Alert Details:",
+            "fields": [
+                {
+                    "title": "Severity ",
+                    "value": severity,
+                    "short": True
+                },
+                {
+                    "title": "Symptom Code ",
+                    "value": symtomcode,
+                    "short": True
+                },
+                {
+                    "title": "Description ",
+                    "value": description,
+                    "short": True
+                },
+                {
+                    "title": "Timestamp ",
+                    "value": timestamp,
+                    "short": True
+                },
+                {
+                    "title": "Occurrences ",
+                    "value": row['occurrences'],
+                    "short": True
+                }
+            ],
+            "footer": "Slack API",
+            "footer_icon": "https://platform.slack-edge.com/img/default_application_icon.png"
+        }
 
-            r = requests.post(self.config.slack_webhook, data=test, headers=headers, verify=False)
+    def slack_post(self, message):
+        """
+        Posts a message to the webhook honoring Slack rate limits.  Returns True once Slack accepted the message.
+        """
+        backoff = RETRY_BACKOFF
+
+        for attempt in range(MAX_ATTEMPTS):
+            self.rate_limiter.acquire()
+
+            r = self.session.post(self.config.slack_webhook, data=json.dumps(message))
 
             if r.status_code == requests.codes.ok:
-                self.logger.debug(MODULE_NAME + 'slack_send_message()::'
-                                  + self.config.slack_webhook + ' call returned '
-                                                                'with a 200 status code.')
-                sent = True
-            else:
-                self.logger.error(MODULE_NAME + 'slack_send_message()::' + self.config.slack_webhook +
-                                  ' call failed with a status code of ' + str(r.status_code))
-                sent = False
+                self.logger.debug(MODULE_NAME + '::slack_post()::' + self.config.slack_webhook +
+                                  ' call returned with a 200 status code.')
+                return True
+
+            if r.status_code == requests.codes.too_many_requests or r.status_code >= 500:
+                # Back off for as long as Slack asks us to or exponentially if it did not say
+                retry_after = r.headers.get('Retry-After')
+                wait = float(retry_after) if retry_after and retry_after.isdigit() else backoff
+                backoff *= 2
+
+                self.logger.info(MODULE_NAME + '::slack_post()::' + self.config.slack_webhook +
+                                 ' call returned a status code of ' + str(r.status_code) + '.  Retrying in ' +
+                                 str(wait) + ' seconds.')
+                self.rate_limiter.block(wait)
+                continue
+
+            self.logger.error(MODULE_NAME + '::slack_post()::' + self.config.slack_webhook +
+                              ' call failed with a status code of ' + str(r.status_code))
+            return False
+
+        self.logger.error(MODULE_NAME + '::slack_post()::' + self.config.slack_webhook +
+                          ' call failed after ' + str(MAX_ATTEMPTS) + ' attempts.')
+        return False
+
+    def slack_send_messages(self, rows):
+        """
+        Posts alert rows packing several alerts into each message as attachments.
+        Returns the rows that Slack accepted.
+        """
+        sent_rows = []
+
+        try:
+            while not self.config:
+                time.sleep(1)
+
+            batch_size = int(self.config.slack_alerts_per_message)
+
+            for i in range(0, len(rows), batch_size):
+                batch = rows[i:i + batch_size]
+                message = {'attachments': [self.slack_build_attachment(row) for row in batch]}
+
+                if self.slack_post(message):
+                    sent_rows.extend(batch)
+
+            return sent_rows
+
+        except Exception as e:
+            self.logger.error(MODULE_NAME + '::slack_send_messages()::The following '
+                                            'unhandled exception occurred: ' + str(e))
+            return sent_rows
+
+    def slack_send_message(self, row):
+        """
+        Posts a single alert row
+        """
+        return len(self.slack_send_messages([row])) == 1
+
+    def slack_send_digest(self, vdc, severity, rows):
+        """
+        Posts one message for all alert rows of a VDC with the same severity
+        """
+        try:
+            while not self.config:
+                time.sleep(1)
+
+            # Alerts raised without a severity are grouped together under UNKNOWN
+            severity = str(severity or 'UNKNOWN')
+
+            # List the alerts one per line keeping the message within a readable size
+            lines = ["`{0}` *{1}* {2} ({3}){4}".format(row['alertTimestamp'], row['symptomCode'], row['description'],
+                                                      row['managementIp'],
+                                                      " x" + str(row['occurrences']) if row['occurrences'] > 1 else "")
+                     for row in rows[:DIGEST_MAX_LINES]]
+            if len(rows) > DIGEST_MAX_LINES:
+                lines.append("...and " + str(len(rows) - DIGEST_MAX_LINES) + " more")
+
+            message = {
+                'attachments': [
+                    {
+                        "fallback": "ECS Alert Digest From VDC: " + vdc,
+                        "color": self.slack_severity_color(severity),
+                        "pretext": "ECS Alert Digest From VDC: *" + vdc + "*",
+                        "title": str(len(rows)) + " " + severity + " alerts",
+                        "text": "\n".join(lines),
+                        "mrkdwn_in": ["text", "pretext"],
+                        "footer": "Slack API",
+                        "footer_icon": "https://platform.slack-edge.com/img/default_application_icon.png"
+                    }
+                ]
+            }
 
-            return sent
+            return self.slack_post(message)
 
         except Exception as e:
-            self.logger.error(MODULE_NAME + '::slack_send_message()::The following '
-                                            'unhandled exception occurred: ' + e.message)
-            sent = False
-            return sent
+            self.logger.error(MODULE_NAME + '::slack_send_digest()::The following '
+                                            'unhandled exception occurred: ' + str(e))
+            return False
@@ -3,7 +3,9 @@ DELL EMC ECS SMTP Email Module.
 """
 
 
+import queue
 import smtplib
+import threading
 import time
 import email.message
 
@@ -22,6 +24,11 @@ class ECSSMTPUtility(object):
         self.config = config
         self.logger = logger
 
+        # Idle delivery sessions that can be reused by delivery workers
+        self.idle_sessions = queue.LifoQueue()
+        self.sessions = []
+        self.sessions_lock = threading.Lock()
+
     def check_smtp_server_connection(self):
         """
         Checks if a database exists and create if it doesn't
@@ -49,73 +56,264 @@ class ECSSMTPUtility(object):
             connected = False
             return connected
 
-    def smtp_send_email(self, row):
+    def open_session(self):
+        """
+        Returns a delivery session that keeps one SMTP connection open until it is closed
+        """
+        while not self.config:
+            time.sleep(1)
+
+        return ECSSMTPSession(self.config, self.logger)
 
+    def acquire_session(self):
+        """
+        Lends an idle pooled delivery session or opens a new one.  Each delivery
+        worker holds its own session since an SMTP connection can not be shared.
+        """
         try:
-            sent = True
+            return self.idle_sessions.get_nowait()
+        except queue.Empty:
+            session = self.open_session()
+            with self.sessions_lock:
+                self.sessions.append(session)
+            return session
 
-            while not self.config:
-                time.sleep(1)
+    def release_session(self, session):
+        """
+        Returns a delivery session to the pool keeping its connection open
+        """
+        self.idle_sessions.put(session)
 
-            # Grab values from row parameter
-            vdc = row[1]
-            management_ip = row[2]
-            description = row[5]
-            severity = row[7]
-            symtomcode = row[8]
-            timestamp = row[9]
+    def close_sessions(self):
+        """
+        Closes the connections of all pooled delivery sessions
+        """
+        with self.sessions_lock:
+            sessions = self.sessions
+            self.sessions = []
+
+        self.idle_sessions = queue.LifoQueue()
+        for session in sessions:
+            session.close()
+
+    def smtp_build_message(self, row):
+        """
+        Formats the email for an alert row
+        """
+        # Grab values from row parameter
+        vdc = row['vdc']
+        management_ip = row['managementIp']
+        description = row['description']
+        severity = str(row['severity'] or 'UNKNOWN')
+        symtomcode = row['symptomCode']
+        timestamp = row['alertTimestamp']
+        occurrences = row['occurrences']
 
-            # Setup message object
-            msg = email.message.Message()
+        # Setup message object
+        msg = email.message.Message()
 
-            msg['Subject'] = "Elastic Cloud Storage (ECS) Alert Received"
-            msg['From'] = self.config.smtp_fromemail
-            msg['To'] = self.config.smtp_toemail
+        msg['Subject'] = "Elastic Cloud Storage (ECS) Alert Received"
+        msg['From'] = self.config.smtp_fromemail
+        msg['To'] = self.config.smtp_toemail
 
-            if severity == 'WARNING':
-                severity_text = """<font color="orange">""" + severity + "</font>"
+        if severity == 'WARNING':
+            severity_text = """<font color="orange">""" + severity + "</font>"
+        else:
+            if severity == 'ERROR':
+                severity_text = """<font color="red">""" + severity + "</font>"
             else:
-                if severity == 'ERROR':
+                if severity == 'CRITICAL':
                     severity_text = """<font color="red">""" + severity + "</font>"
                 else:
-                    if severity == 'CRITICAL':
-                        severity_text = """<font color="red">""" + severity + "</font>"
-                    else:
-                        severity_text = """<font color="black">""" + severity + "</font>"
-
-            # Set email HTML content
-            email_content = """
-            <html>
-            <head>
-            <meta http-equiv="Content-Type" content="text/html; charset=utf-8">
-               <title>Elastic Cloud Storage (ECS) Alert Received</title>
-            </head> 
-            <html><body><h1>Elastic Cloud Storage (ECS) Received Alert from Virtual Data Center: {0} </h1><br>
-            Management IP: {1} <br>
-            Severity: {2} <br>
-            Symptom Code : {3} <br>
-            Description : {4}<br>
-            Timestamp : {5} <br>
-            </body></html>"""
-
-            # Format message
-            msg.add_header('Content-Type', 'text/html')
-            msg.set_payload(email_content.format(vdc, management_ip, severity_text, symtomcode, description, timestamp))
-
-            # Connect to server and send email
-            s = smtplib.SMTP(self.config.smtp_host + ':' + self.config.smtp_port)
+                    severity_text = """<font color="black">""" + severity + "</font>"
 
-            # If authentication is required attempt to login to server with configured user and password
-            if self.config.smtp_authentication_required == '1':
-                s.login(self.config.smtp_user, self.config.smtp_password)
+        # Set email HTML content
+        email_content = """
+        <html>
+        <head>
+        <meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+           <title>Elastic Cloud Storage (ECS) Alert Received</title>
+        </head> 
+        <html><body><h1>Elastic Cloud Storage (ECS) Received Alert from Virtual Data Center: {0} </h1><br>
+        Management IP: {1} <br>
+        Severity: {2} <br>
+        Symptom Code : {3} <br>
+        Description : {4}<br>
+        Timestamp : {5} <br>
+        Occurrences : {6} <br>
+        </body></html>"""
+
+        # Format message
+        msg.add_header('Content-Type', 'text/html')
+        msg.set_payload(email_content.format(vdc, management_ip, severity_text, symtomcode, description, timestamp,
+                                             occurrences))
+
+        return msg
 
-            # Send email
-            s.sendmail(msg['From'], [msg['To']], msg.as_string())
+    def smtp_build_digest_message(self, vdc, severity, rows):
+        """
+        Formats a single email summarizing all alert rows of a VDC with the same severity
+        """
+        msg = email.message.Message()
+
+        # Alerts raised without a severity are grouped together under UNKNOWN
+        severity = str(severity or 'UNKNOWN')
+
+        msg['Subject'] = "Elastic Cloud Storage (ECS) Alert Digest: " + str(len(rows)) + " " + severity + \
+                         " alerts from Virtual Data Center " + vdc
+        msg['From'] = self.config.smtp_fromemail
+        msg['To'] = self.config.smtp_toemail
+
+        # Build one table row per alert
+        alert_rows = ""
+        for row in rows:
+            alert_rows += "<tr><td>{0}</td><td>{1}</td><td>{2}</td><td>{3}</td><td>{4}</td><td>{5}</td></tr>".format(
+                row['alertTimestamp'], row['managementIp'], row['symptomCode'], row['namespace'] or '',
+                row['description'], row['occurrences'])
+
+        email_content = """
+        <html>
+        <head>
+        <meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+           <title>Elastic Cloud Storage (ECS) Alert Digest</title>
+        </head>
+        <html><body><h1>Elastic Cloud Storage (ECS) Received {0} {1} Alerts from Virtual Data Center: {2} </h1><br>
+        <table border="1" cellpadding="4" cellspacing="0">
+        <tr><th>Timestamp</th><th>Management IP</th><th>Symptom Code</th><th>Namespace</th><th>Description</th>
+        <th>Occurrences</th></tr>
+        {3}
+        </table>
+        </body></html>"""
+
+        msg.add_header('Content-Type', 'text/html')
+        msg.set_payload(email_content.format(len(rows), severity, vdc, alert_rows))
+
+        return msg
+
+    def smtp_send_digest(self, vdc, severity, rows, session=None):
+        """
+        Sends one email for all alert rows of a VDC with the same severity
+        """
+        try:
+            while not self.config:
+                time.sleep(1)
+
+            msg = self.smtp_build_digest_message(vdc, severity, rows)
+
+            if session is None:
+                one_off_session = self.open_session()
+                try:
+                    one_off_session.send(msg)
+                finally:
+                    one_off_session.close()
+            else:
+                session.send(msg)
+
+            return True
+
+        except Exception as e:
+            self.logger.error(MODULE_NAME + '::smtp_send_digest()::The following '
+                                            'unhandled exception occurred: ' + str(e))
+            return False
+
+    def smtp_send_email(self, row, session=None):
+        """
+        Sends the email for an alert row.  When no delivery session is provided a
+        connection is opened and closed just for this email.
+        """
+        try:
+            sent = True
+
+            while not self.config:
+                time.sleep(1)
+
+            msg = self.smtp_build_message(row)
+
+            if session is None:
+                # Connect to server, send email, and disconnect
+                one_off_session = self.open_session()
+                try:
+                    one_off_session.send(msg)
+                finally:
+                    one_off_session.close()
+            else:
+                session.send(msg)
 
             return sent
 
         except Exception as e:
             self.logger.error(MODULE_NAME + '::smtp_send_email()::The following '
-                                            'unhandled exception occurred: ' + e.message)
+                                            'unhandled exception occurred: ' + str(e))
             sent = False
             return sent
+
+
+class ECSSMTPSession(object):
+    """
+    Keeps one authenticated SMTP connection open across a delivery cycle
+    """
+    def __init__(self, config, logger):
+        self.config = config
+        self.logger = logger
+        self.server = None
+
+    def connect(self):
+        """
+        Connects to the SMTP server upgrading to TLS and logging in as configured
+        """
+        server = smtplib.SMTP(self.config.smtp_host, int(self.config.smtp_port))
+        try:
+            server.ehlo()
+
+            # If STARTTLS is enabled upgrade the connection before we send credentials
+            if self.config.smtp_starttls == '1':
+                server.starttls()
+                server.ehlo()
+
+            # If authentication is required attempt to login to server with configured user and password
+            if self.config.smtp_authentication_required == '1':
+                server.login(self.config.smtp_user, self.config.smtp_password)
+        except Exception:
+            server.close()
+            raise
+
+        self.server = server
+
+        self.logger.debug(MODULE_NAME + '::ECSSMTPSession::connect()::Connected to SMTP server at: ' +
+                          self.config.smtp_host + ':' + self.config.smtp_port)
+
+    def send(self, msg):
+        """
+        Sends a message on the open connection reconnecting once if the server dropped it
+        """
+        recipients = [address.strip() for address in msg['To'].split(',')]
+
+        for attempt in range(2):
+            if self.server is None:
+                self.connect()
+
+            try:
+                self.server.sendmail(msg['From'], recipients, msg.as_string())
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.logger.info(MODULE_NAME + '::ECSSMTPSession::send()::SMTP server closed the connection.  '
+                                               'Reconnecting.')
+                self.server.close()
+                self.server = None
+
+                if attempt == 1:
+                    raise
+
+    def close(self):
+        """
+        Closes the connection to the SMTP server
+        """
+        if self.server is None:
+            return
+
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        finally:
+            self.server = None
@@ -1,11 +1,88 @@
 """
 DELL EMC ECS Email Alerting SQLLite Module.
 """
+import contextlib
+import collections
+import datetime
+import os
+import queue
 import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
 
 # Constants
 MODULE_NAME = "sqllite"                  # Module Name
 
+# Unique index on alertId used to skip alerts we have already stored
+ECS_ALERTS_ALERT_ID_INDEX = """ CREATE UNIQUE INDEX IF NOT EXISTS ecsalerts_alertId ON ecsalerts (alertId); """
+
+# Delivery order of alert severities, most severe first, for a severity expression
+SEVERITY_RANK = """ CASE upper({0}) WHEN 'CRITICAL' THEN 0 WHEN 'ERROR' THEN 1 WHEN 'WARNING' THEN 2
+                    WHEN 'INFO' THEN 3 ELSE 4 END """
+
+# Insert statement for extracted alerts that silently skips alerts already stored.  The severity rank is
+# worked out from the severity parameter so callers pass the same tuple either way.
+ECS_ALERTS_INSERT = """ INSERT OR IGNORE INTO ecsalerts(vdc, managementIp, alertId, acknowledged, description,
+                        namespace, severity, symptomCode, alertTimestamp, emailAlerted, alertCleared, dateCreated,
+                        dateEmailed, dateCleared, correlatedTo, severityRank)
+                        VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,""" + SEVERITY_RANK.format('?7') + """) """
+
+# Partial index holding only the unsent alerts in delivery order so finding pending work does not depend on
+# how many delivered alerts are kept
+ECS_ALERTS_UNSENT_INDEX = """ CREATE INDEX IF NOT EXISTS ecsalerts_unsent ON ecsalerts (severityRank, id)
+                              WHERE emailAlerted = 0; """
+
+# Columns read by the delivery loop, the notification renderers and the acknowledgement queue
+ECS_ALERTS_DELIVERY_COLUMNS = """ id, vdc, managementIp, alertId, description, namespace, severity, symptomCode,
+                                  alertTimestamp, occurrences, correlatedTo, severityRank """
+
+# Indexes on the date alerts were stored and on the alerts given up so listings filtered with --since and
+# the --failed listing only read the matching rows
+ECS_ALERTS_LISTING_INDEXES = [""" CREATE INDEX IF NOT EXISTS ecsalerts_dateCreated ON ecsalerts (dateCreated); """,
+                              """ CREATE INDEX IF NOT EXISTS ecsalerts_failed ON ecsalerts (id)
+                                  WHERE emailAlerted = 3; """]
+
+# Delivery state of an alert shown in the listings
+ECS_ALERTS_STATUS = """ CASE emailAlerted WHEN 0 THEN 'unsent' WHEN 1 THEN 'sent' WHEN 2 THEN 'correlated'
+                        WHEN 3 THEN 'failed' END AS status """
+
+# emailAlerted value of alerts correlated to another alert that carries their notification
+EMAIL_ALERTED_CORRELATED = 2
+
+# emailAlerted value of alerts given up on after failing delivery the configured number of times
+EMAIL_ALERTED_FAILED = 3
+
+# Columns added to ecsalerts to back off and eventually give up on alerts that keep failing delivery
+ECS_ALERTS_DELIVERY_ATTEMPT_COLUMNS = [('deliveryAttempts', 'int NOT NULL DEFAULT 0'),
+                                       ('nextAttempt', 'real')]
+DELIVERY_MAX_BACKOFF = 3600              # Longest in seconds an alert waits between delivery attempts
+
+# Columns added to ecsalerts for alert correlation and the indexes used to find correlated alerts
+ECS_ALERTS_CORRELATION_COLUMNS = [('occurrences', 'int NOT NULL DEFAULT 1'),
+                                  ('correlatedTo', 'text'),
+                                  ('notifiedOccurrences', 'int NOT NULL DEFAULT 0')]
+ECS_ALERTS_CORRELATION_INDEXES = [""" CREATE INDEX IF NOT EXISTS ecsalerts_correlatedTo ON ecsalerts (correlatedTo)
+                                      WHERE correlatedTo IS NOT NULL; """,
+                                  """ CREATE INDEX IF NOT EXISTS ecsalerts_correlated ON ecsalerts (id)
+                                      WHERE emailAlerted = 2; """]
+
+# Columns copied into the archive database when delivered alerts pass the retention period
+ECS_ALERTS_ARCHIVE_COLUMNS = """ id, vdc, managementIp, alertId, acknowledged, description, namespace, severity,
+                                 symptomCode, alertTimestamp, emailAlerted, alertCleared, dateCreated, dateEmailed,
+                                 dateCleared, occurrences, correlatedTo """
+
+# Pragmas applied to the long-lived writer connection
+WRITER_PRAGMAS = ['PRAGMA journal_mode=WAL;',
+                  'PRAGMA synchronous=NORMAL;',
+                  'PRAGMA busy_timeout=10000;',
+                  'PRAGMA temp_store=MEMORY;',
+                  'PRAGMA cache_size=-16000;']
+
+# Pragmas applied to each pooled read-only connection
+READER_PRAGMAS = ['PRAGMA busy_timeout=10000;',
+                  'PRAGMA query_only=1;']
+
 
 class SQLLiteException(Exception):
     pass
@@ -37,4 +114,575 @@ class SQLLiteUtility(object):
                               'unhandled exception occurred: ' + e.message)
             return None
 
+    def create_alert_id_index(self, sqllite_db):
+        """
+        Creates the unique alertId index removing any duplicate alerts stored before the index existed
+        """
+        try:
+            sqllite_db.execute(ECS_ALERTS_ALERT_ID_INDEX)
+        except sqlite3.IntegrityError:
+            self.logger.info(MODULE_NAME + '::create_alert_id_index()::Duplicate alerts found.  Keeping the '
+                                           'first stored row for each alertId before creating the index.')
+            with sqllite_db:
+                sqllite_db.execute(""" DELETE FROM ecsalerts WHERE id NOT IN
+                                       (SELECT MIN(id) FROM ecsalerts GROUP BY alertId); """)
+                sqllite_db.execute(ECS_ALERTS_ALERT_ID_INDEX)
+
+        self.logger.debug(MODULE_NAME + '::create_alert_id_index()::Unique alertId index is in place.')
+
+    def create_listing_indexes(self, sqllite_db):
+        """
+        Creates the indexes used by the filtered and failed alert listings
+        """
+        with sqllite_db:
+            for index in ECS_ALERTS_LISTING_INDEXES:
+                sqllite_db.execute(index)
+
+    def create_correlation_columns(self, sqllite_db):
+        """
+        Adds the alert correlation columns to an extracted alerts table created before they existed
+        """
+        columns = [row[1] for row in sqllite_db.execute(""" PRAGMA table_info(ecsalerts); """)]
+
+        with sqllite_db:
+            for name, definition in ECS_ALERTS_CORRELATION_COLUMNS:
+                if name not in columns:
+                    self.logger.info(MODULE_NAME + '::create_correlation_columns()::Adding column ' + name +
+                                     ' to the extracted alerts table.')
+                    sqllite_db.execute(""" ALTER TABLE ecsalerts ADD COLUMN """ + name + " " + definition + ";")
+
+            # Groups notified before follow-up notifications existed are treated as fully notified
+            if 'notifiedOccurrences' not in columns:
+                sqllite_db.execute(""" UPDATE ecsalerts SET notifiedOccurrences = occurrences
+                                       WHERE emailAlerted = 1; """)
+
+            for index in ECS_ALERTS_CORRELATION_INDEXES:
+                sqllite_db.execute(index)
+
+    def create_unsent_index(self, sqllite_db):
+        """
+        Creates the partial index of unsent alerts adding and filling in the severity rank column it is ordered
+        on for an extracted alerts table created before it existed
+        """
+        columns = [row[1] for row in sqllite_db.execute(""" PRAGMA table_info(ecsalerts); """)]
+
+        with sqllite_db:
+            if 'severityRank' not in columns:
+                self.logger.info(MODULE_NAME + '::create_unsent_index()::Adding column severityRank to the '
+                                               'extracted alerts table.')
+                sqllite_db.execute(""" ALTER TABLE ecsalerts ADD COLUMN severityRank int; """)
+                sqllite_db.execute(""" UPDATE ecsalerts SET severityRank = """ + SEVERITY_RANK.format('severity') +
+                                   """; """)
+
+            sqllite_db.execute(ECS_ALERTS_UNSENT_INDEX)
+
+    def create_delivery_attempt_columns(self, sqllite_db):
+        """
+        Adds the delivery attempt columns to an extracted alerts table created before they existed
+        """
+        columns = [row[1] for row in sqllite_db.execute(""" PRAGMA table_info(ecsalerts); """)]
+
+        with sqllite_db:
+            for name, definition in ECS_ALERTS_DELIVERY_ATTEMPT_COLUMNS:
+                if name not in columns:
+                    self.logger.info(MODULE_NAME + '::create_delivery_attempt_columns()::Adding column ' + name +
+                                     ' to the extracted alerts table.')
+                    sqllite_db.execute(""" ALTER TABLE ecsalerts ADD COLUMN """ + name + " " + definition + ";")
+
+    def select_unsent_alerts(self, sqllite_db, after, limit, columns=ECS_ALERTS_DELIVERY_COLUMNS, now=None):
+        """
+        Returns the next page of at most limit unsent alerts, most severe and then oldest first, leaving out
+        alerts backing off after a failed delivery until now.  after is the (severityRank, id) of the last row
+        of the previous page or None for the first page.  A page is read with at most two seeks on the unsent
+        index, the rest of the severity of the previous page and then the lower severities, so paging through
+        the queue never rescans rows already read.
+        """
+        now = time.time() if now is None else now
+
+        if after is None:
+            return sqllite_db.execute(""" SELECT """ + columns + """ FROM ecsalerts WHERE emailAlerted = 0
+                                          AND (nextAttempt IS NULL OR nextAttempt <= ?)
+                                          ORDER BY severityRank, id LIMIT ?; """, (now, limit)).fetchall()
+
+        rows = sqllite_db.execute(""" SELECT """ + columns + """ FROM ecsalerts WHERE emailAlerted = 0
+                                      AND severityRank = ? AND id > ? AND (nextAttempt IS NULL OR nextAttempt <= ?)
+                                      ORDER BY severityRank, id LIMIT ?; """,
+                                  (after[0], after[1], now, limit)).fetchall()
+        if len(rows) < limit:
+            rows += sqllite_db.execute(""" SELECT """ + columns + """ FROM ecsalerts WHERE emailAlerted = 0
+                                           AND severityRank > ? AND (nextAttempt IS NULL OR nextAttempt <= ?)
+                                           ORDER BY severityRank, id LIMIT ?; """,
+                                       (after[0], now, limit - len(rows))).fetchall()
+        return rows
+
+    def record_failed_deliveries(self, sqllite_db, row_ids, max_attempts, backoff):
+        """
+        Counts a failed delivery attempt against a batch of unsent alert rows.  Each row waits backoff seconds,
+        doubling with every attempt up to DELIVERY_MAX_BACKOFF, before it is tried again and is flagged as failed
+        once it has been tried max_attempts times.  Returns the number of rows flagged as failed.
+        """
+        changes = sqllite_db.total_changes
+        sqllite_db.executemany(""" UPDATE ecsalerts SET deliveryAttempts = deliveryAttempts + 1,
+                                   nextAttempt = ? + min(?, ? * (1 << min(deliveryAttempts, 20))),
+                                   emailAlerted = ? WHERE id = ? AND emailAlerted = 0
+                                   AND deliveryAttempts + 1 >= ?; """,
+                               [(time.time(), DELIVERY_MAX_BACKOFF, backoff, EMAIL_ALERTED_FAILED, row_id,
+                                 max_attempts) for row_id in row_ids])
+        failed = sqllite_db.total_changes - changes
+
+        sqllite_db.executemany(""" UPDATE ecsalerts SET deliveryAttempts = deliveryAttempts + 1,
+                                   nextAttempt = ? + min(?, ? * (1 << min(deliveryAttempts, 20)))
+                                   WHERE id = ? AND emailAlerted = 0; """,
+                               [(time.time(), DELIVERY_MAX_BACKOFF, backoff, row_id) for row_id in row_ids])
+        return failed
+
+    def select_alerts(self, sqllite_db, email_alerted=None, since=None, vdcs=None, severities=None, limit=None):
+        """
+        Returns a cursor over the extracted alerts matching the filters so they can be read one at a time,
+        each with a status column naming its delivery state.  since is a dateCreated lower bound in the stored
+        format read off the dateCreated index and severities are matched case-insensitively.  Unsent alerts are
+        returned in delivery order off the unsent index, alerts since a date in date order, and everything else
+        in row id order.
+        """
+        conditions = []
+        parameters = []
+
+        # emailAlerted is written into the statement so the query planner can use the partial indexes
+        if email_alerted is not None:
+            conditions.append("emailAlerted = " + str(int(email_alerted)))
+        if since:
+            conditions.append("dateCreated >= ?")
+            parameters.append(since)
+        if vdcs:
+            conditions.append("vdc IN (" + ','.join('?' * len(vdcs)) + ")")
+            parameters.extend(vdcs)
+        if severities:
+            conditions.append("upper(severity) IN (" + ','.join('?' * len(severities)) + ")")
+            parameters.extend(severity.upper() for severity in severities)
+
+        ecsalertsselect = """ SELECT *, """ + ECS_ALERTS_STATUS + """ FROM ecsalerts """
+        if conditions:
+            ecsalertsselect += """ WHERE """ + """ AND """.join(conditions)
+        # Alerts are listed in the order of the index that finds them so rows stream without a sort
+        if email_alerted == 0:
+            ecsalertsselect += """ ORDER BY severityRank, id """
+        elif since:
+            ecsalertsselect += """ ORDER BY dateCreated, id """
+        else:
+            ecsalertsselect += """ ORDER BY id """
+        if limit is not None:
+            ecsalertsselect += """ LIMIT ? """
+            parameters.append(limit)
+
+        return sqllite_db.execute(ecsalertsselect + ";", parameters)
+
+    def insert_alerts(self, sqllite_db, alerts):
+        """
+        Inserts a batch of alerts in a single transaction skipping alerts that are already stored
+        and returns the number of rows actually inserted.  The occurrence count of every alert that
+        alerts in the batch are correlated to is brought up to date.
+        """
+        if not alerts:
+            return 0
+
+        changes = sqllite_db.total_changes
+
+        sqllite_db.executemany(ECS_ALERTS_INSERT, alerts)
+        inserted = sqllite_db.total_changes - changes
+
+        correlated_to = set(alert[14] for alert in alerts if alert[14])
+        if correlated_to:
+            sqllite_db.executemany(""" UPDATE ecsalerts SET occurrences = 1 +
+                                       (SELECT COUNT(*) FROM ecsalerts c WHERE c.correlatedTo = ?)
+                                       WHERE alertId = ?; """,
+                                   [(alert_id, alert_id) for alert_id in correlated_to])
+
+        self.logger.debug(MODULE_NAME + '::insert_alerts()::Inserted ' + str(inserted) + ' of ' +
+                          str(len(alerts)) + ' alerts.')
+        return inserted
+
+    def mark_alerts_emailed(self, sqllite_db, row_ids, notified_groups=()):
+        """
+        Flags a batch of alert rows as notified.  notified_groups holds the (occurrences, alertId) of the alert
+        that opened each correlation group the rows were notified for, recording how many occurrences of the
+        group have been notified so far.
+        """
+        current_time = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
+        sqllite_db.executemany(""" UPDATE ecsalerts SET emailAlerted = 1, dateEmailed = ? WHERE id = ?; """,
+                               [(current_time, row_id) for row_id in row_ids])
+        sqllite_db.executemany(""" UPDATE ecsalerts SET notifiedOccurrences = ?
+                                   WHERE alertId = ? AND notifiedOccurrences < ?; """,
+                               [(occurrences, alert_id, occurrences) for occurrences, alert_id in notified_groups])
+
+    def select_notified_correlated_alerts(self, sqllite_db):
+        """
+        Returns the correlated alerts whose group was notified with every occurrence stored so far
+        """
+        return sqllite_db.execute(""" SELECT c.id, c.managementIp, c.alertId FROM ecsalerts c
+                                      WHERE c.emailAlerted = 2 AND EXISTS
+                                      (SELECT 1 FROM ecsalerts p WHERE p.alertId = c.correlatedTo
+                                       AND p.emailAlerted = 1
+                                       AND p.occurrences <= p.notifiedOccurrences); """).fetchall()
+
+    def select_grown_correlation_groups(self, sqllite_db):
+        """
+        Returns the alertId of the alert that opened each notified correlation group with occurrences stored
+        after it was notified and no follow-up notification waiting to be delivered
+        """
+        return sqllite_db.execute(""" SELECT DISTINCT p.alertId FROM ecsalerts c
+                                      JOIN ecsalerts p ON p.alertId = c.correlatedTo
+                                      WHERE c.emailAlerted = 2 AND p.emailAlerted = 1
+                                      AND p.occurrences > p.notifiedOccurrences
+                                      AND NOT EXISTS (SELECT 1 FROM ecsalerts f WHERE f.correlatedTo = p.alertId
+                                                      AND f.emailAlerted = 0); """).fetchall()
+
+    def queue_follow_up_alerts(self, sqllite_db, alert_ids):
+        """
+        Queues the latest correlated alert of each group opened by alert_ids for notification carrying the
+        occurrence count of the whole group.  Returns the number of follow-up notifications queued.
+        """
+        changes = sqllite_db.total_changes
+
+        sqllite_db.executemany(""" UPDATE ecsalerts SET emailAlerted = 0, deliveryAttempts = 0, nextAttempt = NULL,
+                                   occurrences = (SELECT p.occurrences FROM ecsalerts p WHERE p.alertId = ?)
+                                   WHERE id = (SELECT MAX(id) FROM ecsalerts WHERE correlatedTo = ?
+                                               AND emailAlerted = 2); """,
+                               [(alert_id, alert_id) for alert_id in alert_ids])
+
+        return sqllite_db.total_changes - changes
+
+    def select_failed_correlation_groups(self, sqllite_db):
+        """
+        Returns the alertId of the alert that opened each correlation group whose notification was given up
+        while alerts correlated to it are still waiting
+        """
+        return sqllite_db.execute(""" SELECT DISTINCT p.alertId FROM ecsalerts c
+                                      JOIN ecsalerts p ON p.alertId = c.correlatedTo
+                                      WHERE c.emailAlerted = 2 AND p.emailAlerted = ?; """,
+                                  (EMAIL_ALERTED_FAILED,)).fetchall()
+
+    def promote_correlated_alerts(self, sqllite_db, alert_ids):
+        """
+        Makes the latest waiting alert correlated to each of alert_ids the alert that opens a new group, queued
+        for notification, and moves the other waiting alerts of the group over to it.  Returns the number of
+        alerts promoted.
+        """
+        promoted = 0
+        for alert_id in alert_ids:
+            row = sqllite_db.execute(""" SELECT id, alertId FROM ecsalerts WHERE id = (SELECT MAX(id) FROM ecsalerts
+                                         WHERE correlatedTo = ? AND emailAlerted = 2); """, (alert_id,)).fetchone()
+            if row is None:
+                continue
+
+            sqllite_db.execute(""" UPDATE ecsalerts SET correlatedTo = ? WHERE correlatedTo = ?
+                                   AND emailAlerted = 2 AND id != ?; """, (row[1], alert_id, row[0]))
+            sqllite_db.execute(""" UPDATE ecsalerts SET emailAlerted = 0, correlatedTo = NULL, deliveryAttempts = 0,
+                                   nextAttempt = NULL, notifiedOccurrences = 0,
+                                   occurrences = 1 + (SELECT COUNT(*) FROM ecsalerts c WHERE c.correlatedTo = ?)
+                                   WHERE id = ?; """, (row[1], row[0]))
+            promoted += 1
+
+        return promoted
+
+    def enable_incremental_vacuum(self, sqllite_db):
+        """
+        Switches the database to incremental auto vacuum so pages freed by the retention policy can be
+        returned to the file system a batch at a time.  An existing database has to be rebuilt once.
+        """
+        if sqllite_db.execute(""" PRAGMA auto_vacuum; """).fetchone()[0] == 2:
+            return
+
+        sqllite_db.execute(""" PRAGMA auto_vacuum = INCREMENTAL; """)
+        if sqllite_db.execute(""" SELECT COUNT(*) FROM sqlite_master; """).fetchone()[0]:
+            self.logger.info(MODULE_NAME + '::enable_incremental_vacuum()::Rebuilding the database to enable '
+                                           'incremental vacuum.  This is only done once.')
+            sqllite_db.execute(""" VACUUM; """)
+
+    def select_expired_alerts(self, sqllite_db, cutoff, after_id, batch_size):
+        """
+        Returns the next batch of delivered and acknowledged alerts created before the cutoff with a row id above
+        after_id, oldest first.  Unacknowledged alerts are still returned by ECS and are kept so they are not
+        stored and notified again, as are primary alerts whose correlated alerts have not been settled yet.
+        """
+        return sqllite_db.execute(""" SELECT * FROM ecsalerts WHERE id > ? AND emailAlerted = 1
+                                      AND alertCleared = 1 AND dateCreated < ?
+                                      AND NOT EXISTS (SELECT 1 FROM ecsalerts c
+                                                      WHERE c.correlatedTo = ecsalerts.alertId
+                                                      AND c.emailAlerted = 2)
+                                      ORDER BY id LIMIT ?; """,
+                                  (after_id, cutoff, batch_size)).fetchall()
+
+    def archive_alerts(self, sqllite_db, archive_file, row_ids):
+        """
+        Copies a batch of alert rows into the archive database attaching it on first use.  Rows already
+        archived are skipped so a batch can safely be archived again.
+        """
+        if 'archive' not in [row[1] for row in sqllite_db.execute(""" PRAGMA database_list; """)]:
+            sqllite_db.execute(""" ATTACH DATABASE ? AS archive; """, (archive_file,))
+            sqllite_db.execute(""" CREATE TABLE IF NOT EXISTS archive.ecsalerts AS SELECT """ +
+                               ECS_ALERTS_ARCHIVE_COLUMNS + """ FROM main.ecsalerts WHERE 0; """)
+            sqllite_db.execute(""" CREATE UNIQUE INDEX IF NOT EXISTS archive.ecsalerts_alertId
+                                   ON ecsalerts (alertId); """)
+
+        sqllite_db.executemany(""" INSERT OR IGNORE INTO archive.ecsalerts SELECT """ + ECS_ALERTS_ARCHIVE_COLUMNS +
+                               """ FROM main.ecsalerts WHERE id = ?; """, [(row_id,) for row_id in row_ids])
+
+    def delete_alerts(self, sqllite_db, row_ids):
+        """
+        Removes a batch of alert rows from the extracted alerts table
+        """
+        sqllite_db.executemany(""" DELETE FROM ecsalerts WHERE id = ?; """, [(row_id,) for row_id in row_ids])
+
+    def incremental_vacuum(self, sqllite_db, pages):
+        """
+        Returns up to pages free pages, or all of them when pages is 0, to the file system and returns the
+        number of pages freed
+        """
+        free_pages = sqllite_db.execute(""" PRAGMA freelist_count; """).fetchone()[0]
+        # The pragma frees one page per result row so the cursor has to be run to completion
+        sqllite_db.execute(""" PRAGMA incremental_vacuum(""" + str(int(pages)) + """); """).fetchall()
+        return free_pages - sqllite_db.execute(""" PRAGMA freelist_count; """).fetchone()[0]
+
+    def checkpoint(self, sqllite_db):
+        """
+        Copies the write-ahead log into the database and truncates it so space returned by a vacuum is
+        released from both files.  Readers still using the log can leave part of it in place until the next
+        checkpoint.
+        """
+        sqllite_db.execute(""" PRAGMA wal_checkpoint(TRUNCATE); """).fetchall()
+
+    def mark_alerts_cleared(self, sqllite_db, row_ids):
+        """
+        Flags a batch of alert rows as acknowledged on ECS
+        """
+        current_time = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
+        sqllite_db.executemany(""" UPDATE ecsalerts SET alertCleared = 1, dateCleared = ? WHERE id = ?; """,
+                               [(current_time, row_id) for row_id in row_ids])
+
+    def select_unacknowledged_alerts(self, sqllite_db):
+        """
+        Returns the notified alerts that have not been acknowledged on ECS
+        """
+        return sqllite_db.execute(""" SELECT id, managementIp, alertId FROM ecsalerts
+                                      WHERE emailAlerted = 1 AND alertCleared = 0; """).fetchall()
+
+    def load_collection_state(self, sqllite_db):
+        """
+        Returns the persisted collection high-water mark and last full resync time of each ECS connection
+        """
+        state = {}
+        ecscollectionstateselect = """ SELECT managementIp, highWaterMark, lastFullSync FROM ecscollectionstate; """
+        for row in sqllite_db.execute(ecscollectionstateselect):
+            state[row[0]] = {'highWaterMark': row[1], 'lastFullSync': row[2]}
+
+        return state
+
+    def save_collection_state(self, sqllite_db, management_ip, high_water_mark, last_full_sync):
+        """
+        Persists the collection high-water mark and last full resync time of an ECS connection
+        """
+        sqllite_db.execute(""" INSERT OR REPLACE INTO ecscollectionstate(managementIp, highWaterMark, lastFullSync)
+                               VALUES(?,?,?); """, (management_ip, high_water_mark, last_full_sync))
+
+
+class SQLLiteWriteRequest(object):
+    """
+    A batch of writes queued for the writer connection
+    """
+    def __init__(self, operation):
+        self.operation = operation
+        self.value = None
+        self.exception = None
+        self.completed = threading.Event()
+
+    def result(self, timeout=None):
+        """
+        Waits for the batch to be committed and returns the value returned by the operation
+        """
+        if not self.completed.wait(timeout):
+            raise SQLLiteException("Timed out waiting for the database write to complete.")
+
+        if self.exception is not None:
+            raise self.exception
+
+        return self.value
+
+
+class SQLLiteStore(object):
+    """
+    Owns the single long-lived writer connection and a pool of read-only connections to the database
+    """
+    def __init__(self, config, logger, name, max_readers=4):
+        self.config = config
+        self.logger = logger
+        self.database_file = os.path.abspath(name + '.db')
+        self.max_readers = max_readers
+        self.write_queue = queue.Queue()
+        self.readers = queue.LifoQueue()
+        self.reader_count = 0
+        self.reader_lock = threading.Lock()
+        self.writer = None
+        self.writer_thread = None
+
+    def start(self):
+        """
+        Opens the writer connection and starts the thread that applies queued write batches
+        """
+        self.writer = sqlite3.connect(self.database_file, check_same_thread=False)
+        for pragma in WRITER_PRAGMAS:
+            self.writer.execute(pragma)
+
+        self.writer_thread = threading.Thread(target=self.process_writes, name='sqllite-writer', daemon=True)
+        self.writer_thread.start()
+
+        self.logger.info(MODULE_NAME + '::start()::Writer connection opened in WAL mode on ' + self.database_file)
+
+    def process_writes(self):
+        """
+        Applies each queued write batch in its own transaction on the writer connection
+        """
+        while True:
+            request = self.write_queue.get()
+
+            # A None request is our signal to stop
+            if request is None:
+                break
+
+            try:
+                with self.writer:
+                    request.value = request.operation(self.writer)
+            except Exception as e:
+                self.logger.error(MODULE_NAME + '::process_writes()::The following '
+                                                'unhandled exception occurred: ' + str(e))
+                request.exception = e
+            finally:
+                request.completed.set()
+
+    def submit(self, operation):
+        """
+        Queues a write batch.  The operation is called with the writer connection inside a transaction.
+        """
+        if self.writer_thread is None:
+            raise SQLLiteException("The database writer has not been started.")
+
+        request = SQLLiteWriteRequest(operation)
+        self.write_queue.put(request)
+        return request
+
+    def write(self, operation, timeout=None):
+        """
+        Queues a write batch and waits for it to be committed
+        """
+        return self.submit(operation).result(timeout)
+
+    def open_reader(self):
+        """
+        Opens a read-only connection to the database
+        """
+        reader = sqlite3.connect('file:' + pathname2url(self.database_file) + '?mode=ro', uri=True,
+                                 check_same_thread=False)
+        reader.row_factory = sqlite3.Row
+        for pragma in READER_PRAGMAS:
+            reader.execute(pragma)
+
+        self.logger.debug(MODULE_NAME + '::open_reader()::Read-only connection opened.')
+        return reader
+
+    @contextlib.contextmanager
+    def reader(self):
+        """
+        Lends a pooled read-only connection for the duration of the with block
+        """
+        try:
+            reader = self.readers.get_nowait()
+        except queue.Empty:
+            with self.reader_lock:
+                create = self.reader_count < self.max_readers
+                if create:
+                    self.reader_count += 1
+
+            if create:
+                try:
+                    reader = self.open_reader()
+                except Exception:
+                    with self.reader_lock:
+                        self.reader_count -= 1
+                    raise
+            else:
+                reader = self.readers.get()
+
+        try:
+            yield reader
+        finally:
+            # Make sure no read transaction is left open so the WAL can be checkpointed
+            if reader.in_transaction:
+                reader.rollback()
+            self.readers.put(reader)
+
+    def close(self):
+        """
+        Stops the writer after the queued batches are applied and closes all connections
+        """
+        if self.writer_thread is not None:
+            self.write_queue.put(None)
+            self.writer_thread.join()
+            self.writer_thread = None
+            self.writer.close()
+            self.writer = None
+
+        while True:
+            try:
+                self.readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+        self.logger.info(MODULE_NAME + '::close()::Database connections closed.')
+
+
+class SQLLiteAlertIndex(object):
+    """
+    Bounded per-VDC index of alert ids that are already known so they can be skipped without touching the database
+    """
+    def __init__(self, logger, capacity):
+        self.logger = logger
+        self.capacity = capacity
+        self.vdcs = {}
+        self.lock = threading.Lock()
+
+    def warm(self, sqllite_db):
+        """
+        Loads the alert ids already stored in the extracted alerts table.  Rows are read oldest first so that
+        the most recent alerts of each VDC are the ones kept when a VDC holds more alerts than the capacity.
+        """
+        count = 0
+        for row in sqllite_db.execute(""" SELECT vdc, alertId FROM ecsalerts ORDER BY id; """):
+            self.add(row[0], [row[1]])
+            count += 1
+
+        self.logger.info(MODULE_NAME + '::warm()::Loaded ' + str(count) + ' known alert ids for ' +
+                         str(len(self.vdcs)) + ' VDCs.')
+
+    def contains(self, vdc, alert_id):
+        """
+        Returns True if the alert id is known for the VDC
+        """
+        with self.lock:
+            alert_ids = self.vdcs.get(vdc)
+            if alert_ids is None or alert_id not in alert_ids:
+                return False
+
+            alert_ids.move_to_end(alert_id)
+            return True
+
+    def add(self, vdc, alert_ids):
+        """
+        Records alert ids as known for the VDC evicting the least recently seen ones past the capacity
+        """
+        with self.lock:
+            known = self.vdcs.setdefault(vdc, collections.OrderedDict())
+            for alert_id in alert_ids:
+                known[alert_id] = None
+                known.move_to_end(alert_id)
 
+            while len(known) > self.capacity:
+                known.popitem(last=False)